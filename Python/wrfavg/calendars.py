@@ -0,0 +1,137 @@
+'''
+Created on 2026-10-18
+
+A module providing vectorized calendar arithmetic for WRF timestamps ('YYYY-MM-DD_hh:mm:ss'): timestamps are
+parsed into integer fields and converted to seconds since 1970-01-01 in the model calendar, so that interval
+lengths and leap-day corrections can be computed for entire arrays of timestamps in one operation.
+Supported calendars are the standard (proleptic Gregorian) calendar, a calendar without leap days ('noleap' or
+'365_day', as used by many GCMs) and a calendar with 30-day months ('360_day'); since timestamps in the latter
+are not always valid dates (e.g. February 30), datetime64 is only used for the standard calendar.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import numpy as np
+
+# calendar names (CF conventions) and their aliases
+calendar_aliases = {'standard':'standard', 'gregorian':'standard', 'proleptic_gregorian':'standard',
+                    'noleap':'noleap', '365_day':'noleap', '360_day':'360_day'}
+days_per_year = {'noleap':365, '360_day':360} # fixed-length years
+# days before the beginning of each month in a year without leap days
+days_before_month_365 = np.array([0,31,59,90,120,151,181,212,243,273,304,334])
+# positions of the year, month, day, hour, minute and second fields in a timestamp
+field_positions = ((0,4), (5,7), (8,10), (11,13), (14,16), (17,19))
+timestamp_length = 19
+# weights of the digits of each field, so that timestamps can be parsed with a single matrix product
+field_weights = np.zeros((timestamp_length,len(field_positions)))
+for n,(i,j) in enumerate(field_positions): field_weights[i:j,n] = 10.**np.arange(j-i-1,-1,-1)
+digit_mask = field_weights.any(axis=1) # positions of digits
+
+
+def getCalendar(calendar):
+  ''' return the canonical name of a calendar ('standard', 'noleap' or '360_day'); None is passed through '''
+  if calendar is None: return None
+  try: return calendar_aliases[calendar.lower()]
+  except KeyError: raise ValueError("Unknown calendar: '{}'".format(calendar))
+
+def isLeapYear(years):
+  ''' vectorized version of calendar.isleap (proleptic Gregorian calendar) '''
+  years = np.asarray(years)
+  return ( years % 4 == 0 ) & ( ( years % 100 != 0 ) | ( years % 400 == 0 ) )
+
+def parseTimeStamps(timestamps):
+  ''' parse timestamps (a list of strings, an array of strings or a character array with one timestamp per row)
+      into an integer array with the fields year, month, day, hour, minute and second along the last axis '''
+  if isinstance(timestamps, (list,tuple)): # e.g. a list of timestamp strings (the most common case)
+    chars = np.frombuffer(''.join(timestamps).encode('ascii'), dtype=np.uint8).reshape((len(timestamps),-1))
+  else:
+    timestamps = np.ascontiguousarray(np.ma.getdata(timestamps)) # character arrays from netCDF can be masked
+    if timestamps.dtype.kind == 'S': # one byte per character
+      if timestamps.dtype.itemsize == 1: chars = timestamps.view(np.uint8) # a character array
+      else: chars = timestamps.view(np.uint8).reshape(timestamps.shape+(-1,))
+    elif timestamps.dtype.kind == 'U': # unicode strings (4 bytes per character)
+      chars = timestamps.view(np.uint32).reshape(timestamps.shape+(-1,)).astype(np.uint8)
+    else: raise TypeError("Timestamps have to be strings or characters, not '{}'.".format(timestamps.dtype))
+  if chars.shape[-1] < timestamp_length: raise ValueError("Timestamps are too short: {}".format(chars.shape))
+  digits = chars[...,:timestamp_length] - np.uint8(ord('0')) # N.B.: other characters wrap around to large values
+  if np.any(( digits > 9 ) & digit_mask): raise ValueError("Invalid timestamps: {}".format(chars[:1].tobytes()))
+  return np.rint(np.dot(digits, field_weights)).astype(np.int64) # all fields in one (BLAS) operation
+
+def getDays(fields, calendar='standard'):
+  ''' return the number of days since 1970-01-01 in the given calendar for parsed timestamps (see parseTimeStamps) '''
+  calendar = getCalendar(calendar) or 'standard'
+  years, months, days = fields[...,0], fields[...,1], fields[...,2]
+  if calendar == 'standard':
+    firsts = ( ( years - 1970 ) * 12 + months - 1 ).astype('datetime64[M]').astype('datetime64[D]') # first of the month
+    return firsts.astype(np.int64) + days - 1
+  elif calendar == 'noleap':
+    return ( years - 1970 ) * 365 + days_before_month_365[months-1] + days - 1
+  elif calendar == '360_day':
+    return ( years - 1970 ) * 360 + ( months - 1 ) * 30 + days - 1
+
+def getSeconds(fields, calendar='standard'):
+  ''' return the number of seconds since 1970-01-01 00:00:00 in the given calendar for parsed timestamps '''
+  return getDays(fields, calendar=calendar) * 86400 + fields[...,3] * 3600 + fields[...,4] * 60 + fields[...,5]
+
+def getTimeStamps(seconds, calendar='standard'):
+  ''' convert seconds since 1970-01-01 00:00:00 in the given calendar back to WRF timestamps (strings) '''
+  calendar = getCalendar(calendar) or 'standard'
+  seconds = np.asarray(seconds, dtype=np.int64)
+  if calendar == 'standard':
+    return np.char.replace(np.datetime_as_string(seconds.astype('datetime64[s]'), unit='s'), 'T', '_')
+  days, daysecs = np.divmod(seconds, 86400)
+  years, doy = np.divmod(days, days_per_year[calendar])
+  if calendar == 'noleap':
+    months = np.searchsorted(days_before_month_365, doy, side='right') # 1-based
+    mdays = doy - days_before_month_365[months-1] + 1
+  else: months, mdays = doy // 30 + 1, doy % 30 + 1
+  fields = (years+1970, months, mdays, daysecs // 3600, daysecs % 3600 // 60, daysecs % 60)
+  timestamps = None
+  for field,(i,j) in zip(fields, field_positions):
+    field = np.char.zfill(np.asarray(field).astype('U'), j-i)
+    if timestamps is None: timestamps = field
+    else: timestamps = np.char.add(np.char.add(timestamps, '-' if i < 10 else '_' if i == 11 else ':'), field)
+  return timestamps
+
+def getLeapYears(first, last):
+  ''' return the years with leap days between two parsed timestamps (exclusive; only dates are compared) '''
+  first = tuple(first[:3].tolist()); last = tuple(last[:3].tolist())
+  return [year for year in range(first[0], last[0]+1) if isLeapYear(year) and first < (year,2,29) < last]
+
+def getSkippedLeapDays(fields):
+  ''' count leap days (Gregorian) between the first and the last timestamp that are missing from the timestamps,
+      which indicates that the model does not use leap days (e.g. in a GCM-driven simulation) '''
+  years = getLeapYears(fields[0], fields[-1]) # N.B.: if an end point is a leap day, it is not missing
+  if len(years) == 0: return 0
+  present = fields[( fields[:,1] == 2 ) & ( fields[:,2] == 29 ),0] # years with leap days in the timestamps
+  return len([year for year in years if year not in present])
+
+def getMissingLeapDays(fields, previous=None):
+  ''' return the cumulative number of leap days (Gregorian) that are missing before each of a sequence of parsed
+      timestamps; previous is the last timestamp of a preceding sequence (e.g. the previous input file), so that
+      leap days between sequences are detected as well
+      N.B.: timestamps have to be less than one year apart and a leap day is only missing, if it falls between
+            the dates of two successive timestamps (i.e. at most daily intervals are supported) '''
+  if previous is not None: fields = np.concatenate([np.asarray(previous).reshape((1,-1)), fields], axis=0)
+  dates = fields[:,0] * 10000 + fields[:,1] * 100 + fields[:,2] # comparable integers (YYYYMMDD)
+  leapdays = fields[1:,0] * 10000 + 229 # leap day in the year of each timestamp (if it is a leap year)
+  missing = isLeapYear(fields[1:,0]) & ( dates[:-1] < leapdays ) & ( leapdays < dates[1:] )
+  missing = np.cumsum(missing)
+  return missing if previous is not None else np.concatenate([[0], missing])
+
+def getTimeDelta(timestamps, calendar=None):
+  ''' return the time between the first and the last of a sequence of timestamps in seconds; if no calendar is
+      given, the standard calendar is assumed and leap days that are missing from the timestamps are subtracted
+      (all timestamps are only parsed, if there is a leap day between the end points) '''
+  if isinstance(timestamps, np.ndarray): ends = parseTimeStamps(timestamps[[0,-1]])
+  else: ends = parseTimeStamps([timestamps[0], timestamps[-1]])
+  seconds = getSeconds(ends, calendar=calendar or 'standard')
+  delta = seconds[-1] - seconds[0]
+  if calendar is None and getLeapYears(ends[0], ends[-1]):
+    delta -= 86400 * getSkippedLeapDays(parseTimeStamps(timestamps))
+  return float(delta)
+
+def getTimeDeltas(fields, calendar='standard'):
+  ''' return the interval lengths between successive parsed timestamps in seconds '''
+  return np.diff(getSeconds(fields, calendar=calendar), axis=0)
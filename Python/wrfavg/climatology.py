@@ -0,0 +1,107 @@
+'''
+Created on 2026-10-18
+
+A module providing running statistics of monthly means by calendar month, so that monthly climatologies,
+seasonal and annual means and their standard deviations can be computed while the monthly means are written,
+without re-reading the monthly output file. Seasonal and annual statistics are pooled from the calendar months
+(i.e. the standard deviation is that of all monthly means in a season or year).
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os
+import numpy as np
+from collections import OrderedDict
+import netCDF4 as nc
+# my own netcdf stuff
+from utils.nctools import add_coord, copy_dims, copy_ncatts, copy_vars
+
+# seasons (calendar months) and periods of the output files
+seasons = OrderedDict([('DJF',(12,1,2)), ('MAM',(3,4,5)), ('JJA',(6,7,8)), ('SON',(9,10,11))])
+periods = OrderedDict([('clim',[(month,) for month in range(1,13)]), ('seasonal',list(seasons.values())),
+                       ('annual',[tuple(range(1,13))])]) # groups of calendar months for each record
+std_suffix = '_std' # suffix of standard deviation variables
+
+
+class Climatology(object):
+  '''
+    Running sums, counts and sums of squares of monthly means by calendar month (double precision); memory use
+    is 24 times the size of a monthly field for each variable.
+  '''
+
+  def __init__(self):
+    ''' Initialize empty accumulators; accumulators of a variable are allocated with the first record. '''
+    self.sums = dict() # variable -> array of sums (first axis: calendar month)
+    self.sqsums = dict() # variable -> array of sums of squares
+    self.counts = dict() # variable -> number of records by calendar month
+    self.records = dict() # variable -> set of monthly records that were added (to avoid duplicates)
+
+  def __contains__(self, varname):
+    return varname in self.sums
+
+  def add(self, varname, month, data, record=None):
+    ''' add a monthly mean of a calendar month (1-12); masked values are treated as NaN (missing in the result);
+        record is the index of the month in the monthly file (if given, a record is only added once) '''
+    if record is not None:
+      if record in self.records.setdefault(varname,set()): return False
+      self.records[varname].add(record)
+    data = np.ma.filled(np.ma.asarray(data, dtype=np.float64), np.NaN)
+    if varname not in self.sums:
+      self.sums[varname] = np.zeros((12,)+data.shape, dtype=np.float64)
+      self.sqsums[varname] = np.zeros((12,)+data.shape, dtype=np.float64)
+      self.counts[varname] = np.zeros(12, dtype=np.int64)
+    m = month - 1
+    self.sums[varname][m] += data
+    self.sqsums[varname][m] += data**2
+    self.counts[varname][m] += 1
+    return True
+
+  def statistics(self, varname, months):
+    ''' return the mean and standard deviation (None, if there are less than two records) of a group of
+        calendar months, e.g. a season '''
+    idx = [month-1 for month in months]
+    n = self.counts[varname][idx].sum()
+    if n == 0: return None, None
+    s = self.sums[varname][idx].sum(axis=0); sq = self.sqsums[varname][idx].sum(axis=0)
+    mean = s / n
+    if n < 2: return mean, None
+    var = ( sq - s * mean ) / ( n - 1 ) # sample variance
+    return mean, np.sqrt(np.maximum(var, 0.)) # N.B.: round-off can cause small negative values
+
+  def writeFile(self, filepath, period, dataset, varlist=None, description=None):
+    ''' write statistics of a period ('clim', 'seasonal' or 'annual') to a new netCDF file; dimensions,
+        time-independent variables, attributes and variable attributes are copied from the monthly dataset '''
+    groups = periods[period]
+    varlist = [varname for varname in (varlist or self.sums.keys()) if varname in self.sums]
+    tmpfilepath = filepath + '.tmp'
+    dst = nc.Dataset(tmpfilepath, 'w', format='NETCDF4')
+    try:
+      # time axis: calendar month, season or a single record
+      if period == 'clim': atts = dict(units='month of the year')
+      elif period == 'seasonal': atts = dict(units='season', seasons=' '.join(seasons.keys()))
+      else: atts = dict(units='year')
+      add_coord(dst, 'time', data=np.arange(1,len(groups)+1), length=len(groups), dtype='i4', atts=atts)
+      dimlist = [dim for dim in dataset.dimensions.keys() if dim != 'time']
+      copy_dims(dst, dataset, dimlist=dimlist, copy_coords=False)
+      timeless = [varname for varname,var in dataset.variables.items() if 'time' not in var.dimensions]
+      if timeless: copy_vars(dst, dataset, varlist=timeless, copy_data=True)
+      # create mean and standard deviation variables
+      for varname in varlist:
+        var = dataset.variables[varname]
+        atts = {att:var.getncattr(att) for att in var.ncattrs() if att not in ('_FillValue','missing_value')}
+        for name,suffix in ((varname,''), (varname+std_suffix,std_suffix)):
+          ncvar = dst.createVariable(name, 'f4', var.dimensions, zlib=True, fill_value=np.float32(np.NaN))
+          ncvar.setncatts(atts)
+          if suffix: ncvar.long_name = 'standard deviation of ' + atts.get('long_name',varname)
+          ncvar.cell_methods = 'time: {:s}'.format('standard_deviation' if suffix else 'mean')
+        for n,months in enumerate(groups):
+          mean, std = self.statistics(varname, months)
+          if mean is not None: dst.variables[varname][n] = mean
+          if std is not None: dst.variables[varname+std_suffix][n] = std
+      # global attributes
+      copy_ncatts(dst, dataset, prefix='')
+      if description is not None: dst.description = description
+    finally:
+      dst.close()
+    os.replace(tmpfilepath, filepath)
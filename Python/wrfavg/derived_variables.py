@@ -13,13 +13,16 @@ points during the averaging process.
 import netCDF4 as nc
 import numpy as np
 from scipy.integrate import simps # Simpson rule for integration
-import calendar
-from datetime import datetime
+import threading, heapq
+from collections import OrderedDict
+from concurrent.futures import wait, FIRST_COMPLETED
 from numexpr import evaluate, set_num_threads, set_vml_num_threads
-# numexpr parallelisation: don't parallelize at this point!
+# numexpr parallelisation: serial by default; the caller can change this with setNumThreads
 set_num_threads(1); set_vml_num_threads(1)
 # my own netcdf stuff
 from utils.nctools import add_var
+# vectorized calendar arithmetic for timestamps
+import wrfavg.calendars as calendars
 
 # days per month without leap days (duplicate from datasets.common)
 days_per_month_365 = np.array([31,28,31,30,31,30,31,31,30,31,30,31])
@@ -29,6 +32,12 @@ dtype_float = dv_float # general floating point precision used for temporary arr
 # dryday_threshold = 0.2/86400. # precip treshold for a dry day 0.2 mm/day
 
 
+def setNumThreads(nthreads=1):
+  ''' set the number of threads used by numexpr (and the VML, if available); returns the previous setting '''
+  nthreads = max(1,int(nthreads))
+  set_vml_num_threads(nthreads)
+  return set_num_threads(nthreads)
+
 def getTimeStamp(dataset, idx, timestamp_var='Times'):
   ''' read a timestamp and convert to pandas-readable format '''
   # read timestamp
@@ -39,8 +48,17 @@ def getTimeStamp(dataset, idx, timestamp_var='Times'):
   timestamp = ' '.join(timestamp)
   return timestamp
 
-def calcTimeDelta(timestamps, year=None, month=None):
-  ''' function to calculate time deltas and subtract leap-days, if necessary '''
+def getTimeIndex(dataset, timestamp_var='Times'):
+  ''' read all timestamps of a file in one operation and parse them into a datetime64 index;
+      returns the character array, the timestamp strings and the index '''
+  chars = dataset.variables[timestamp_var][:] # a single read for the entire file
+  timestamps = nc.chartostring(chars) # array of strings, e.g. '1979-01-01_00:00:00'
+  index = np.array(np.char.replace(timestamps, '_', 'T'), dtype='datetime64[s]')
+  # N.B.: the index can be searched with np.searchsorted, since timestamps are monotonic within a file
+  return chars, timestamps, index
+
+def calcTimeDelta(timestamps, year=None, month=None, calendar=None):
+  ''' function to calculate time deltas and subtract leap-days, if necessary (see calendars.getTimeDelta) '''
   # check dates
   y1, m1, d1 = tuple( int(i) for i in timestamps[0][:10].split('-') )
   y2, m2, d2 = tuple( int(i) for i in timestamps[-1][:10].split('-') )
@@ -51,34 +69,8 @@ def calcTimeDelta(timestamps, year=None, month=None):
   if month is None: month = m1
   else: assert month == m1
   assert  ( month == m2 or np.mod(month,12)+1 == m2 )
-  # determine interval
-  dt1 = datetime.strptime(timestamps[0], '%Y-%m-%d_%H:%M:%S')
-  dt2 = datetime.strptime(timestamps[-1], '%Y-%m-%d_%H:%M:%S')
-  delta = float( (dt2-dt1).total_seconds() ) # the difference creates a timedelta object
-  n = len(timestamps)
-  # check if leap-day is present
-  if month == 2 and calendar.isleap(year):
-    ld = datetime(year, 2, 29) # datetime of leap day
-    # whether to subtract the leap day
-    if ( d1 == 29 or  d2 == 29 ):
-      lsubld = False  # trivial case; will be handled correctly by datetime
-    elif dt1 < ld < dt2:
-      # a leap day should be there; if not, then subtract it
-      ild = int( ( n - 1 ) * float( ( ld - dt1 ).total_seconds() ) / delta ) # index of leap-day
-      lsubld = True # subtract, unless leap day is found, sicne it should be there
-      # search through timestamps for leap day
-      while lsubld and ild < n:
-        yy, mm, dd = tuple( int(i) for i in timestamps[ild][:10].split('-') )
-        if mm == 3: break
-        assert yy == year and mm == 2
-        # check if a leap day is present (if, then don't subtract)
-        if dd == 29: lsubld = False
-        ild += 1 # increment leap day search
-    else:
-      lsubld = False # no leap day in itnerval, no need to correct period
-    if lsubld: delta -= 86400. # subtract leap day from period
-  # return leap-day-checked period
-  return delta
+  # determine interval (vectorized); without a calendar, missing leap days are subtracted
+  return calendars.getTimeDelta(timestamps, calendar=calendar)
 
 
 def ctrDiff(data, axis=0, delta=1):
@@ -111,31 +103,42 @@ def ctrDiff(data, axis=0, delta=1):
   return outdata
 
 
-def pressureIntegral(var, T, p, RMg):
-  ''' helper routine to compute mass-weighted vertical integrals
-      (currently only works on pressure levels) '''
-  # allocate extended array with boundary points
+# cache of Simpson weights for pressure integrals (keyed by pressure levels, which do not change within a run)
+simpson_weights = dict()
+
+def getSimpsonWeights(plev):
+  ''' helper routine to compute (or look up) the weights of the Simpson rule along a pressure axis that is padded
+      with zero-boundaries at 1000 hPa and 0 hPa; only the weights of the actual levels are returned '''
+  key = tuple(plev)
+  if key not in simpson_weights:
+    # make extended plev axis
+    pax = np.zeros((len(plev)+2,), dtype=dv_float)
+    pax[1:-1] = plev; pax[0] = 1.e5; pax[-1] = 0. # pad with zero-boundaries
+    pax = -1 * pax # invert, since we are integrating in the wrong direction
+    # N.B.: the Simpson rule is linear, so the weight of each level is the integral of a unit vector
+    weights = simps(np.eye(len(pax), dtype=dv_float), pax, axis=1, even='first') # even intervals anyway...
+    simpson_weights[key] = weights[1:-1].astype(dv_float) # first and last are boundaries (zero)
+  return simpson_weights[key]
+
+def pressureWeights(T, p, RMg):
+  ''' helper routine to compute the weights of mass-weighted vertical integrals: Simpson rule times mass per
+      pressure level (RMg * T / p); missing values/NaN are masked, i.e. they have zero weight '''
   # make sure dimensions fit (pressure is the second dimension)
   assert T.ndim == 4 and p.ndim == 2
   assert T.shape[:2] == p.shape # tuple comparison doesn't require all()
-  # make temporary array (first and last plev are just zero: boundary conditions)
-  tmpshape = list(T.shape)
-  tmpshape[1] += 2 # add two levels (integral boundaries)
-  tmpdata = np.zeros(tmpshape, dtype=dv_float)
-  # make extended plev axis
   assert np.all( np.diff(p[0,:]) < 0 ), 'The pressure axis has to decrease monotonically'
-  pax = np.zeros((tmpshape[1],), dtype=dv_float)
-  pax[1:-1] = p[0,:]; pax[0] = 1.e5; pax[-1] = 0. # pad with zero-boundaries
-  pax = -1 * pax # invert, since we are integrating in the wrong direction
-  # compute pressure/mass-weighted flux at each (non-boundary) level
+  w = getSimpsonWeights(p[0,:]).reshape((1,p.shape[1],1,1)) # Simpson rule, precomputed for the pressure levels
   p = p.reshape(p.shape+(1,1)) # extend singleton dimensions
-  # fill missing values/NaN with zeros to allow integration
-  var = np.nan_to_num(var); T = np.nan_to_num(T)
-  # compute mass-weighted variable
-  tmpdata[:,1:-1,:] = evaluate('RMg * var * T / p') # first and last are zero
-  # integrate using Simpson rule
-  outdata = simps(tmpdata, pax, axis=1, even='first') # even intervals anyway...
   # N.B.: outer dimensions (i.e. the first and second) are broadcast automatically, which is what we want here
+  return evaluate('where(T == T, RMg * w * T / p, 0)')
+
+def pressureIntegral(var, T, p, RMg, weights=None):
+  ''' helper routine to compute mass-weighted vertical integrals
+      (currently only works on pressure levels); weights can be precomputed with pressureWeights '''
+  if weights is None: weights = pressureWeights(T, p, RMg)
+  # integrate as a weighted sum over levels; missing values/NaN do not contribute to the integral
+  tmpdata = evaluate('where(var == var, var * weights, 0)')
+  outdata = tmpdata.sum(axis=1)
   return outdata
 
 
@@ -145,8 +148,353 @@ class DerivedVariableError(Exception):
   pass
 
 
-# N.B.: this could have been implemented much more efficiently, without the need for separate classes,
-#       using a numexpr string and the variable dicts to define the computation
+# accumulator for the aggregation of derived variables
+class Aggregator(object):
+  '''
+    A preallocated accumulator for the aggregation of values over a period (i.e. a month); values are
+    accumulated in-place with double precision and masks are tracked separately, so that no arrays have
+    to be allocated during aggregation. The mode is one of 'sum', 'max', 'min', or 'mean' (a sum that is
+    normalized by the number of aggregated records, rather than the number of time steps).
+    Values can also be aggregated into a sub-region (index), e.g. when the domain is processed in tiles.
+  '''
+
+  def __init__(self, shape, mode='sum', ignoreNaN=False):
+    ''' Allocate accumulator (and buffer for partial sums). '''
+    if mode not in ('sum','max','min','mean'): raise ValueError("Invalid aggregation mode: '{}'".format(mode))
+    self.mode = mode
+    self.ignoreNaN = ignoreNaN # use NaN-safe aggregation
+    self.data = np.zeros(shape, dtype=np.float64) # accumulator
+    self.buffer = np.zeros(shape, dtype=np.float64) if mode in ('sum','mean') else None # partial sums
+    self.count = 0 # number of aggregated records (only used for means)
+    self.mask = None # only allocated, when masked values are encountered
+    self.empty = True # nothing aggregated yet (extrema are initialized with the first values)
+    self.filled = None # regions that were aggregated (only allocated, when sub-regions are aggregated)
+
+  def reset(self):
+    ''' Reset accumulator for next period (without reallocation). '''
+    self.data.fill(0.); self.empty = True; self.count = 0
+    if self.mask is not None: self.mask.fill(False)
+    if self.filled is not None: self.filled.fill(False)
+
+  def aggregate(self, comdata, aggax=0, index=None):
+    ''' Aggregate new values in-place; sums are reduced along the aggregation axis, extrema are already reduced;
+        index is a tuple of slices that defines the sub-region the values are aggregated into (default: all). '''
+    if comdata is None or comdata.size == 0: return # record was not long enough to compute this variable
+    if index is None: data = self.data; buffer = self.buffer; empty = self.empty
+    else:
+      if self.mode == 'mean': raise NotImplementedError("Means can not be aggregated in sub-regions.")
+      data = self.data[index] # a view, since index only contains slices
+      buffer = None if self.buffer is None else self.buffer[index]
+      if self.filled is None: self.filled = np.zeros(self.data.shape, dtype=np.bool_)
+      empty = not self.filled[index].any() # sub-regions are always aggregated in the same partition
+    # track masks separately
+    if isinstance(comdata,np.ma.MaskedArray):
+      mask = np.ma.getmask(comdata)
+      if mask is not np.ma.nomask and mask.any():
+        if self.buffer is not None: mask = mask.all(axis=aggax) # sums are only masked, if all values are masked
+        if self.mask is None: self.mask = np.zeros(self.data.shape, dtype=np.bool_)
+        if index is None: np.logical_or(self.mask, mask, out=self.mask)
+        else: np.logical_or(self.mask[index], mask, out=self.mask[index])
+      comdata = comdata.filled(0) if self.buffer is not None else comdata.data
+    # aggregate in-place
+    if buffer is not None:
+      if self.ignoreNaN: np.nansum(comdata, axis=aggax, dtype=np.float64, out=buffer) # ignore NaN's
+      else: np.sum(comdata, axis=aggax, dtype=np.float64, out=buffer)
+      np.add(data, buffer, out=data)
+      self.count += comdata.shape[aggax]
+    elif empty: np.copyto(data, comdata) # initialize extrema with first values
+    elif self.mode == 'max':
+      if self.ignoreNaN: np.fmax(data, comdata, out=data)
+      else: np.maximum(data, comdata, out=data) # aggregate maxima
+    elif self.mode == 'min':
+      if self.ignoreNaN: np.fmin(data, comdata, out=data)
+      else: np.minimum(data, comdata, out=data) # aggregate minima
+    self.empty = False
+    if index is not None: self.filled[index] = True
+
+  def add(self, partial, index=None):
+    ''' Add partial sums that were already reduced along the aggregation axis (see DerivedVariable.reduceValues). '''
+    if self.mode != 'sum': raise NotImplementedError("Partial sums can only be added in 'sum' mode.")
+    if index is None: np.add(self.data, partial, out=self.data)
+    else: np.add(self.data[index], partial, out=self.data[index])
+    self.empty = False
+
+  def result(self, norm=None):
+    ''' Return aggregated values as a new array (normalized, if norm is given), masked, if necessary. '''
+    if self.mode == 'mean': norm = self.count or np.NaN # normalize by number of records
+    if norm is None: data = self.data.copy()
+    else: data = self.data / norm
+    if self.mask is not None and self.mask.any(): data = np.ma.array(data, mask=self.mask.copy())
+    return data
+
+
+class MomentAggregator(Aggregator):
+  '''
+    An accumulator for the variance of a variable (mode 'var') or the covariance of two variables (mode 'cov')
+    over all aggregated records; batches of records (e.g. the records of an input file) are merged with the
+    numerically stable update of Chan et al., a generalization of Welford's algorithm, using double precision
+    means and co-moments. The two variables of a covariance are passed with a trailing axis of length 2.
+    Missing (masked) values are treated as NaN, so that the result is missing as well.
+  '''
+
+  def __init__(self, shape, mode='var', ignoreNaN=False):
+    ''' Allocate co-moments, means and record counts (the count can differ between sub-regions). '''
+    if mode not in ('var','cov'): raise ValueError("Invalid aggregation mode: '{}'".format(mode))
+    if ignoreNaN: raise NotImplementedError("Variances can not ignore NaN's.")
+    super(MomentAggregator,self).__init__(shape, mode='max') # no buffer for partial sums
+    self.mode = mode
+    self.mean = np.zeros(tuple(shape)+((2,) if mode == 'cov' else ()), dtype=np.float64) # running means
+    self.counts = np.zeros(shape, dtype=np.float64) # number of records
+
+  def reset(self):
+    ''' Reset accumulator for next period (without reallocation). '''
+    super(MomentAggregator,self).reset()
+    self.mean.fill(0.); self.counts.fill(0.)
+
+  def aggregate(self, comdata, aggax=0, index=None):
+    ''' Merge the moments of a batch of records (along the aggregation axis) into the accumulator in-place;
+        index is a tuple of slices that defines the sub-region the values are aggregated into (default: all). '''
+    if comdata is None or comdata.size == 0: return # record was not long enough to compute this variable
+    if index is None: data = self.data; mean = self.mean; counts = self.counts
+    else: data = self.data[index]; mean = self.mean[index]; counts = self.counts[index] # views
+    if isinstance(comdata,np.ma.MaskedArray): comdata = comdata.filled(np.NaN)
+    k = comdata.shape[aggax] # number of records in batch
+    bmean = np.mean(comdata, axis=aggax, dtype=np.float64) # batch mean
+    dev = comdata - np.expand_dims(bmean, aggax) # deviations from batch mean
+    delta = bmean - mean # difference between batch mean and running mean
+    weight = counts * k / ( counts + k ) # weight of the correction term
+    if self.mode == 'var':
+      np.add(data, np.sum(dev**2, axis=aggax) + delta**2 * weight, out=data)
+      np.add(mean, delta * ( k / ( counts + k ) ), out=mean)
+    else:
+      np.add(data, np.sum(dev[...,0]*dev[...,1], axis=aggax) + delta[...,0]*delta[...,1] * weight, out=data)
+      np.add(mean, delta * np.expand_dims( k / ( counts + k ), -1), out=mean)
+    np.add(counts, k, out=counts)
+    self.empty = False
+
+  def add(self, partial, index=None):
+    raise NotImplementedError("Partial sums can not be added to variances.")
+
+  def result(self, norm=None):
+    ''' Return the (population) variance or covariance as a new array (norm is ignored). '''
+    with np.errstate(invalid='ignore', divide='ignore'): data = self.data / self.counts # NaN, where there are no records
+    return data
+
+
+# streaming resampling of time step data for (sub-)daily output
+class Resampler(object):
+  '''
+    Resamples time step values to a coarser output interval (e.g. daily or 3-hourly) in a streaming fashion:
+    records are binned by interval (counted from origin), complete intervals are returned and incomplete
+    intervals are carried over to the next segment (e.g. the next input file). The reduction of a variable is
+    one of 'mean', 'min', 'max' or 'sum' (the time integral, i.e. the sum of values times the time step; this is
+    appropriate for fluxes that are derived from accumulated variables).
+  '''
+
+  def __init__(self, interval, origin, reductions=None):
+    ''' Interval is the output interval in seconds and origin the beginning of the first interval. '''
+    self.interval = np.timedelta64(int(interval),'s')
+    self.origin = np.datetime64(origin, 's')
+    self.reductions = dict() if reductions is None else reductions # default: 'mean'
+    self.aggregators = dict() # one accumulator per variable (allocated with the first values)
+    self.bins = None # interval of each record of the current segment
+    self.complete = [] # intervals that are complete after the current segment
+    self.pending = None # interval that is carried over to the next segment
+
+  def getIntervals(self, timestamps):
+    ''' return the interval index of timestamps (datetime64) '''
+    return ( np.asarray(timestamps, dtype='datetime64[s]') - self.origin ) // self.interval
+
+  def getStart(self, intervals):
+    ''' return the beginning of intervals as datetime64 '''
+    return self.origin + np.asarray(intervals, dtype=np.int64) * self.interval
+
+  def advance(self, timestamps, nextstamp):
+    ''' begin a new segment with records at timestamps; nextstamp is the first record after the segment, which
+        determines, which intervals are complete; returns the indices of complete intervals '''
+    self.bins = self.getIntervals(timestamps)
+    nextbin = int(self.getIntervals(nextstamp))
+    intervals = set(self.bins.tolist())
+    if self.pending is not None: intervals.add(self.pending)
+    self.complete = sorted(interval for interval in intervals if interval < nextbin)
+    pending = [interval for interval in intervals if interval >= nextbin]
+    assert len(pending) <= 1, pending # the next record can only be in the last interval or after it
+    self.pending = pending[0] if pending else None
+    return self.complete
+
+  def resample(self, varname, values, aggax=0, delta=None):
+    ''' aggregate the values of the current segment and return the values of complete intervals (stacked along
+        the first axis); delta is the time step in seconds (only used for sums); None, if no interval is complete '''
+    reduction = self.reductions.get(varname,'mean')
+    if reduction not in ('mean','min','max','sum'): raise ValueError("Invalid reduction: '{}'".format(reduction))
+    agg = self.aggregators.get(varname)
+    if agg is None:
+      shape = values.shape[:aggax] + values.shape[aggax+1:] # no time axis
+      agg = self.aggregators[varname] = Aggregator(shape, mode=reduction)
+    results = []
+    intervals = self.complete if self.pending is None else self.complete + [self.pending]
+    for interval in intervals:
+      idx = np.flatnonzero(self.bins == interval) # records are contiguous, since timestamps are monotonic
+      if len(idx) > 0:
+        tmp = values[(slice(None),)*aggax + (slice(idx[0],idx[-1]+1),)] # a view
+        if reduction == 'sum': agg.aggregate(tmp*delta, aggax=aggax)
+        elif reduction == 'min': agg.aggregate(tmp.min(axis=aggax))
+        elif reduction == 'max': agg.aggregate(tmp.max(axis=aggax))
+        else: agg.aggregate(tmp, aggax=aggax) # mean
+      if interval != self.pending:
+        results.append(agg.result()); agg.reset()
+    if len(results) == 0: return None
+    elif any(isinstance(result,np.ma.MaskedArray) for result in results): return np.ma.stack(results)
+    else: return np.stack(results)
+
+
+# memo cache for intermediate results that are shared between derived variables
+class IntermediateCache(object):
+  '''
+    A memo cache for intermediate results (e.g. gradients of constant fields or mass weights on pressure levels)
+    that are shared between derived variables. Entries have explicit keys and a lifetime: 'step' entries are
+    only valid for the current input record (or tile), 'month' entries for the current month, and 'run' entries
+    for the whole run. The memory of cached arrays is capped and the least recently used entries are evicted.
+  '''
+  lifetimes = ('step','month','run') # in order of duration
+
+  def __init__(self, maxsize=None):
+    ''' Initialize an empty cache; maxsize is the memory cap in bytes (None means no limit). '''
+    self.maxsize = maxsize
+    self.entries = OrderedDict() # (scope, key) -> (value, lifetime, nbytes); in order of last use
+    self.nbytes = 0 # memory of all cached values
+    self.scope = None # e.g. the current tile; part of every key, since intermediates depend on it
+    self.lock = threading.Lock() # derived variables may be computed in threads
+    self.keylocks = dict() # prevents threads from computing the same entry twice
+    self.hits = 0; self.misses = 0 # statistics
+
+  def get(self, key, compute, lifetime='step'):
+    ''' Return the cached value for key or compute it (compute is a function without arguments) and cache it. '''
+    if lifetime not in self.lifetimes: raise ValueError("Invalid lifetime: '{}'".format(lifetime))
+    key = (self.scope, key)
+    with self.lock: keylock = self.keylocks.setdefault(key, threading.Lock())
+    with keylock:
+      with self.lock:
+        if key in self.entries:
+          self.entries.move_to_end(key); self.hits += 1
+          return self.entries[key][0]
+      value = compute() # outside of the global lock, so that other entries are not blocked
+      with self.lock:
+        self.misses += 1; self.store(key, value, lifetime)
+    return value
+
+  def store(self, key, value, lifetime):
+    ''' Add an entry and evict least recently used entries, if the memory cap is exceeded (requires lock). '''
+    nbytes = getattr(value, 'nbytes', 0)
+    if self.maxsize is not None and nbytes > self.maxsize: return # too large to cache
+    while self.maxsize is not None and self.nbytes + nbytes > self.maxsize:
+      self.nbytes -= self.entries.popitem(last=False)[1][2] # evict least recently used
+    self.entries[key] = (value, lifetime, nbytes); self.nbytes += nbytes
+
+  def expire(self, lifetime):
+    ''' Remove all entries with this or a shorter lifetime (e.g. 'month' also removes 'step' entries). '''
+    expired = self.lifetimes[:self.lifetimes.index(lifetime)+1]
+    with self.lock:
+      for key in [key for key,entry in self.entries.items() if entry[1] in expired]:
+        self.nbytes -= self.entries.pop(key)[2]
+      self.keylocks = dict() # only needed while entries are computed
+
+
+# dependency resolution and scheduling of derived variables
+class DependencyGraph(object):
+  '''
+    A directed acyclic graph of derived variables, built from their prerequisites (prerequisites that are not
+    derived variables are inputs). Variables are sorted topologically, so that they can be defined in any
+    order, and the graph can be pruned to the variables that are required for a set of targets. Tasks (groups
+    of variables) can be executed as soon as the tasks they depend on are finished, so that independent
+    branches of the graph can be computed concurrently.
+  '''
+
+  def __init__(self, devars):
+    ''' Build the graph from an iterable of derived variables. '''
+    self.devars = OrderedDict((devar.name,devar) for devar in devars)
+    self.parents = OrderedDict() # derived variables that a variable depends on directly
+    self.children = OrderedDict((name,[]) for name in self.devars) # variables that depend on a variable
+    for name,devar in self.devars.items():
+      self.parents[name] = [pq for pq in OrderedDict.fromkeys(devar.prerequisites) if pq in self.devars]
+      for pq in self.parents[name]: self.children[pq].append(name)
+    self.order = self.sort()
+
+  def sort(self):
+    ''' Return all variables in topological order (Kahn's algorithm); ties are resolved in order of
+        definition, so that the order is reproducible and does not change, if it was already correct. '''
+    rank = {name:n for n,name in enumerate(self.devars)}
+    indegree = {name:len(parents) for name,parents in self.parents.items()}
+    ready = [rank[name] for name,nin in indegree.items() if nin == 0]; heapq.heapify(ready)
+    names = list(self.devars.keys()); order = []
+    while ready:
+      name = names[heapq.heappop(ready)]; order.append(name)
+      for child in self.children[name]:
+        indegree[child] -= 1
+        if indegree[child] == 0: heapq.heappush(ready, rank[child])
+    if len(order) < len(names):
+      cycle = [name for name in names if indegree[name] > 0]
+      raise DerivedVariableError("Circular dependency between derived variables: {}".format(', '.join(cycle)))
+    return order
+
+  def ancestors(self, targets):
+    ''' Return the set of derived variables that are required to compute the targets (including targets). '''
+    required = set(); stack = [name for name in targets if name in self.devars]
+    while stack:
+      name = stack.pop()
+      if name not in required:
+        required.add(name); stack.extend(self.parents[name])
+    return required
+
+  def inputs(self, names):
+    ''' Return the set of prerequisites of the given variables that are not derived variables. '''
+    return set(pq for name in names for pq in self.devars[name].prerequisites if pq not in self.devars)
+
+  def prune(self, targets):
+    ''' Return the variables required for the targets in topological order (dead branches are removed). '''
+    required = self.ancestors(targets)
+    return [name for name in self.order if name in required]
+
+  def propagateNonLinear(self):
+    ''' Mark all dependencies of non-linear variables as non-linear (in reverse topological order, a single
+        pass is sufficient), since they have to be available at every time step. '''
+    for name in reversed(self.order):
+      if not self.devars[name].linear:
+        for pq in self.parents[name]: self.devars[pq].linear = False
+
+  def depth(self, names=None):
+    ''' Return the length of the longest dependency chain leading to each variable (0 means no dependencies). '''
+    names = self.order if names is None else [name for name in self.order if name in names]
+    depth = dict()
+    for name in names:
+      depth[name] = max([depth[pq]+1 for pq in self.parents[name] if pq in depth] or [0])
+    return depth
+
+  def schedule(self, tasks, func, pool=None):
+    ''' Execute func for every task (a tuple of variable names, in topological order) and yield the tasks
+        together with the results, as they become available. Without a thread pool, tasks are executed in order;
+        with a pool, tasks are submitted as soon as all tasks they depend on have been yielded (i.e. processed
+        by the caller), so that independent branches run concurrently. Results are yielded in the calling thread. '''
+    if pool is None:
+      for task in tasks: yield task, func(task)
+      return
+    owner = {name:task for task in tasks for name in task}
+    waiting = OrderedDict((task,set(owner[pq] for name in task for pq in self.parents[name] if pq in owner) - {task})
+                          for task in tasks)
+    finished = set(); pending = dict() # futures of running tasks
+    while waiting or pending:
+      for task in [task for task,deps in waiting.items() if deps <= finished]:
+        del waiting[task]; pending[pool.submit(func, task)] = task
+      if not pending: raise DerivedVariableError("Unresolvable task dependencies: {}".format(list(waiting.keys())))
+      done = wait(pending, return_when=FIRST_COMPLETED)[0]
+      for future in [future for future in pending if future in done]: # in order of submission
+        task = pending.pop(future)
+        yield task, future.result() # re-raises exceptions from the thread
+        finished.add(task)
+
+
+# N.B.: simple variables that can be expressed as a numexpr string are defined declaratively in the
+#       expression_variables registry below (see ExpressionVariable); the classes are only used for the rest
 
 # derived variable base class
 class DerivedVariable(object):
@@ -169,6 +517,8 @@ class DerivedVariable(object):
     self.checked = False # indicates whether prerequisites were checked
     self.tmpdata = None # handle for temporary storage
     self.carryover = False # carry over temporary storage to next month
+    self.halo = 0 # number of neighbouring points (along south_north) needed for computation, e.g. differences
+    self.cache = None # shared IntermediateCache (assigned by the caller)
     # set NetCDF attributes
     self.axes = axes # dimensions of NetCDF variable
     self.dtype = dtype # data type of NetCDF variable
@@ -209,13 +559,13 @@ class DerivedVariable(object):
     self.checked = check
     return check
 
-  def createVariable(self, target):
-    ''' Create a NetCDF Variable for this variable. '''
+  def createVariable(self, target, **kwargs):
+    ''' Create a NetCDF Variable for this variable; kwargs are passed on (e.g. chunking and compression). '''
     if not isinstance(target, nc.Dataset): raise TypeError
     if not self.checked: # check prerequisites
       raise DerivedVariableError("Prerequisites for variable '%s' are not satisfied."%(self.name))
-    # create netcdf variable; some parameters were omitted: zlib, fillValue
-    ncvar = add_var(target, name=self.name, dims=self.axes, data=None, atts=self.atts, dtype=self.dtype )
+    # create netcdf variable; some parameters were omitted: fillValue
+    ncvar = add_var(target, name=self.name, dims=self.axes, data=None, atts=self.atts, dtype=self.dtype, **kwargs)
     return ncvar
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
@@ -234,6 +584,21 @@ class DerivedVariable(object):
         raise ValueError('The variable \'{:s}\' requires a constants dictionary!'.format(self.name))
     return NotImplemented
 
+  def getIntermediate(self, key, compute, lifetime='step'):
+    ''' Look up an intermediate result that is shared with other variables, or compute it, if there is no cache. '''
+    if self.cache is None: return compute()
+    else: return self.cache.get(key, compute, lifetime=lifetime)
+
+  def getAggregator(self, shape):
+    ''' Create a preallocated accumulator for the aggregation of this variable (default: sum). '''
+    if not self.normalize: raise DerivedVariableError('The default aggregation requires normalization.')
+    return Aggregator(shape, mode='sum', ignoreNaN=self.ignoreNaN)
+
+  def reduceValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Compute values that are already summed over the aggregation axis (without instantaneous values);
+        returns None, if this is not supported, in which case computeValues has to be used. '''
+    return None
+
   def aggregateValues(self, comdata, aggdata=None, aggax=0):
     ''' Compute and aggregate values for non-linear over several input periods/files. '''
     # N.B.: linear variables can go through this chain as well, if it is a pre-requisite for non-linear variable
@@ -254,6 +619,162 @@ class DerivedVariable(object):
     return aggdata
 
 
+## declarative expression variables
+
+# common axes of expression variables
+sfc_axes = ('time','south_north','west_east') # surface/2D fields
+plev_axes = ('time','num_press_levels_stag','south_north','west_east') # fields on pressure levels
+
+# registry of derived variables that can be computed with a single numexpr expression; the keys are the
+# variable names and the values are keyword arguments for ExpressionVariable (units, prerequisites, expression,
+# axes, scalars, constants, linear, atts); the expression uses prerequisite, constant and scalar names
+expression_variables = dict()
+expression_variables['RunOff'] = dict(name='Runoff', units='kg/m^2/s', prerequisites=['SFROFF','UDROFF'],
+                                      expression='SFROFF + UDROFF', linear=True)
+expression_variables['LiquidPrecip'] = dict(units='kg/m^2/s', prerequisites=['RAINNC','RAINC','ACSNOW'],
+                                            expression='RAINNC + RAINC - ACSNOW', linear=True)
+expression_variables['NetWaterFlux'] = dict(units='kg/m^2/s', prerequisites=['LiquidPrecip','SFCEVP','ACSNOM'],
+                                            expression='LiquidPrecip - SFCEVP + ACSNOM', linear=True)
+expression_variables['WaterForcing'] = dict(units='kg/m^2/s', prerequisites=['LiquidPrecip','ACSNOM'],
+                                            expression='LiquidPrecip + ACSNOM', linear=True)
+expression_variables['WaterVapor'] = dict(units='Pa', prerequisites=['Q2','PSFC'], expression='Mratio * Q2 * PSFC',
+                                          scalars=dict(Mratio=28.96 / 18.02)) # g/mol, Molecular mass ratio of dry air over water
+expression_variables['WindSpeed'] = dict(units='m/s', prerequisites=['U10','V10'], expression='sqrt( U10**2 + V10**2 )')
+expression_variables['NetRadiation'] = dict(units='J m-2/s', prerequisites=['ACSWDNB','ACSWUPB','ACLWDNB','ACLWUPB'],
+                                            expression='ACSWDNB - ACSWUPB + ACLWDNB - ACLWUPB') # downward
+expression_variables['NetLWRadiation'] = dict(units='J m-2/s', prerequisites=['ACLWDNB','ACLWUPB'],
+                                              expression='ACLWDNB - ACLWUPB') # downward
+expression_variables['CovOIP'] = dict(name='OIPX', units='', prerequisites=['OrographicIndex','RAIN'],
+                                      expression='OrographicIndex * RAIN') # needed to calculate correlation coefficient
+# N.B.: the Magnus formula uses Celsius and returns hecto-Pascale; mass per volume "density" is based on: pV = m T (R/M)
+expression_variables['WaterDensity'] = dict(units='kg/m^3', prerequisites=['TD_PL','T_PL'], axes=plev_axes,
+                                            expression='MR * 100. * 6.1094 * exp( 17.625 * (TD_PL - 273.15) / (TD_PL - 273.15 + 243.04) ) / T_PL',
+                                            scalars=dict(MR=0.01802 / 8.3144621)) # Mh2o / R; from AMS Glossary
+expression_variables['WaterFlux_U'] = dict(units='kg/m^2/s', prerequisites=['U_PL','WaterDensity'], axes=plev_axes,
+                                           expression='U_PL * WaterDensity') # west-east direction: U
+expression_variables['WaterFlux_V'] = dict(units='kg/m^2/s', prerequisites=['V_PL','WaterDensity'], axes=plev_axes,
+                                           expression='V_PL * WaterDensity') # south-north direction: V
+# N.B.: u * T*cp * rho; rho = p / (R/M * T) => u * p * (cp * M / R); P_PL is broadcast along the horizontal axes
+expression_variables['HeatFlux_U'] = dict(units='J/m^2/s', prerequisites=['U_PL','P_PL'], axes=plev_axes,
+                                          expression='U_PL * P_PL * cpMR', scalars=dict(cpMR=1005.7 * 0.0289644 / 8.3144621))
+expression_variables['HeatFlux_V'] = dict(units='J/m^2/s', prerequisites=['V_PL','P_PL'], axes=plev_axes,
+                                          expression='V_PL * P_PL * cpMR', scalars=dict(cpMR=1005.7 * 0.0289644 / 8.3144621))
+# N.B.: to get the actual variance, the square of the mean has to be subtracted after the final stage of aggregation
+expression_variables['Vorticity_Var'] = dict(units='1/s^2', prerequisites=['Vorticity'], axes=plev_axes,
+                                             expression='Vorticity**2')
+expression_variables['GHT_Var'] = dict(units='m^2', prerequisites=['GHT_PL'], axes=plev_axes, expression='GHT_PL**2')
+# N.B.: the monthly mean of the daily range is linear, if daily extrema are available (see climate_indices for 'DTR')
+expression_variables['DiurnalRange'] = dict(name='DTR', units='K', prerequisites=['T2MAX','T2MIN'],
+                                            expression='T2MAX - T2MIN', linear=True)
+
+
+class ExpressionVariable(DerivedVariable):
+  '''
+    DerivedVariable child that computes values from a numexpr expression; the definition can be passed as
+    arguments or looked up in the expression_variables registry by name (arguments override registry values).
+  '''
+
+  def __init__(self, name, expression=None, units=None, prerequisites=None, constants=None, scalars=None,
+               axes=None, dtype=dv_float, atts=None, linear=False, ignoreNaN=False):
+    ''' Initialize from the registry and/or arguments; scalars is a dictionary of named scalar constants. '''
+    definition = dict(expression_variables.get(name,dict())) # copy, so that the registry is not modified
+    if expression is not None: definition['expression'] = expression
+    if units is not None: definition['units'] = units
+    if prerequisites is not None: definition['prerequisites'] = prerequisites
+    if constants is not None: definition['constants'] = constants
+    if scalars is not None: definition['scalars'] = scalars
+    if axes is not None: definition['axes'] = axes
+    if linear: definition['linear'] = linear
+    if 'expression' not in definition:
+      raise DerivedVariableError("No expression defined for variable '{:s}'.".format(name))
+    super(ExpressionVariable,self).__init__(name=definition.get('name',name), units=definition['units'],
+                                            prerequisites=list(definition['prerequisites']),
+                                            constants=definition.get('constants',None),
+                                            axes=definition.get('axes',sfc_axes), dtype=dtype,
+                                            atts=atts or definition.get('atts',None),
+                                            linear=definition.get('linear',False), ignoreNaN=ignoreNaN)
+    self.expression = definition['expression']
+    # N.B.: it is necessary to enforce the type of scalars, otherwise numexpr casts everything as doubles
+    self.scalars = {key:np.asarray(value, dtype=dv_float) for key,value in definition.get('scalars',dict()).items()}
+
+  def getNamespace(self, indata, const=None):
+    ''' Assemble the local variables for the expression; returns the namespace and a list of input masks. '''
+    namespace = dict(self.scalars); masks = []
+    names = self.prerequisites + (self.constants or [])
+    for varname in names:
+      if varname in indata: data = indata[varname]
+      else: data = const[varname]
+      if np.ma.isMA(data):
+        if data.mask is not np.ma.nomask: masks.append(data.mask)
+        data = data.data
+      namespace[varname] = np.asarray(data)
+    # N.B.: outer dimensions are broadcast automatically, inner dimensions have to be extended explicitly;
+    #       the number of dimensions is taken from the inputs, since linear variables are computed from
+    #       means, which have no time axis
+    ndim = max([namespace[varname].ndim for varname in self.prerequisites if varname in indata] or [0])
+    for varname in self.prerequisites:
+      data = namespace[varname]
+      if varname in indata and 0 < data.ndim < ndim:
+        namespace[varname] = data.reshape(data.shape+(1,)*(ndim-data.ndim)) # extend singleton dimensions (e.g. pressure levels)
+    return namespace, masks
+
+  def applyMasks(self, outdata, masks):
+    ''' Mask points that are masked in any of the inputs (numexpr does not handle masked arrays). '''
+    if len(masks) > 0:
+      mask = np.zeros(outdata.shape, dtype=np.bool_)
+      for m in masks:
+        if m.ndim < outdata.ndim: m = m.reshape(m.shape+(1,)*(outdata.ndim-m.ndim))
+        mask |= m
+      outdata = np.ma.array(outdata, mask=mask)
+    return outdata
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Evaluate the expression with a single call to numexpr. '''
+    super(ExpressionVariable,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    namespace, masks = self.getNamespace(indata, const=const)
+    outdata = evaluate(self.expression, local_dict=namespace, global_dict=dict())
+    return self.applyMasks(outdata, masks)
+
+
+def evaluateGroup(devars, indata, aggax=0, delta=None, const=None, tmp=None, blocksize=2**20):
+  '''
+    Evaluate a group of ExpressionVariables with shared inputs in one pass over memory: the outer (time) axis
+    is processed in blocks of approximately blocksize bytes and all expressions are evaluated for one block,
+    before moving on to the next, so that the inputs of a block only have to be loaded into cache once.
+    Returns a list of arrays in the order of devars.
+  '''
+  if len(devars) == 0: return []
+  for devar in devars: # perform some type checks
+    if not isinstance(devar, ExpressionVariable): raise TypeError(devar)
+    DerivedVariable.computeValues(devar, indata, aggax=aggax, delta=delta, const=const, tmp=tmp)
+  if len(devars) == 1: return [devars[0].computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp)]
+  namespaces = [devar.getNamespace(indata, const=const) for devar in devars]
+  # determine shapes and the number of records per block (based on the shared inputs)
+  shapes = [np.broadcast_shapes(*[data.shape for data in namespace.values()]) for namespace,masks in namespaces]
+  nrec = shapes[0][0] if len(shapes[0]) > 0 else 0
+  if nrec < 2 or any(len(shape) == 0 or shape[0] != nrec for shape in shapes): # nothing to block
+    return [devar.computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) for devar in devars]
+  inputs = dict() # unique inputs that are blocked along the outer axis
+  for namespace,masks in namespaces:
+    for varname,data in namespace.items():
+      if data.ndim > 1 and data.shape[0] == nrec: inputs[varname] = data
+  recsize = sum(data[0].nbytes for data in inputs.values())
+  nblk = max(1, blocksize // max(1,recsize)) # records per block
+  # evaluate expressions block by block
+  outdata = [None]*len(devars)
+  for i in range(0, nrec, nblk):
+    blk = slice(i,min(i+nblk,nrec))
+    for n,(devar,(namespace,masks)) in enumerate(zip(devars,namespaces)):
+      blkspace = {varname:(data[blk] if varname in inputs else data) for varname,data in namespace.items()}
+      if outdata[n] is None: # first block: infer dtype and allocate output
+        tmpdata = evaluate(devar.expression, local_dict=blkspace, global_dict=dict())
+        outdata[n] = np.empty((nrec,)+tmpdata.shape[1:], dtype=tmpdata.dtype)
+        outdata[n][blk] = tmpdata
+      else: evaluate(devar.expression, local_dict=blkspace, global_dict=dict(), out=outdata[n][blk])
+  # apply masks, if there were any masked inputs
+  return [devar.applyMasks(data, masks) for devar,data,(namespace,masks) in zip(devars,outdata,namespaces)]
+
+
 ## regular derived variables
 
 
@@ -300,8 +821,8 @@ class RainMean(DerivedVariable):
 class TimeOfConvection(DerivedVariable):
   ''' DerivedVariable child implementing computation of total daily precipitation for WRF output. '''
 
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
+  def __init__(self, calendar=None):
+    ''' Initialize with fixed values; the calendar of the model is used to compute model time (default: standard). '''
     super(TimeOfConvection,self).__init__(name='TimeOfConvection', # name of the variable
                               units='s', # units in wrfout are actually minutes
                               prerequisites=['TRAINCVMAX', 'Times'], # it's the sum of these two
@@ -309,6 +830,7 @@ class TimeOfConvection(DerivedVariable):
                               constants=['XLONG'], # local longitudes
                               dtype=dv_float, atts=None, linear=False, ignoreNaN=True)
     self.time_offset = 0 # shift clock 6 hours back, to avoid errors from averaging over midnight
+    self.calendar = calendars.getCalendar(calendar) # timestamps are converted to model time (None: infer leap days)
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute total precipitation as the sum of convective  and non-convective precipitation. '''
@@ -324,13 +846,12 @@ class TimeOfConvection(DerivedVariable):
     else: xlon = const['XLONG_360']
     # save time of simulation start
     if 'TimeOfSimulationStart' not in const:
-      # this is the first time step
-      toss = datetime.strptime(times[0], '%Y-%m-%d_%H:%M:%S')
+      # this is the first time step, unless the simulation start was passed (e.g. for time chunks)
+      simstart = const.get('SimulationStart',times[0])
+      toss = calendars.getSeconds(calendars.parseTimeStamps([simstart]), self.calendar or 'standard')[0] # model time in seconds
       # 0-UTC correction, if ToSS is not 0 UTC
-      if times[0][10:] !='_00:00:00':
-        dtoss = int( (toss - datetime.strptime(times[0][:10], '%Y-%m-%d')).total_seconds() //60 ) # in minutes
-        #raise NotImplementedError, "Simulation has to start at 0 UTC."
-      else: dtoss = 0
+      dtoss = int( toss % 86400 // 60 ) # in minutes
+      #if dtoss != 0: raise NotImplementedError, "Simulation has to start at 0 UTC."
       # apply time offset
       dtoss += self.time_offset
       # save values for later use
@@ -340,11 +861,20 @@ class TimeOfConvection(DerivedVariable):
     else:
       toss = const['TimeOfSimulationStart']
       dtoss = const['DeltaToSS']
-    # compute time delta to ToSS
-    deltas = np.asarray([(datetime.strptime(time, '%Y-%m-%d_%H:%M:%S') - toss).total_seconds()//60 for time in times], dtype='int')
-    deltas = deltas.reshape((len(deltas),1,1)) # add singleton spatial dimensions for broadcasting
+    # compute time delta to ToSS (vectorized, in model time)
+    fields = calendars.parseTimeStamps(times)
+    seconds = calendars.getSeconds(fields, self.calendar or 'standard')
+    if self.calendar is None:
+      # N.B.: like in calendars.getTimeDelta, leap days that are missing from the timestamps are subtracted; the
+      #       count is carried over between input files (leap days before the first file are assumed to be present)
+      previous, nmissing = const.get('MissingLeapDays',(None,0))
+      missing = nmissing + calendars.getMissingLeapDays(fields, previous=previous)
+      seconds -= 86400 * missing
+      const['MissingLeapDays'] = (fields[-1], missing[-1])
+    deltas = ( seconds - toss ) // 60
     if not np.all( np.diff(deltas) == 1440 ):
       raise NotImplementedError('TimeOfConvection only works with daily output intervals!')
+    deltas = deltas.reshape((len(deltas),1,1)) # add singleton spatial dimensions for broadcasting
     deltas -= 1440 # go back one day (convection happened during the previous day)
     # isolate time of day and remove days that didn't rain
     tod = tcv - deltas
@@ -359,25 +889,6 @@ class TimeOfConvection(DerivedVariable):
     return outdata
 
 
-class LiquidPrecip(DerivedVariable):
-  ''' DerivedVariable child implementing computation of liquid precipitation for WRF output. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(LiquidPrecip,self).__init__(name='LiquidPrecip', # name of the variable
-                              units='kg/m^2/s', # not accumulated anymore!
-                              prerequisites=['RAINNC', 'RAINC', 'ACSNOW'], # difference...
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=True) # this computation is actually linear
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute liquid precipitation as the difference between total and solid precipitation. '''
-    super(LiquidPrecip,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    RAINNC = indata['RAINNC']; RAINC = indata['RAINC']; ACSNOW = indata['ACSNOW']; # for use in expressions
-    outdata = evaluate('RAINNC + RAINC - ACSNOW') # compute
-    return outdata
-
-
 class SolidPrecip(DerivedVariable):
   ''' DerivedVariable child implementing computation of solid precipitation for WRF output. '''
 
@@ -456,84 +967,66 @@ class NetPrecip(DerivedVariable):
     return outdata
 
 
-class NetWaterFlux(DerivedVariable):
-  ''' DerivedVariable child implementing computation of net water flux at the surface for WRF output. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(NetWaterFlux,self).__init__(name='NetWaterFlux', # name of the variable
-                              units='kg/m^2/s', # not accumulated anymore!
-                              prerequisites=['LiquidPrecip', 'SFCEVP', 'ACSNOM'], #
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=True) # this computation is actually linear
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute net water flux as the sum of liquid precipitation and snowmelt minus evapo-transpiration. '''
-    super(NetWaterFlux,self).computeValues(indata, const=None) # perform some type checks
-    outdata = evaluate('LiquidPrecip - SFCEVP + ACSNOM', local_dict=indata)  # compute
-    return outdata
-
-
-class WaterForcing(DerivedVariable):
-  ''' DerivedVariable child implementing computation of water flux/forcing at the surface for WRF output. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(WaterForcing,self).__init__(name='WaterForcing', # name of the variable
-                              units='kg/m^2/s', # not accumulated anymore!
-                              prerequisites=['LiquidPrecip', 'ACSNOM'], #
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=True) # this computation is actually linear
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute net water flux as the sum of liquid precipitation and snowmelt minus evapo-transpiration. '''
-    super(WaterForcing,self).computeValues(indata, const=None) # perform some type checks
-    outdata = evaluate('LiquidPrecip + ACSNOM', local_dict=indata)  # compute
-    return outdata
-
-
-class RunOff(DerivedVariable):
-  ''' DerivedVariable child implementing computation of total run off for WRF output. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(RunOff,self).__init__(name='Runoff', # name of the variable
-                              units='kg/m^2/s', # not accumulated anymore!
-                              prerequisites=['SFROFF', 'UDROFF'], # it's the sum of these two
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=True)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute total runoff as the sum of surface and underground runoff. '''
-    super(RunOff,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    outdata = indata['SFROFF'] + indata['UDROFF'] # compute
-    return outdata
-
-
-class WaterVapor(DerivedVariable):
-  ''' DerivedVariable child implementing computation of water vapor partial pressure for WRF output. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(WaterVapor,self).__init__(name='WaterVapor', # name of the variable
-                              units='Pa', # not accumulated anymore!
-                              prerequisites=['Q2', 'PSFC'], # it's the sum of these two
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-    self.Mratio = 28.96 / 18.02 # g/mol, Molecular mass ratio of dry air over water
+class WetDayKernel(object):
+  '''
+    A fused kernel that computes wet-day counts and wet-day precipitation sums for several thresholds in one
+    pass over the data: every value is assigned the number of (sorted) thresholds that it exceeds (its rank)
+    and ranks are counted and summed for every grid point with a single np.bincount; the results for all
+    thresholds then follow from cumulative sums over ranks. Data are processed in blocks of records, so that
+    temporary arrays stay small. WetDays and WetDayRain instances that share a kernel use the cached results
+    for the current input array.
+  '''
 
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute total runoff as the sum of surface and underground runoff. '''
-    super(WaterVapor,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    Mratio = self.Mratio; Q2 = indata['Q2']; PSFC = indata['PSFC'] # for use in expression
-    outdata =  evaluate('Mratio * Q2 * PSFC') # compute
-    return outdata
+  def __init__(self, thresholds, blocksize=2**22):
+    ''' Initialize with a list of thresholds (in mm/day, as for WetDays); blocksize is in bytes. '''
+    self.thresholds = np.sort(np.asarray(thresholds, dtype=np.float64)) / 86400. # convert to SI units
+    self.blocksize = blocksize # approximate size of input blocks
+    self.lock = threading.Lock() # derived variables may be computed in threads
+    self.data = None; self.aggax = None # cache key: the last input array (a reference, not the id)
+    self.counts = None; self.sums = None # cached results
+
+  def getIndex(self, threshold):
+    ''' Return the index of a threshold (in mm/day) in the sorted threshold vector. '''
+    return int(np.argmin(np.abs(self.thresholds - threshold/86400.)))
+
+  def compute(self, data, aggax=0):
+    ''' Compute wet-day counts and wet-day precipitation sums over the aggregation axis for all thresholds;
+        returns None, if the data are masked (the per-threshold computation has to be used instead). '''
+    with self.lock:
+      # N.B.: the cache key is the caller's array, since the data of a masked array is a new view on every access
+      if self.data is data and self.aggax == aggax: return None if self.counts is None else (self.counts, self.sums)
+      self.data = data; self.aggax = aggax
+      if isinstance(data,np.ma.MaskedArray):
+        if data.mask is not np.ma.nomask and data.mask.any():
+          self.counts = None; self.sums = None
+          return None
+        data = data.data
+      nthr = len(self.thresholds); nbins = nthr + 1 # rank 0 are dry values
+      if aggax != 0: data = np.moveaxis(data, aggax, 0)
+      shape = data.shape[1:]; npts = int(np.prod(shape))
+      data = data.reshape((-1,npts)) # records by grid points
+      nblk = max(1, self.blocksize // max(1,data[0].nbytes)) # records per block
+      counts = np.zeros(nbins*npts, dtype=np.int64); sums = np.zeros(nbins*npts, dtype=np.float64)
+      offset = np.arange(npts) # grid point index
+      for i in range(0, data.shape[0], nblk):
+        blk = data[i:i+nblk]
+        rank = (blk > self.thresholds[0]).view(np.int8) # comparisons with NaN always yield False
+        for threshold in self.thresholds[1:]: rank += (blk > threshold).view(np.int8)
+        index = rank.astype(np.intp); index *= npts; index += offset # combined rank and grid point index
+        counts += np.bincount(index.ravel(), minlength=nbins*npts)
+        sums += np.bincount(index.ravel(), weights=blk.ravel(), minlength=nbins*npts)
+        # N.B.: NaN values only enter the rank 0 bin, which is discarded
+      counts = counts.reshape((nbins,npts)); sums = sums.reshape((nbins,npts))
+      # number of values exceeding each threshold: reverse cumulative sum over ranks
+      self.counts = np.cumsum(counts[:0:-1], axis=0)[::-1].reshape((nthr,)+shape)
+      self.sums = np.cumsum(sums[:0:-1], axis=0)[::-1].reshape((nthr,)+shape)
+      return self.counts, self.sums
 
 
 class WetDays(DerivedVariable):
   ''' DerivedVariable child for counting the fraction of rainy days for WRF output. '''
 
-  def __init__(self, threshold=1., rain='RAIN', ignoreNaN=False):
+  def __init__(self, threshold=1., rain='RAIN', ignoreNaN=False, kernel=None):
     ''' Initialize with fixed values and selected dry-day threshold (defined by argument in mm/day). '''
     name = 'WetDays_{:03d}'.format(int(10*threshold))
     threshold /= 86400. # convert to SI units (argument assumed mm/day)
@@ -545,16 +1038,29 @@ class WetDays(DerivedVariable):
                               dtype=dv_float, atts=atts, linear=False, ignoreNaN=ignoreNaN)
     self.threshold = threshold # store for computation
     self.rain = rain # name of the rain variable
+    self.kernel = kernel # fused multi-threshold kernel (optional)
+    if kernel is not None: self.kernelidx = kernel.getIndex(threshold*86400.)
 
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
-    ''' Count the number of events above a threshold. '''
-    super(WetDays,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # check that delta does not change!
+  def checkDelta(self, delta, tmp):
+    ''' check that delta does not change! '''
     if tmp is not None:
       if 'WETDAYS_DELTA' in tmp:
         if delta != tmp['WETDAYS_DELTA']:
           raise NotImplementedError('Output interval is assumed to be constant for conversion to days. (delta={:f})'.format(delta))
       else: tmp['WETDAYS_DELTA'] = delta # save and check next time
+
+  def reduceValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Count the number of events above a threshold, using the fused kernel. '''
+    if self.kernel is None: return None
+    super(WetDays,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    self.checkDelta(delta, tmp)
+    results = self.kernel.compute(indata[self.rain], aggax=aggax)
+    return None if results is None else results[0][self.kernelidx]
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Count the number of events above a threshold. '''
+    super(WetDays,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    self.checkDelta(delta, tmp)
     # sampling does not have to be daily
     if self.ignoreNaN:
       outdata = np.where(indata[self.rain] > self.threshold, 1,0) # comparisons with NaN always yield False
@@ -568,33 +1074,41 @@ class WetDays(DerivedVariable):
 class WetDayRain(DerivedVariable):
   ''' DerivedVariable child for precipitation amounts exceeding the rainy day threshold. '''
 
-  def __init__(self, threshold=1., rain='RAIN', ignoreNaN=False):
+  def __init__(self, threshold=1., rain='RAIN', ignoreNaN=False, kernel=None):
     ''' Initialize with fixed values and selected dry-day threshold (defined by argument in mm/day). '''
     name = 'WetDayRain_{:03d}'.format(int(10*threshold))
-    wetdays = 'WetDays_{:03d}'.format(int(10*threshold))
     threshold /= 86400. # convert to SI units (argument assumed mm/day)
     atts = dict(threshold=threshold) # save threshold value in SI/Variable units
     super(WetDayRain,self).__init__(name=name, # name of the variable
                               units='kg/m^2/s', # fraction of days
-                              prerequisites=[rain,wetdays], # above threshold
+                              prerequisites=[rain], # above threshold
                               axes=('time','south_north','west_east'), # dimensions of NetCDF variable
                               dtype=dv_float, atts=atts, linear=False, ignoreNaN=ignoreNaN)
+    self.threshold = threshold # store for computation
     self.rain = rain # name of the rain variable
-    self.wetdays = wetdays
+    self.kernel = kernel # fused multi-threshold kernel (optional)
+    if kernel is not None: self.kernelidx = kernel.getIndex(threshold*86400.)
+    # N.B.: the wet-day condition is evaluated directly, so that this does not depend on WetDays
+
+  def reduceValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Sum precipitation above a threshold, using the fused kernel. '''
+    if self.kernel is None: return None
+    super(WetDayRain,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    results = self.kernel.compute(indata[self.rain], aggax=aggax)
+    return None if results is None else results[1][self.kernelidx]
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
     ''' Count the number of events above a threshold. '''
     super(WetDayRain,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # just set precip to zero if it is below a threshold
-    outdata = np.where(indata[self.wetdays] == 0, 0., indata[self.rain])
-    # N.B.: WetDays is actually the fraction of wet days in a month (i.e. not really days)
+    # just set precip to zero if it is below a threshold (comparisons with NaN always yield False)
+    outdata = np.where(indata[self.rain] > self.threshold, indata[self.rain], 0.)
     return outdata
 
 
 class WetDayPrecip(DerivedVariable):
   ''' DerivedVariable child for precipitation amounts on rainy days for WRF output. '''
 
-  def __init__(self, threshold=1., rain='RAIN', ignoreNaN=False):
+  def __init__(self, threshold=1., rain='RAIN', ignoreNaN=False, kernel=None):
     ''' Initialize with fixed values and selected dry-day threshold (defined by argument in mm/day). '''
     name = 'WetDayPrecip_{:03d}'.format(int(10*threshold))
     wetdays = 'WetDays_{:03d}'.format(int(10*threshold))
@@ -676,27 +1190,6 @@ class SummerDays(DerivedVariable):
     return outdata
 
 
-class WindSpeed(DerivedVariable):
-  ''' DerivedVariable child for computing total wind speedi at 10m. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(WindSpeed,self).__init__(name='WindSpeed', # name of the variable
-                              units='m/s', # fraction of days
-                              prerequisites=['U10','V10'], # it's the vector sum of these two
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Surface wind speed at 10m. '''
-    super(WindSpeed,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    U = indata['U10']; V = indata['V10']
-    # compute length of wind vector
-    outdata = evaluate('sqrt( U**2 + V**2 )')
-    # N.B.: outer dimensions (i.e. the first) are broadcast automatically, which is what we want here
-    return outdata
-
-
 class IceFrac_H(DerivedVariable):
     ''' DerivedVariable child for counting the fraction of days with ice cover of lakes from FLake ice thickness. '''
 
@@ -796,48 +1289,6 @@ class IceFrac_A(DerivedVariable):
         return outdata
 
 
-class NetRadiation(DerivedVariable):
-  ''' DerivedVariable child for computing total net radiation at the surface (downward). '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(NetRadiation,self).__init__(name='NetRadiation', # name of the variable
-                              units='J m-2/s', # fraction of days
-                              prerequisites=['ACSWDNB','ACSWUPB','ACLWDNB','ACLWUPB'], # it's the sum of these four
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Downward net radiation at the surface. '''
-    super(NetRadiation,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    SWDN = indata['ACSWDNB']; SWUP= indata['ACSWUPB']; LWDN = indata['ACLWDNB']; LWUP = indata['ACLWUPB']
-    # compute downward net radiation at the surface
-    outdata = evaluate('SWDN - SWUP + LWDN - LWUP')
-    # N.B.: outer dimensions (i.e. the first) are broadcast automatically, which is what we want here
-    return outdata
-
-
-class NetLWRadiation(DerivedVariable):
-  ''' DerivedVariable child for computing net long-wave radiation at the surface (downward). '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(NetLWRadiation,self).__init__(name='NetLWRadiation', # name of the variable
-                              units='J m-2/s', # fraction of days
-                              prerequisites=['ACLWDNB','ACLWUPB'], # it's the sum of these four
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Downward LW net radiation at the surface. '''
-    super(NetLWRadiation,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    LWDN = indata['ACLWDNB']; LWUP = indata['ACLWUPB']
-    # compute downward net radiation at the surface
-    outdata = evaluate('LWDN - LWUP')
-    # N.B.: outer dimensions (i.e. the first) are broadcast automatically, which is what we want here
-    return outdata
-
-
 class OrographicIndex(DerivedVariable):
   ''' DerivedVariable child for computing the correlation of (surface) winds with the topographic gradient. '''
 
@@ -849,23 +1300,15 @@ class OrographicIndex(DerivedVariable):
                               constants=['HGT','DY','DX'], # constant topography field
                               axes=('time','south_north','west_east'), # dimensions of NetCDF variable
                               dtype=dv_float, atts=None, linear=False)
+    self.halo = 1 # topographic gradients are central differences along south_north
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Project surface winds onto topographic gradient. '''
     super(OrographicIndex,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute topographic gradients and save in constants (for later use)
-    if 'hgtgrd_sn' not in const:
-      if 'HGT' not in const: raise ValueError
-      if 'DY' not in const: raise ValueError
-      hgtgrd_sn = ctrDiff(const['HGT'], axis=1, delta=const['DY'])
-      const['hgtgrd_sn'] = hgtgrd_sn
-    else: hgtgrd_sn = const['hgtgrd_sn']
-    if 'hgtgrd_we' not in const:
-      if 'HGT' not in const: raise ValueError
-      if 'DX' not in const: raise ValueError
-      hgtgrd_we = ctrDiff(const['HGT'], axis=2, delta=const['DX'])
-      const['hgtgrd_we'] = hgtgrd_we
-    else: hgtgrd_we = const['hgtgrd_we']
+    # compute topographic gradients (shared with other variables for the whole run)
+    if 'HGT' not in const or 'DY' not in const or 'DX' not in const: raise ValueError
+    hgtgrd_sn = self.getIntermediate('HGT_grad_sn', lambda: ctrDiff(const['HGT'], axis=1, delta=const['DY']), lifetime='run')
+    hgtgrd_we = self.getIntermediate('HGT_grad_we', lambda: ctrDiff(const['HGT'], axis=2, delta=const['DX']), lifetime='run')
     U = indata['U10']; V = indata['V10']
     # compute covariance (projection, scalar product, etc.)
     outdata = evaluate('U * hgtgrd_we + V * hgtgrd_sn')
@@ -873,25 +1316,6 @@ class OrographicIndex(DerivedVariable):
     return outdata
 
 
-class CovOIP(DerivedVariable):
-  ''' DerivedVariable child for computing the correlation of the orographic index with precipitation. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(CovOIP,self).__init__(name='OIPX', # name of the variable
-                              units='', # fraction of days
-                              prerequisites=['OrographicIndex', 'RAIN'], # it's the sum of these two
-                              axes=('time','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Covariance of Origraphic Index and Precipitation (needed to calculate correlation coefficient). '''
-    super(CovOIP,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute covariance
-    outdata = evaluate('OrographicIndex * RAIN', local_dict=indata)
-    return outdata
-
-
 class OrographicIndexPlev(DerivedVariable):
   ''' DerivedVariable child for computing the correlation of (surface) winds with the topographic gradient. '''
 
@@ -903,23 +1327,15 @@ class OrographicIndexPlev(DerivedVariable):
                               constants=['HGT','DY','DX'], # constant topography field
                               axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
                               dtype=dv_float, atts=None, linear=False)
+    self.halo = 1 # topographic gradients are central differences along south_north
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Project atmospheric winds onto underlying topographic gradient. '''
     super(OrographicIndexPlev,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute topographic gradients and save in constants (for later use)
-    if 'hgtgrd_sn' not in const:
-      if 'HGT' not in const: raise ValueError
-      if 'DY' not in const: raise ValueError
-      hgtgrd_sn = ctrDiff(const['HGT'], axis=1, delta=const['DY'])
-      const['hgtgrd_sn'] = hgtgrd_sn
-    else: hgtgrd_sn = const['hgtgrd_sn']
-    if 'hgtgrd_we' not in const:
-      if 'HGT' not in const: raise ValueError
-      if 'DX' not in const: raise ValueError
-      hgtgrd_we = ctrDiff(const['HGT'], axis=2, delta=const['DX'])
-      const['hgtgrd_we'] = hgtgrd_we
-    else: hgtgrd_we = const['hgtgrd_we']
+    # compute topographic gradients (shared with other variables for the whole run)
+    if 'HGT' not in const or 'DY' not in const or 'DX' not in const: raise ValueError
+    hgtgrd_sn = self.getIntermediate('HGT_grad_sn', lambda: ctrDiff(const['HGT'], axis=1, delta=const['DY']), lifetime='run')
+    hgtgrd_we = self.getIntermediate('HGT_grad_we', lambda: ctrDiff(const['HGT'], axis=2, delta=const['DX']), lifetime='run')
     U = indata['U_PL']; V = indata['V_PL']
     # compute covariance (projection, scalar product, etc.)
     outdata = evaluate('U * hgtgrd_we + V * hgtgrd_sn')
@@ -927,32 +1343,6 @@ class OrographicIndexPlev(DerivedVariable):
     return outdata
 
 
-class WaterDensity(DerivedVariable):
-  ''' DerivedVariable child for computing water vapor density at a pressure level. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(WaterDensity,self).__init__(name='WaterDensity', # name of the variable
-                              units='kg/m^3', # "density"
-                              prerequisites=['TD_PL','T_PL'], # it's the sum of these two
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-    self.MR = np.asarray( 0.01802 / 8.3144621, dtype=dv_float) # Mh2o / R; from AMS Glossary
-    # N.B.: it is necessary to enforce the type of scalars, otherwise numexpr casts everything as doubles
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute mass denisty of water vapor using the Magnus formula. '''
-    super(WaterDensity,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute water vapor content from dew point (using magnus formula)
-    MR = self.MR; Td = indata['TD_PL']; T = indata['T_PL'] # for use in expression
-    # compute partial pressure using Magnus formula (Wikipedia) and mass per volume "density"
-    # based on: pV = m T (R/M) -> m/V = M/R * p/T
-    outdata = evaluate('MR * 100. * 6.1094 * exp( 17.625 * (Td - 273.15) / (Td - 273.15 + 243.04) ) / T')
-    # N.B.: the Magnus formula uses Celsius and returns hecto-Pascale: need to convert to/from SI
-    # N.B.: outer dimensions (i.e. the first and second) are broadcast automatically, which is what we want here
-    return outdata
-
-
 class ColumnWater(DerivedVariable):
   ''' DerivedVariable child for computing the column-integrated atmospheric water vapor content. '''
 
@@ -969,48 +1359,10 @@ class ColumnWater(DerivedVariable):
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute West-East atmospheric water vapor transport. '''
     super(ColumnWater,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    weights = self.getIntermediate(('PressureWeights',float(self.RMg)), # shared by all pressure integrals
+                                   lambda: pressureWeights(T=indata['T_PL'], p=indata['P_PL'], RMg=self.RMg))
     outdata = pressureIntegral(var=indata['WaterDensity'], T=indata['T_PL'],
-                               p=indata['P_PL'], RMg=self.RMg)
-    return outdata
-
-
-class WaterFlux_U(DerivedVariable):
-  ''' DerivedVariable child for computing the atmospheric transport of water vapor (West-East). '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(WaterFlux_U,self).__init__(name='WaterFlux_U', # name of the variable
-                              units='kg/m^2/s', # flux
-                              prerequisites=['U_PL','WaterDensity'], # west-east direction: U
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute West-East atmospheric water vapor transport. '''
-    super(WaterFlux_U,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute covariance (projection, scalar product, etc.)
-    outdata = indata['U_PL']*indata['WaterDensity']
-    # N.B.: outer dimensions (i.e. the first and second) are broadcast automatically, which is what we want here
-    return outdata
-
-
-class WaterFlux_V(DerivedVariable):
-  ''' DerivedVariable child for computing the atmospheric transport of water vapor (South-North). '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(WaterFlux_V,self).__init__(name='WaterFlux_V', # name of the variable
-                              units='kg/m^2/s', # flux
-                              prerequisites=['V_PL','WaterDensity'], # south-north direction: V
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute South-North atmospheric water vapor transport. '''
-    super(WaterFlux_V,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute covariance (projection, scalar product, etc.)
-    outdata = indata['V_PL']*indata['WaterDensity']
-    # N.B.: outer dimensions (i.e. the first and second) are broadcast automatically, which is what we want here
+                               p=indata['P_PL'], RMg=self.RMg, weights=weights)
     return outdata
 
 
@@ -1030,8 +1382,10 @@ class WaterTransport_U(DerivedVariable):
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute West-East atmospheric water vapor transport. '''
     super(WaterTransport_U,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    weights = self.getIntermediate(('PressureWeights',float(self.RMg)), # shared by all pressure integrals
+                                   lambda: pressureWeights(T=indata['T_PL'], p=indata['P_PL'], RMg=self.RMg))
     outdata = pressureIntegral(var=indata['WaterFlux_U'], T=indata['T_PL'],
-                               p=indata['P_PL'], RMg=self.RMg)
+                               p=indata['P_PL'], RMg=self.RMg, weights=weights)
     return outdata
 
 
@@ -1051,8 +1405,10 @@ class WaterTransport_V(DerivedVariable):
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute South-North atmospheric water vapor transport. '''
     super(WaterTransport_V,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    weights = self.getIntermediate(('PressureWeights',float(self.RMg)), # shared by all pressure integrals
+                                   lambda: pressureWeights(T=indata['T_PL'], p=indata['P_PL'], RMg=self.RMg))
     outdata = pressureIntegral(var=indata['WaterFlux_V'], T=indata['T_PL'],
-                               p=indata['P_PL'], RMg=self.RMg)
+                               p=indata['P_PL'], RMg=self.RMg, weights=weights)
     return outdata
 
 
@@ -1073,59 +1429,14 @@ class ColumnHeat(DerivedVariable):
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute West-East atmospheric water vapor transport. '''
     super(ColumnHeat,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    weights = self.getIntermediate(('PressureWeights',float(self.RMg)), # shared by all pressure integrals
+                                   lambda: pressureWeights(T=indata['T_PL'], p=indata['P_PL'], RMg=self.RMg))
     outdata = pressureIntegral(var=indata['T_PL'], T=indata['T_PL'],
-                               p=indata['P_PL'], RMg=self.RMg)
+                               p=indata['P_PL'], RMg=self.RMg, weights=weights)
     outdata *= self.cp # since integration is linear
     return outdata
 
 
-class HeatFlux_U(DerivedVariable):
-  ''' DerivedVariable child for computing the atmospheric (sensible) heat transport (West-East). '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(HeatFlux_U,self).__init__(name='HeatFlux_U', # name of the variable
-                              units='J/m^2/s', # flux
-                              prerequisites=['U_PL','P_PL'], # west-east direction: U
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-    self.cpMR = np.asarray( 1005.7 * 0.0289644 / 8.3144621, dtype=dv_float) # cp * Mair / R (AMS Glossary)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute West-East atmospheric water vapor transport. '''
-    super(HeatFlux_U,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute covariance (projection, scalar product, etc.)
-    # N.B.: u * T*cp * rho; rho = p / (R/M * T) => u * p * (cp * M / R)
-    p=indata['P_PL']; u = indata['U_PL']; cpMR = self.cpMR
-    p = p.reshape(p.shape+(1,1)) # extend singleton dimensions
-    outdata = evaluate('u * p * cpMR')
-    # N.B.: outer dimensions (i.e. the first and second) are broadcast automatically, which is what we want here
-    return outdata
-
-class HeatFlux_V(DerivedVariable):
-  ''' DerivedVariable child for computing the atmospheric (sensible) heat transport (South-North). '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(HeatFlux_V,self).__init__(name='HeatFlux_V', # name of the variable
-                              units='J/m^2/s', # flux
-                              prerequisites=['V_PL','P_PL'], # west-east direction: U
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-    self.cpMR = np.asarray( 1005.7 * 0.0289644 / 8.3144621, dtype=dv_float) # cp * Mair / R (AMS Glossary)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Compute West-East atmospheric water vapor transport. '''
-    super(HeatFlux_V,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute covariance (projection, scalar product, etc.)
-    # N.B.: u * T*cp * rho; rho = p / (R/M * T) => u * p * (cp * M / R)
-    p=indata['P_PL']; v = indata['V_PL']; cpMR = self.cpMR
-    p = p.reshape(p.shape+(1,1)) # extend singleton dimensions
-    outdata = evaluate('v * p * cpMR')
-    # N.B.: outer dimensions (i.e. the first and second) are broadcast automatically, which is what we want here
-    return outdata
-
-
 class HeatTransport_U(DerivedVariable):
   ''' DerivedVariable child for computing the column-integrated atmospheric heat transport (West-East). '''
 
@@ -1142,8 +1453,10 @@ class HeatTransport_U(DerivedVariable):
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute West-East atmospheric water vapor transport. '''
     super(HeatTransport_U,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    weights = self.getIntermediate(('PressureWeights',float(self.RMg)), # shared by all pressure integrals
+                                   lambda: pressureWeights(T=indata['T_PL'], p=indata['P_PL'], RMg=self.RMg))
     outdata = pressureIntegral(var=indata['HeatFlux_U'], T=indata['T_PL'],
-                               p=indata['P_PL'], RMg=self.RMg)
+                               p=indata['P_PL'], RMg=self.RMg, weights=weights)
     return outdata
 
 
@@ -1163,8 +1476,10 @@ class HeatTransport_V(DerivedVariable):
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Compute West-East atmospheric water vapor transport. '''
     super(HeatTransport_V,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    weights = self.getIntermediate(('PressureWeights',float(self.RMg)), # shared by all pressure integrals
+                                   lambda: pressureWeights(T=indata['T_PL'], p=indata['P_PL'], RMg=self.RMg))
     outdata = pressureIntegral(var=indata['HeatFlux_V'], T=indata['T_PL'],
-                               p=indata['P_PL'], RMg=self.RMg)
+                               p=indata['P_PL'], RMg=self.RMg, weights=weights)
     return outdata
 
 
@@ -1178,6 +1493,7 @@ class Vorticity(DerivedVariable):
                               prerequisites=['U_PL','V_PL'],
                               axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
                               dtype=dv_float, atts=None, linear=False)
+    self.halo = 1 # central differences along south_north
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
     ''' Project surface winds onto topographic gradient. '''
@@ -1190,46 +1506,6 @@ class Vorticity(DerivedVariable):
     return outdata
 
 
-class Vorticity_Var(DerivedVariable):
-  ''' DerivedVariable child for computing the variance of relative vorticity. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(Vorticity_Var,self).__init__(name='Vorticity_Var', # name of the variable
-                              units='1/s^2',
-                              prerequisites=['Vorticity'],
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Project surface winds onto topographic gradient. '''
-    super(Vorticity_Var,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute variance without subtracting the mean
-    outdata = indata['Vorticity']**2
-    # N.B.: to get actual variance, the square of the mean has to be subtracted after the final stage of aggregation
-    return outdata
-
-
-class GHT_Var(DerivedVariable):
-  ''' DerivedVariable child for computing the variance of geopotential height on pressure levels. '''
-
-  def __init__(self):
-    ''' Initialize with fixed values; constructor takes no arguments. '''
-    super(GHT_Var,self).__init__(name='GHT_Var', # name of the variable
-                              units='m^2',
-                              prerequisites=['GHT_PL'],
-                              axes=('time','num_press_levels_stag','south_north','west_east'), # dimensions of NetCDF variable
-                              dtype=dv_float, atts=None, linear=False)
-
-  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None, ignoreNaN=False):
-    ''' Project surface winds onto topographic gradient. '''
-    super(GHT_Var,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
-    # compute variance without subtracting the mean
-    outdata = indata['GHT_PL']**2
-    # N.B.: to get actual variance, the square of the mean has to be subtracted after the final stage of aggregation
-    return outdata
-
-
 
 ## extreme values
 
@@ -1272,6 +1548,11 @@ class Extrema(DerivedVariable):
     # N.B.: already partially aggregating here, saves memory
     return outdata
 
+  def getAggregator(self, shape):
+    ''' Create a preallocated accumulator for the aggregation of extrema. '''
+    if self.normalize: raise DerivedVariableError('Aggregated extrema should not be normalized!')
+    return Aggregator(shape, mode='max' if self.mode == 1 else 'min', ignoreNaN=self.ignoreNaN)
+
   def aggregateValues(self, comdata, aggdata=None, aggax=0):
     ''' Compute and aggregate values for non-linear over several input periods/files. '''
     # N.B.: linear variables can go through this chain as well, if it is a pre-requisite for non-linear variable
@@ -1331,6 +1612,7 @@ class ConsecutiveExtrema(Extrema):
     self.mode = 1 # aggregation method is always maximum (longest period)
     self.tmpdata = 'COX_'+self.name # don't need temporary storage
     self.carryover = True # don't stop counting - this is vital
+    self.blocksize = 2**21 # approximate size of the bit mask of a block of time steps (bytes)
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
     ''' Count consecutive above/below threshold days '''
@@ -1344,43 +1626,150 @@ class ConsecutiveExtrema(Extrema):
     if self.period == 0.:
       self.period = delta / self.lengthofday
     # get data
-    data = indata[self.prerequisites[0]]
+    data = np.ma.getdata(indata[self.prerequisites[0]])
     # if axis is not 0 (outermost), roll axis until it is
-    if aggax != 0: data = np.rollaxis(data, axis=aggax, start=0).copy() # should make a copy
+    if aggax != 0: data = np.moveaxis(data, aggax, 0) # a view is sufficient
     tlen = data.shape[0] # aggregation axis
     xshape = data.shape[1:] # rest of the map
     # initialize counter of consecutive exceedances
     if self.tmpdata in tmp: xcnt = tmp[self.tmpdata] # carry over from previous period
     else: xcnt = np.zeros(xshape, dtype='int16')# initialize as zero
     # initialize output array
-    maxdata = np.zeros(xshape, dtype=np.dtype('int16')) # record of maximum consecutive days in computation period
-    # march along aggregation axis
-    for t in range(tlen):
+    maxcnt = np.zeros(xshape, dtype=np.dtype('int16')) # record of maximum consecutive records in computation period
+    # track the leading period of exceedance (only when processing time chunks, which have to be stitched)
+    llead = 'COX_MONTH' in tmp
+    if llead:
+      if self.tmpdata+'_LEAD' in tmp: lead, leadmonth = tmp[self.tmpdata+'_LEAD']
+      else:
+        lead = np.zeros(xshape, dtype='int16') # length of the leading period
+        leadmonth = np.zeros(xshape, dtype='int16') - 1 # month in which it ended (-1: still going)
+      leadopen = leadmonth < 0
+    # march along aggregation axis in blocks: threshold masks are computed for a block of time steps at once and
+    # are converted to bit masks (0 or -1), so that counters can be updated in-place with bitwise operations
+    xnew = np.zeros(xshape, dtype='int16') # periods before reset
+    one = np.int16(1)
+    nblk = max(1, self.blocksize // max(1,2*int(np.prod(xshape)))) # time steps per block
+    for t0 in range(0, tlen, nblk):
       # detect threshold changes
-      if self.thresmode == 1: xmask = ( data[t,:] > self.threshold ) # above
-      elif self.thresmode == 0: xmask = ( data[t,:] < self.threshold ) # below
+      if self.thresmode == 1: xmask = ( data[t0:t0+nblk] > self.threshold ) # above
+      elif self.thresmode == 0: xmask = ( data[t0:t0+nblk] < self.threshold ) # below
       # N.B.: comparisons with NaN always yield False, i.e. non-exceedance
-      # update maxima of exceedances
-      xnew = np.where(xmask,0,xcnt) * self.period # extract periods before reset
-      maxdata = np.maximum(maxdata,xnew) #
-      # set counter for all non-exceedances to zero
-      xcnt[np.invert(xmask)] = 0
-      # increment exceedance counter
-      xcnt[xmask] += 1
+      xbits = np.negative(xmask.view(np.int8), dtype='int16') # -1 (all bits set) for exceedance, 0 otherwise
+      rbits = np.invert(xbits) # bit mask for resets (non-exceedance)
+      for t in range(xmask.shape[0]):
+        # update maxima of exceedances
+        np.bitwise_and(xcnt, rbits[t], out=xnew) # extract periods before reset
+        np.maximum(maxcnt, xnew, out=maxcnt)
+        # record end of leading period
+        if llead and leadopen.any():
+          lend = np.logical_and(leadopen, np.invert(xmask[t]))
+          lead[lend] = xcnt[lend]; leadmonth[lend] = tmp['COX_MONTH']; leadopen[lend] = False
+        # increment exceedance counter and set counter for all non-exceedances to zero
+        np.add(xcnt, one, out=xcnt); np.bitwise_and(xcnt, xbits[t], out=xcnt)
+    maxdata = maxcnt * self.period # convert to days
     # carry over current counter to next period or month
     tmp[self.tmpdata] = xcnt
+    if llead: tmp[self.tmpdata+'_LEAD'] = (lead, leadmonth)
     # return output for further aggregation
     if self.ignoreNaN:
       maxdata = np.ma.masked_where(np.isnan(data).sum(axis=0) > 0, maxdata)
     return maxdata
 
 
+# streaming engine for interval averages (shared by interval-averaged extrema of the same variable)
+class IntervalEngine(object):
+  '''
+    A streaming engine that computes interval averages (or maxima/minima) for all members (MeanExtrema or
+    ClimateIndex instances) of one base variable in one pass: the time axis is split at the union of the
+    interval boundaries of all members and the segments are reduced with a single reduceat per operation;
+    the interval values of each member are then combined from these segments.
+    Incomplete intervals at the end are carried over as partial reductions (and the number of time steps) in
+    the temporary storage of each member, so that new data never has to be concatenated with old data.
+  '''
+  # operations required for each reduction; 'range' is the difference between maximum and minimum
+  reductions = dict(mean=(np.add,), max=(np.maximum,), min=(np.minimum,), range=(np.maximum,np.minimum))
+
+  def __init__(self):
+    ''' Initialize an engine without members; members register themselves. '''
+    self.members = [] # MeanExtrema or ClimateIndex instances that use this engine
+    self.lock = threading.Lock() # members may be computed in threads
+    self.data = None; self.aggax = None # cache key: the last input array (a reference, not the id)
+    self.results = None # cached interval values and interval ends of all members
+
+  def register(self, devar):
+    ''' Add a member (all members have to use the same base variable and need a reduction attribute). '''
+    if len(self.members) > 0 and devar.prerequisites[0] != self.members[0].prerequisites[0]:
+      raise DerivedVariableError("All members of an IntervalEngine need to use the same base variable.")
+    if devar.reduction not in self.reductions:
+      raise ValueError("Invalid interval reduction: '{}'".format(devar.reduction))
+    self.members.append(devar)
+
+  def compute(self, devar, data, aggax=0, delta=None, tmp=None):
+    ''' Return the values of all complete intervals for one member (None, if there are none) and the indices
+        where these intervals end; the partial reductions of all members in the temporary storage are updated. '''
+    with self.lock:
+      if self.data is not data or self.aggax != aggax:
+        self.data = data; self.aggax = aggax
+        data = np.ma.getdata(data)
+        # if axis is not 0 (outermost), roll axis until it is
+        if aggax != 0: data = np.moveaxis(data, aggax, 0) # a view is sufficient
+        self.results = self.computeAll(data, delta, tmp)
+      return self.results[devar.name]
+
+  def computeAll(self, data, delta, tmp):
+    ''' Compute interval values for all members in one pass over the data (axis 0 is time). '''
+    lt = data.shape[0] # available time steps
+    # interval boundaries of all members (the end of the first interval depends on the partial reduction)
+    bounds = dict()
+    for member in self.members:
+      ilen = int( member.interval / delta )
+      if ilen < 1: raise ValueError('No interval to average over...')
+      count = tmp[member.tmpdata][1] if member.tmpdata in tmp else 0
+      bounds[member.name] = (ilen, np.arange(ilen-count, lt+1, ilen, dtype=np.intp))
+    if lt == 0: return {member.name:(None, bounds[member.name][1]) for member in self.members}
+    # reduce data between all boundaries in one pass (segments are delimited by the union of boundaries)
+    starts = np.union1d([0], np.concatenate([ends for ilen,ends in bounds.values()]))
+    starts = starts[starts < lt]
+    ufuncs = set(ufunc for member in self.members for ufunc in self.reductions[member.reduction])
+    segments = {ufunc:ufunc.reduceat(data, starts, axis=0, dtype=np.float64 if ufunc is np.add else None)
+                for ufunc in ufuncs}
+    # combine segments for each member
+    results = dict()
+    for member in self.members:
+      ilen, ends = bounds[member.name]
+      if member.tmpdata in tmp: partials, count = tmp[member.tmpdata]
+      else: partials = None; count = 0
+      nint = len(ends) # number of complete intervals
+      segidx = np.searchsorted(starts, ends) # index of the first segment after each interval
+      wstarts = np.concatenate([[0], segidx]) # segments where intervals (and the rest) start
+      wstarts = wstarts[wstarts < len(starts)]
+      rest = nint == 0 or ends[-1] < lt # there are remaining time steps
+      values = []; newpartials = []
+      for k,ufunc in enumerate(self.reductions[member.reduction]):
+        wvals = ufunc.reduceat(segments[ufunc], wstarts, axis=0)
+        if partials is not None: ufunc(wvals[0], partials[k], out=wvals[0]) # complete first interval (or rest)
+        if nint > 0: values.append(wvals[:nint])
+        if rest: newpartials.append(wvals[nint].copy() if nint > 0 else wvals[0])
+      if nint > 0:
+        if member.reduction == 'mean': values = values[0] / ilen # average over interval
+        elif member.reduction == 'range': values = values[0] - values[1] # maximum minus minimum
+        else: values = values[0]
+        count = lt - ends[-1]
+      else:
+        values = None # nothing to return (handled in aggregation)
+        count += lt # carry over everything
+      tmp[member.tmpdata] = (newpartials if rest else None, count) # save partial reductions for next iteration
+      results[member.name] = (values, ends)
+    return results
+
+
 # base class for interval-averaged extrema (sort of similar to running mean)
 class MeanExtrema(Extrema):
   ''' Extrema child implementing extrema of interval-averaged values in monthly WRF output. '''
 
-  def __init__(self, var, mode, interval=5, name=None, long_name=None, dimmap=None, ignoreNaN=False):
-    ''' Constructor; takes variable object as argument and infers meta data. '''
+  def __init__(self, var, mode, interval=5, name=None, long_name=None, dimmap=None, ignoreNaN=False, engine=None):
+    ''' Constructor; takes variable object as argument and infers meta data; MeanExtrema of the same variable
+        should share an IntervalEngine, so that all intervals are computed in one pass. '''
     # infer attributes of Maximum variable
     super(MeanExtrema,self).__init__(var, mode, name=name, long_name=long_name, dimmap=dimmap, ignoreNaN=ignoreNaN)
     if len(self.prerequisites) > 1: raise ValueError("Extrema can only have one Prerquisite")
@@ -1388,41 +1777,262 @@ class MeanExtrema(Extrema):
     self.atts['Aggregation'] = 'Averaged ' + self.atts['Aggregation']
     self.atts['AverageInterval'] = '{0:d} days'.format(interval) # interval in days
     self.interval = interval * 24*60*60 # in seconds, sicne delta will be in seconds, too
-    self.tmpdata = 'MEX_'+self.name # handle for temporary storage
+    self.tmpdata = 'MEX_'+self.name # handle for temporary storage: partial sum and number of time steps
     self.carryover = True # don't drop data
+    self.reduction = 'mean' # interval averages
+    self.engine = engine or IntervalEngine() # computes interval averages
+    self.engine.register(self)
 
   def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
     ''' Compute field of maxima '''
-    #if aggax != 0: raise NotImplementedError, 'Currently, interval averaging only works on the innermost dimension.'
     if delta == 0: raise ValueError('No interval to average over...')
-    # assemble data
-    data = indata[self.prerequisites[0]]
-    # if axis is not 0 (outermost), roll axis until it is
-    if aggax != 0: data = np.rollaxis(data, axis=aggax, start=0).copy() # rollaxis just provides a view
-    if self.tmpdata in tmp:
-      data = np.concatenate((tmp[self.tmpdata], data), axis=0)
-    # determine length of interval
-    lt = data.shape[0] # available time steps
-    pape = data.shape[1:] # remaining shape (must be preserved)
-    ilen = int( self.interval / delta )
-    nint = int( lt / ilen ) # number of intervals
-    if nint > 0:
-      # truncate and reshape data
-      ui = ilen*nint # usable interval: split data here
-      data = data[:ui,:] # use this portion
-      rest = data[ui:,:] # save the rest for next iteration
-      data = data.reshape((nint,ilen) + pape)
-      # average interval
-      meandata = data.mean(axis=1) # average over interval dimension
+    # average complete intervals; incomplete intervals are carried over in temporary storage
+    meandata, ends = self.engine.compute(self, indata[self.prerequisites[0]], aggax=aggax, delta=delta, tmp=tmp)
+    if meandata is not None:
       datadict = {self.prerequisites[0]:meandata} # next method expects a dictionary...
       # find extrema as before (but aggregation axis was shifted to 0)
       outdata = super(MeanExtrema,self).computeValues(datadict, aggax=0, delta=delta, const=const,
                                                       tmp=None) # perform some type checks
-    else:
-      rest = data # carry over everything
-      outdata = None # nothing to return (handled in aggregation)
-    # add remaining data to temporary storage
-    tmp[self.tmpdata] = rest
-
+    else: outdata = None # nothing to return (handled in aggregation)
     # N.B.: already partially aggregating here, saves memory
     return outdata
+
+
+## variances and covariances
+
+class Variance(DerivedVariable):
+  ''' DerivedVariable child for the (population) variance of instantaneous values over the averaging period. '''
+
+  def __init__(self, var, name=None, long_name=None, dimmap=None):
+    ''' Constructor; takes variable object as argument and infers meta data. '''
+    if isinstance(var, DerivedVariable):
+      varname = var.name; axes = var.axes; units = var.units; long_name = long_name or var.atts.get('long_name',None)
+    elif isinstance(var, nc.Variable):
+      varname = var._name; axes = var.dimensions; units = var.units
+    else: raise TypeError
+    if isinstance(dimmap,dict): axes = [dimmap[dim] if dim in dimmap else dim for dim in axes]
+    atts = dict(Aggregation='Monthly Variance')
+    if long_name is not None: atts['long_name'] = 'Variance of ' + long_name
+    super(Variance,self).__init__(name=name or varname+'_var', units='({:s})^2'.format(units) if units else '',
+                                  prerequisites=[varname], axes=axes, dtype=dv_float, atts=atts, linear=False,
+                                  normalize=False)
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Pass on instantaneous values (the variance is computed by the aggregator). '''
+    super(Variance,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    return indata[self.prerequisites[0]]
+
+  def getAggregator(self, shape):
+    ''' Create a preallocated accumulator for the variance (streaming updates). '''
+    return MomentAggregator(shape, mode='var')
+
+
+class Covariance(DerivedVariable):
+  ''' DerivedVariable child for the (population) covariance of two variables over the averaging period. '''
+
+  def __init__(self, var1, var2, name=None, long_name=None, dimmap=None):
+    ''' Constructor; takes two variable objects as arguments and infers meta data (axes from the first). '''
+    varnames = []; units = []
+    for var in (var1,var2):
+      if isinstance(var, DerivedVariable): varnames.append(var.name); units.append(var.units)
+      elif isinstance(var, nc.Variable): varnames.append(var._name); units.append(var.units)
+      else: raise TypeError
+    axes = var1.axes if isinstance(var1, DerivedVariable) else var1.dimensions
+    if isinstance(dimmap,dict): axes = [dimmap[dim] if dim in dimmap else dim for dim in axes]
+    atts = dict(Aggregation='Monthly Covariance')
+    atts['long_name'] = long_name or 'Covariance of {:s} and {:s}'.format(*varnames)
+    super(Covariance,self).__init__(name=name or '{:s}_{:s}_cov'.format(*varnames), units=' '.join(unit for unit in units if unit),
+                                    prerequisites=varnames, axes=axes, dtype=dv_float, atts=atts, linear=False,
+                                    normalize=False)
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Stack instantaneous values of both variables along a trailing axis (the covariance is computed by the aggregator). '''
+    super(Covariance,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    return np.stack(np.broadcast_arrays(indata[self.prerequisites[0]], indata[self.prerequisites[1]]), axis=-1)
+
+  def getAggregator(self, shape):
+    ''' Create a preallocated accumulator for the covariance (streaming updates). '''
+    return MomentAggregator(shape, mode='cov')
+
+
+## climate indices (ETCCDI)
+
+# registry of climate indices that are computed from daily values in the same pass; the keys are the
+# variable names and the values are keyword arguments for ClimateIndex: 'reduction' defines how daily values
+# are computed from the input ('mean', 'max', 'min', or 'range'), 'aggregation' how they are aggregated over a
+# month ('max', 'sum', 'mean', or 'fraction', i.e. the percentage of days that exceed a threshold); 'scale'
+# converts daily values (e.g. to mm/day) and 'window' is the length of running sums (in days)
+# N.B.: percentile-based indices compare daily values to precomputed baseline fields (e.g. the 90th
+#       percentile of daily maximum temperature of a reference period) in the units of the scaled values
+climate_indices = dict()
+climate_indices['Rx1day'] = dict(units='mm', reduction='mean', aggregation='max', scale=86400.,
+                                 long_name='Maximum 1-day Precipitation')
+climate_indices['Rx5day'] = dict(units='mm', reduction='mean', aggregation='max', scale=86400., window=5,
+                                 long_name='Maximum Consecutive 5-day Precipitation')
+climate_indices['R95p'] = dict(units='mm', reduction='mean', aggregation='sum', scale=86400., baseline='R95',
+                               mode='above', long_name='Precipitation on Very Wet Days (> 95th Percentile)')
+climate_indices['R99p'] = dict(units='mm', reduction='mean', aggregation='sum', scale=86400., baseline='R99',
+                               mode='above', long_name='Precipitation on Extremely Wet Days (> 99th Percentile)')
+climate_indices['TX90p'] = dict(units='%', reduction='max', aggregation='fraction', baseline='TX90', mode='above',
+                                long_name='Percentage of Warm Days (TX > 90th Percentile)')
+climate_indices['TX10p'] = dict(units='%', reduction='max', aggregation='fraction', baseline='TX10', mode='below',
+                                long_name='Percentage of Cool Days (TX < 10th Percentile)')
+climate_indices['TN90p'] = dict(units='%', reduction='min', aggregation='fraction', baseline='TN90', mode='above',
+                                long_name='Percentage of Warm Nights (TN > 90th Percentile)')
+climate_indices['TN10p'] = dict(units='%', reduction='min', aggregation='fraction', baseline='TN10', mode='below',
+                                long_name='Percentage of Cool Nights (TN < 10th Percentile)')
+climate_indices['DTR'] = dict(units='K', reduction='range', aggregation='mean',
+                              long_name='Mean Diurnal Temperature Range')
+climate_indices['GSL'] = dict(units='days', reduction='mean', aggregation='sum', threshold=273.15+5.,
+                              long_name='Growing Season Length (Monthly Contribution)')
+
+
+# class for climate indices based on daily values
+class ClimateIndex(DerivedVariable):
+  '''
+    DerivedVariable child that computes ETCCDI-type climate indices from daily values of a base variable;
+    daily values are computed by an IntervalEngine (shared with MeanExtrema of the same variable), so that
+    indices are computed in the same pass as everything else. The definition can be passed as arguments or
+    looked up in the climate_indices registry by name (arguments override registry values).
+  '''
+
+  def __init__(self, name, var, units=None, reduction=None, aggregation=None, scale=None, window=None,
+               baseline=None, mode=None, long_name=None, dimmap=None, ignoreNaN=False, engine=None):
+    ''' Initialize from the registry and/or arguments; var is the base variable (DerivedVariable or NetCDF
+        variable) and baseline the name of a field with threshold values in the const dictionary. '''
+    definition = dict(climate_indices.get(name,dict())) # copy, so that the registry is not modified
+    for key,value in dict(units=units, reduction=reduction, aggregation=aggregation, scale=scale, window=window,
+                          baseline=baseline, mode=mode, long_name=long_name).items():
+      if value is not None: definition[key] = value
+    if 'reduction' not in definition or 'aggregation' not in definition:
+      raise DerivedVariableError("No definition found for climate index '{:s}'.".format(name))
+    if isinstance(var, DerivedVariable):
+      varname = var.name; axes = var.axes
+    elif isinstance(var, nc.Variable):
+      varname = var._name; axes = var.dimensions
+    else: raise TypeError
+    if isinstance(dimmap,dict): axes = [dimmap[dim] if dim in dimmap else dim for dim in axes]
+    atts = dict(Aggregation='Monthly {:s} of Daily {:s}'.format(definition['aggregation'].title(),
+                                                               definition['reduction'].title()))
+    atts['Variable'] = varname
+    if 'long_name' in definition: atts['long_name'] = definition['long_name']
+    self.baseline = definition.get('baseline',None) # name of threshold field (loaded with constants)
+    if self.baseline is not None: atts['BaselineThreshold'] = self.baseline
+    super(ClimateIndex,self).__init__(name=name, units=definition['units'], prerequisites=[varname], axes=axes,
+                                      dtype=dv_float, atts=atts, linear=False, normalize=False, ignoreNaN=ignoreNaN)
+    self.reduction = definition['reduction'] # daily values
+    self.aggregation = definition['aggregation'] # monthly aggregation
+    if self.aggregation not in ('max','sum','mean','fraction'):
+      raise ValueError("Invalid aggregation of climate index: '{}'".format(self.aggregation))
+    self.scale = definition.get('scale',1.) # conversion of daily values
+    self.window = definition.get('window',1) # running sums over several days
+    self.thresmode = definition.get('mode','above') # comparison with baseline threshold
+    self.interval = 24*60*60 # daily values; in seconds, since delta will be in seconds, too
+    self.tmpdata = 'IDX_'+self.name # handle for temporary storage: partial reductions and number of time steps
+    self.carryover = True # don't drop data
+    self.engine = engine or IntervalEngine() # computes daily values
+    self.engine.register(self)
+
+  def getAggregator(self, shape):
+    ''' Create a preallocated accumulator: sums over days are not normalized, means by the number of days. '''
+    mode = dict(max='max', sum='sum', mean='mean', fraction='mean')[self.aggregation]
+    return Aggregator(shape, mode=mode, ignoreNaN=self.ignoreNaN)
+
+  def getDailyValues(self, indata, aggax=0, delta=None, tmp=None):
+    ''' Return (scaled) daily values of all days that were completed in this period and the indices where
+        the days end; days are aggregated along axis 0. '''
+    if delta == 0: raise ValueError('No interval to average over...')
+    daydata, ends = self.engine.compute(self, indata[self.prerequisites[0]], aggax=aggax, delta=delta, tmp=tmp)
+    if daydata is None: return None, ends
+    if self.scale != 1.: daydata = daydata * self.scale
+    if self.window > 1:
+      # running sums over several days; the last days are carried over to complete windows in the next period
+      key = self.tmpdata+'_WINDOW'
+      if key in tmp: daydata = np.concatenate([tmp[key], daydata], axis=0) # only a few days, no large arrays
+      tmp[key] = daydata[-(self.window-1):].copy()
+      if daydata.shape[0] < self.window: return None, ends
+      cumsum = np.cumsum(daydata, axis=0, dtype=np.float64)
+      daydata = cumsum[self.window-1:].copy(); daydata[1:] -= cumsum[:-self.window]
+    return daydata, ends
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Compute daily values and compare to baseline threshold; returns daily values for aggregation along
+        axis 0 or values that are already reduced (maxima). '''
+    super(ClimateIndex,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    if aggax != 0: raise NotImplementedError('Climate indices are aggregated along axis 0.')
+    daydata, ends = self.getDailyValues(indata, aggax=aggax, delta=delta, tmp=tmp)
+    if daydata is None: return None # nothing to return (handled in aggregation)
+    if self.baseline is not None:
+      if const is None or self.baseline not in const:
+        raise ValueError("The climate index '{:s}' requires the baseline field '{:s}'!".format(self.name,self.baseline))
+      threshold = np.ma.getdata(const[self.baseline])
+      if self.thresmode == 'above': exceed = daydata > threshold
+      elif self.thresmode == 'below': exceed = daydata < threshold
+      else: raise ValueError("Only 'above' and 'below' are valid modes.")
+      if self.aggregation == 'fraction': daydata = exceed * 100. # percentage of days
+      elif self.aggregation == 'sum': daydata = np.where(exceed, daydata, 0.) # values above threshold
+      else: raise NotImplementedError("Baseline thresholds are only supported for sums and fractions.")
+    if self.aggregation == 'max':
+      outdata = np.nanmax(daydata, axis=0) if self.ignoreNaN else np.max(daydata, axis=0)
+      # N.B.: already partially aggregating here, saves memory
+    else: outdata = daydata
+    return outdata
+
+
+# growing season length (ETCCDI definition for the northern hemisphere)
+class GrowingSeasonLength(ClimateIndex):
+  '''
+    ClimateIndex child that counts the days of the growing season: the season starts with the first span of
+    6 days with a daily mean temperature above 5C in the first half of the year and ends with the first span of
+    6 days below 5C after July 1st (or with the end of the year). Monthly values are the number of days that
+    were added to the growing season in each month, so that the annual sum is the growing season length.
+  '''
+
+  def __init__(self, var, name='GSL', threshold=None, timestamp='Times', **kwargs):
+    ''' Initialize from the registry; timestamps are needed to determine the date of each day. '''
+    super(GrowingSeasonLength,self).__init__(name, var, **kwargs)
+    self.threshold = threshold or climate_indices['GSL']['threshold'] # daily mean temperature in K
+    self.atts['ThresholdValue'] = str(self.threshold)
+    self.prerequisites.append(timestamp)
+    self.span = 6 # number of days that start or end the season
+
+  def computeValues(self, indata, aggax=0, delta=None, const=None, tmp=None):
+    ''' Advance the growing season day by day and return the number of days added to the season. '''
+    super(ClimateIndex,self).computeValues(indata, aggax=aggax, delta=delta, const=const, tmp=tmp) # perform some type checks
+    if aggax != 0: raise NotImplementedError('Climate indices are aggregated along axis 0.')
+    daydata, ends = self.getDailyValues(indata, aggax=aggax, delta=delta, tmp=tmp)
+    if daydata is None: return None # nothing to return (handled in aggregation)
+    timestamps = indata[self.prerequisites[1]]
+    xshape = daydata.shape[1:]
+    # state of the season: year, in season, season over, and counters of warm/cold days and pending cold days
+    key = self.tmpdata+'_SEASON'
+    if key in tmp: year, inseason, over, warmrun, coldrun, pending = tmp[key]
+    else:
+      year = None; inseason = np.zeros(xshape, dtype=np.bool_); over = np.zeros(xshape, dtype=np.bool_)
+      warmrun = np.zeros(xshape, dtype='int16'); coldrun = np.zeros(xshape, dtype='int16')
+      pending = np.zeros(xshape, dtype='int16')
+    outdata = np.zeros(daydata.shape, dtype=dv_float) # days added to the season on each day
+    for k,end in enumerate(ends):
+      # N.B.: the last time step of a day determines the date
+      date = str(timestamps[end-1]); dyear = int(date[0:4]); dmonth = int(date[5:7]); dday = int(date[8:10])
+      if year != dyear: # new year: reset season
+        year = dyear; inseason.fill(False); over.fill(False); warmrun.fill(0); coldrun.fill(0); pending.fill(0)
+      warm = daydata[k] > self.threshold
+      warmrun = np.where(warm, warmrun+1, 0).astype('int16')
+      if dmonth < 7:
+        # the season starts with a span of warm days (all of which count) and does not end before July
+        start = np.logical_and(warmrun >= self.span, np.logical_not(np.logical_or(inseason, over)))
+        outdata[k] = np.where(start, self.span, inseason) # season days
+        np.logical_or(inseason, start, out=inseason)
+      else:
+        # cold days only count, if the season does not end with the span they belong to
+        coldrun = np.where(warm, 0, coldrun+1).astype('int16')
+        outdata[k] = np.where(np.logical_and(inseason, warm), pending+1, 0)
+        pending = np.where(np.logical_and(inseason, np.logical_not(warm)), pending+1, 0).astype('int16')
+        end = np.logical_and(inseason, coldrun >= self.span)
+        np.logical_and(inseason, np.logical_not(end), out=inseason); np.logical_or(over, end, out=over)
+        pending[end] = 0
+        if dmonth == 12 and dday == 31: # the season ends with the year
+          outdata[k] += pending; pending.fill(0)
+    tmp[key] = (year, inseason, over, warmrun, coldrun, pending)
+    return outdata
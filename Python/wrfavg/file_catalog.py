@@ -0,0 +1,85 @@
+'''
+Created on 2026-10-18
+
+A module that maintains a persistent catalog of WRF output files, so that the time range and contents of
+input files can be looked up without opening every netCDF file. The catalog is stored as a JSON sidecar
+file in the output folder (input folders are often read-only or shared) and is updated incrementally; entries
+are keyed by file name and validated using the modification time and size of the file.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, re, json
+import netCDF4 as nc
+# my own netcdf stuff
+from wrfavg.derived_variables import getTimeIndex
+
+# file name of the catalog (sidecar file in the output folder)
+catalog_file = '.wrfavg_catalog.json'
+catalog_version = 1 # increment, if the entry format changes
+# regular expression to infer filetype and domain from file names
+filergx = re.compile(r'^wrf(\w+?)_d(\d\d)_')
+
+
+def getCatalogEntry(filepath, timestamp_var='Times', xtime_var='XTIME', time_dim='Time'):
+  ''' open a WRF output file and assemble a catalog entry with the time range and variable list '''
+  stat = os.stat(filepath)
+  match = filergx.match(os.path.basename(filepath))
+  with nc.Dataset(filepath, 'r', format='NETCDF4') as dataset:
+    timestamps = getTimeIndex(dataset, timestamp_var)[1] # only need the strings
+    if xtime_var in dataset.variables:
+      xtime = dataset.variables[xtime_var]
+      xrange = [float(xtime[0]), float(xtime[len(timestamps)-1])] # netcdf library has problems with negative indexing
+    else: xrange = None
+    entry = dict(mtime=stat.st_mtime, size=stat.st_size,
+                 filetype=match.group(1) if match else None, domain=int(match.group(2)) if match else None,
+                 begin=str(timestamps[0]), end=str(timestamps[-1]), nrec=len(dataset.dimensions[time_dim]),
+                 xtime=xrange, variables=sorted(dataset.variables.keys()))
+  return entry
+
+def isValidEntry(entry, filepath):
+  ''' check if a catalog entry is still valid, i.e. if modification time and size of the file did not change '''
+  if entry is None or not os.path.exists(filepath): return False
+  stat = os.stat(filepath)
+  return entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size
+
+def loadCatalog(folder):
+  ''' load the file catalog from a folder (not the input folder); returns an empty catalog, if there is no
+      (valid) catalog file '''
+  filepath = os.path.join(folder, catalog_file)
+  catalog = dict()
+  if os.path.exists(filepath):
+    try:
+      with open(filepath, 'r') as f: content = json.load(f)
+      if content.get('version') == catalog_version: catalog = content['files']
+    except (IOError, ValueError):
+      pass # a corrupted catalog is simply rebuilt
+  return catalog
+
+def updateCatalog(catalog, folder, filelist, **kwargs):
+  ''' add new or modified files to the catalog and remove entries for files that no longer exist;
+      returns the number of files that had to be opened '''
+  for filename in list(catalog.keys()):
+    if not os.path.exists(os.path.join(folder, filename)): del catalog[filename]
+  nnew = 0
+  for filename in filelist:
+    filepath = os.path.join(folder, filename)
+    if not isValidEntry(catalog.get(filename,None), filepath):
+      catalog[filename] = getCatalogEntry(filepath, **kwargs)
+      nnew += 1
+  return nnew
+
+def saveCatalog(catalog, folder):
+  ''' write the catalog to the sidecar file; the file is replaced atomically, so that a crash can not corrupt it;
+      returns False, if the folder is not writable '''
+  filepath = os.path.join(folder, catalog_file)
+  tmpfilepath = filepath + '.tmp'
+  if not os.access(folder, os.W_OK): return False # e.g. read-only folder; the catalog is only a cache
+  try:
+    with open(tmpfilepath, 'w') as f: json.dump(dict(version=catalog_version, files=catalog), f, indent=1, sort_keys=True)
+    os.replace(tmpfilepath, filepath)
+  except (IOError, OSError):
+    if os.path.exists(tmpfilepath): os.remove(tmpfilepath)
+    return False # e.g. quota exceeded; the catalog is only a cache
+  return True
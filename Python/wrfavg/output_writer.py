@@ -0,0 +1,140 @@
+'''
+Created on 2026-10-18
+
+A module providing a simple wrapper for netCDF output datasets, which are written to incrementally (e.g. one
+month or one input file at a time). The dataset is kept open between writes and memory use is bounded by
+limiting the HDF5 chunk cache of each variable; closing and re-opening the dataset after every write is
+only used as a fallback.
+Existing datasets are protected while they are modified, either by a copy-on-write clone (reflink), by a small
+JSON journal that records the number of committed records (the dataset is modified in place), or by a full copy
+(see prepareOutputFile); the carry-over state of derived variables at the end of the last committed record is
+saved alongside, so that incremental jobs can resume (see saveState).
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, gc, json, pickle, shutil
+import netCDF4 as nc
+
+# suffixes of the sidecar files for incremental appends (journal and carry-over state)
+journal_suffix = '.journal'
+state_suffix = '.state'
+journal_version = 1 # increment, if the journal format changes
+FICLONE = 0x40049409 # Linux ioctl request code for copy-on-write clones (Btrfs, XFS, ZFS, etc.)
+
+
+class OutputWriter(object):
+  ''' A wrapper for a netCDF dataset that is kept open while data is appended. '''
+
+  def __init__(self, filepath, mode='a', cachesize=None, lreopen=False, format='NETCDF4'):
+    ''' Open (or create) the dataset; cachesize is the chunk cache size per variable in bytes (None means
+        netCDF default) and lreopen enables closing and re-opening the dataset on every flush. '''
+    self.filepath = filepath # needed to re-open
+    self.format = format
+    self.cachesize = cachesize # chunk cache size per variable (bytes)
+    self.lreopen = lreopen # fallback: close and re-open dataset to free memory
+    self.dataset = nc.Dataset(filepath, mode=mode, format=format)
+    self.setChunkCache()
+
+  def setChunkCache(self):
+    ''' limit the chunk cache of all variables, so that written data does not accumulate in memory '''
+    if self.cachesize is not None:
+      for var in self.dataset.variables.values():
+        var.set_var_chunk_cache(size=self.cachesize)
+    # N.B.: variables can be added after opening, so this has to be repeated on every flush
+
+  def flush(self):
+    ''' write data to disk and return the dataset handle (which changes, if the dataset was re-opened) '''
+    self.dataset.sync()
+    if self.lreopen:
+      self.dataset.close() # close dataset
+      gc.collect() # clean up memory
+      # N.B.: older versions of the netCDF4 module kept all data written to a file in memory
+      self.dataset = nc.Dataset(self.filepath, mode='a', format=self.format) # re-open to append more data (mode='a')
+    self.setChunkCache()
+    return self.dataset
+
+  def close(self):
+    ''' sync and close the dataset '''
+    self.dataset.sync()
+    self.dataset.close()
+
+
+## strategies to protect existing datasets while they are modified
+
+def cloneFile(filepath, clonepath):
+  ''' create a copy-on-write clone of a file (reflink); returns False, if this is not supported '''
+  try: import fcntl
+  except ImportError: return False # not a POSIX system
+  try:
+    with open(filepath, 'rb') as fsrc, open(clonepath, 'wb') as fdst:
+      fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+  except (IOError, OSError):
+    if os.path.exists(clonepath): os.remove(clonepath)
+    return False # e.g. different file systems or no reflink support
+  shutil.copymode(filepath, clonepath) # same as shutil.copy
+  return True
+
+def prepareOutputFile(filepath, tmpfilepath, strategies=('reflink','journal','copy'), ljournal=True):
+  ''' prepare an existing dataset for modification with the first strategy that works: 'reflink' creates a
+      copy-on-write clone in tmpfilepath, 'journal' modifies the dataset in place (pending records are journaled,
+      see saveJournal) and 'copy' creates a full copy in tmpfilepath; returns the strategy and the bytes copied '''
+  for strategy in strategies:
+    if strategy == 'reflink':
+      if cloneFile(filepath, tmpfilepath): return strategy, 0 # data blocks are shared until they are modified
+    elif strategy == 'journal':
+      # N.B.: journaling only works, if records are appended or overwritten (ljournal); files with other hard
+      #       links (e.g. backups made with 'cp -l') would be modified as well
+      if ljournal and os.stat(filepath).st_nlink == 1: return strategy, 0
+    elif strategy == 'copy':
+      shutil.copy(filepath, tmpfilepath)
+      return strategy, os.path.getsize(filepath)
+    else: raise ValueError("Unknown output file strategy: '{}'".format(strategy))
+  raise IOError("None of the strategies {} can be used to modify '{}'.".format(list(strategies), filepath))
+
+
+## journal and carry-over state for incremental appends
+
+def replaceFile(filepath, write, mode='w'):
+  ''' write a file with the function write (which takes a file object) and replace the file atomically '''
+  tmpfilepath = filepath + '.tmp'
+  with open(tmpfilepath, mode) as f:
+    write(f)
+    f.flush(); os.fsync(f.fileno()) # make sure the content is on disk, before the file is replaced
+  os.replace(tmpfilepath, filepath)
+
+def loadJournal(filepath):
+  ''' load the journal of a dataset; returns None, if there is no (valid) journal '''
+  journalpath = filepath + journal_suffix
+  if not os.path.exists(journalpath): return None
+  try:
+    with open(journalpath, 'r') as f: journal = json.load(f)
+  except (IOError, ValueError):
+    return None # a corrupted journal is ignored; the time axis is checked instead
+  return journal if journal.get('version') == journal_version else None
+
+def saveJournal(filepath, committed, **kwargs):
+  ''' record the number of committed records (and other attributes, e.g. the end date) of a dataset '''
+  journal = dict(version=journal_version, committed=int(committed), **kwargs)
+  replaceFile(filepath + journal_suffix, lambda f: json.dump(journal, f, indent=1, sort_keys=True))
+
+def removeJournal(filepath):
+  ''' remove the journal after the dataset was closed properly '''
+  if os.path.exists(filepath + journal_suffix): os.remove(filepath + journal_suffix)
+
+def loadState(filepath, committed):
+  ''' load the carry-over state that belongs to the given number of committed records; returns None, if
+      there is no state file or if it belongs to a different record '''
+  statepath = filepath + state_suffix
+  if not os.path.exists(statepath): return None
+  try:
+    with open(statepath, 'rb') as f: state = pickle.load(f)
+  except Exception:
+    return None # incompatible or corrupted state file
+  return state['tmpdata'] if state.get('committed') == committed else None
+
+def saveState(filepath, committed, tmpdata):
+  ''' save the carry-over state (temporary storage of derived variables) after the last committed record '''
+  state = dict(committed=int(committed), tmpdata=tmpdata)
+  replaceFile(filepath + state_suffix, lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL), mode='wb')
@@ -0,0 +1,121 @@
+'''
+Created on 2026-10-18
+
+A module providing lightweight instrumentation for the averaging script: wall-clock timers that are accumulated
+by processing phase (e.g. opening files, reading variables, computing derived variables, aggregation and writing)
+and by key within a phase (e.g. variable name or derived variable class), counters for bytes read, and the memory
+use of the process (the resident set size at the start and the peak). A timer only costs two calls to perf_counter and a short lock, so that profiling can
+be left on in production. The report is saved as a JSON file.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+## imports
+import os, sys, json, time, threading
+try: import resource
+except ImportError: resource = None # not available on all platforms
+
+
+def getRSS():
+  ''' return the current resident set size of the current process in MB (None, if it is not available) '''
+  try:
+    with open('/proc/self/statm') as f: pages = int(f.read().split()[1]) # only available on Linux
+  except (IOError, OSError, ValueError, IndexError): return None
+  return pages * os.sysconf('SC_PAGE_SIZE') / 1024.**2
+
+def getPeakRSS():
+  ''' return the peak resident set size of the current process in MB (None, if it is not available);
+      N.B.: this is the high-water mark over the lifetime of the process, so in a worker of a process pool,
+            it includes earlier tasks of the same worker '''
+  if resource is None: return None
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # N.B.: Linux reports kilobytes, macOS bytes
+  return maxrss / 1024.**2 if sys.platform == 'darwin' else maxrss / 1024.
+
+
+class Timer(object):
+  ''' A context manager that adds the elapsed time of a block (and bytes, if set) to a profiler entry. '''
+
+  def __init__(self, profiler, phase, key=None, nbytes=0):
+    self.profiler = profiler; self.phase = phase; self.key = key
+    self.nbytes = nbytes # can be set inside the block, e.g. after reading data
+    self.start = None
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    self.profiler.add(self.phase, key=self.key, seconds=time.perf_counter()-self.start, nbytes=self.nbytes)
+    return False # don't suppress exceptions
+
+
+class NullTimer(object):
+  ''' A context manager that does nothing (used when profiling is disabled). '''
+  nbytes = 0
+
+  def __enter__(self): return self
+
+  def __exit__(self, *exc): return False
+
+
+class Profiler(object):
+  '''
+    Accumulates timers and byte counts by phase and key; timers can be used in threads (e.g. derived variables),
+    in which case the sum of the timers of a phase can exceed the wall-clock time.
+  '''
+
+  def __init__(self, lenabled=True):
+    ''' Initialize an empty profile; if lenabled is False, timers are no-ops. '''
+    self.lenabled = lenabled
+    self.phases = dict() # phase -> dict(seconds, count, bytes, keys=dict(key -> dict(seconds, count, bytes)))
+    self.lock = threading.Lock()
+    self.start = time.perf_counter()
+    self.start_rss = getRSS(); self.start_peak_rss = getPeakRSS() # a pool worker may have run other tasks before
+    self.null_timer = NullTimer()
+
+  def timer(self, phase, key=None, nbytes=0):
+    ''' return a context manager that times a block of code '''
+    if self.lenabled: return Timer(self, phase, key=key, nbytes=nbytes)
+    else: return self.null_timer
+
+  def add(self, phase, key=None, seconds=0., nbytes=0):
+    ''' add time and bytes to the totals of a phase and a key '''
+    if not self.lenabled: return
+    with self.lock:
+      entry = self.phases.get(phase)
+      if entry is None: entry = self.phases[phase] = dict(seconds=0., count=0, bytes=0, keys=dict())
+      entries = [entry]
+      if key is not None:
+        if key not in entry['keys']: entry['keys'][key] = dict(seconds=0., count=0, bytes=0)
+        entries.append(entry['keys'][key])
+      for entry in entries:
+        entry['seconds'] += seconds; entry['count'] += 1; entry['bytes'] += int(nbytes)
+
+  def report(self, **kwargs):
+    ''' return the profile as a dictionary; keyword arguments are added as meta data '''
+    report = dict(kwargs)
+    report['wall_seconds'] = time.perf_counter() - self.start
+    report['pid'] = os.getpid() # the peak is per process (i.e. per worker) and cumulative over its tasks
+    report['start_rss_mb'] = self.start_rss; report['start_peak_rss_mb'] = self.start_peak_rss
+    report['peak_rss_mb'] = getPeakRSS()
+    # N.B.: the peak was only reached during this task, if it is higher than the peak at the start
+    if report['peak_rss_mb'] is None or self.start_peak_rss is None: report['peak_in_task'] = None
+    else: report['peak_in_task'] = report['peak_rss_mb'] > self.start_peak_rss
+    with self.lock:
+      report['bytes_read'] = self.phases['read']['bytes'] if 'read' in self.phases else 0
+      phases = dict()
+      for phase,entry in self.phases.items():
+        keys = sorted(entry['keys'].items(), key=lambda item: item[1]['seconds'], reverse=True) # most expensive first
+        phases[phase] = dict(seconds=entry['seconds'], count=entry['count'], bytes=entry['bytes'],
+                             keys={str(key):dict(value) for key,value in keys})
+    report['phases'] = phases
+    return report
+
+  def save(self, filepath, **kwargs):
+    ''' save the profile as a JSON file; keyword arguments are added as meta data '''
+    report = self.report(**kwargs)
+    tmpfilepath = filepath + '.tmp'
+    with open(tmpfilepath, 'w') as f: json.dump(report, f, indent=1)
+    os.replace(tmpfilepath, filepath)
+    return report
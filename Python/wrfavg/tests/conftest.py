@@ -0,0 +1,28 @@
+'''
+Created on 2026-10-18
+
+Shared helpers for the tests of the averaging module: a guard for tests that depend on GeoPy (through the derived
+variables) and a factory for reproducible random test data.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+
+
+def importDerivedVariables():
+  ''' import the derived variables module, or skip the calling test module (or test), if GeoPy is not available '''
+  pytest.importorskip('utils.nctools') # derived_variables depends on GeoPy
+  import wrfavg.derived_variables as dv
+  return dv
+
+def getData(shape, seed=0, offset=0., lwalk=False, nanfrac=0., dtype=np.float32):
+  ''' normally distributed values around offset (single precision, like derived variables); a random walk along
+      the first axis (lwalk) has long runs above and below the offset; a fraction of the values can be NaN '''
+  rng = np.random.default_rng(seed)
+  data = rng.normal(size=shape)
+  if lwalk: data = np.cumsum(data, axis=0) / 4.
+  data = offset + data
+  if nanfrac > 0: data[rng.random(shape) < nanfrac] = np.NaN
+  return data.astype(dtype)
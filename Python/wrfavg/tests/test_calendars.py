@@ -0,0 +1,119 @@
+'''
+Created on 2026-10-18
+
+Equivalence tests for the vectorized calendar arithmetic: time deltas have to match the original per-file
+computation with datetime (including the detection of missing leap days), and timestamps have to round-trip
+in all supported calendars.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import calendar
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+import wrfavg.calendars as calendars
+from wrfavg.tests.conftest import importDerivedVariables
+
+
+def calcTimeDelta(timestamps, year=None, month=None):
+  ''' the original implementation (from derived_variables): time delta with leap-day correction '''
+  y1, m1, d1 = tuple( int(i) for i in timestamps[0][:10].split('-') )
+  y2, m2, d2 = tuple( int(i) for i in timestamps[-1][:10].split('-') )
+  if year is None: year = y1
+  if month is None: month = m1
+  dt1 = datetime.strptime(timestamps[0], '%Y-%m-%d_%H:%M:%S')
+  dt2 = datetime.strptime(timestamps[-1], '%Y-%m-%d_%H:%M:%S')
+  delta = float( (dt2-dt1).total_seconds() )
+  n = len(timestamps)
+  if month == 2 and calendar.isleap(year):
+    ld = datetime(year, 2, 29) # datetime of leap day
+    if ( d1 == 29 or  d2 == 29 ):
+      lsubld = False  # trivial case; will be handled correctly by datetime
+    elif dt1 < ld < dt2:
+      ild = int( ( n - 1 ) * float( ( ld - dt1 ).total_seconds() ) / delta ) # index of leap-day
+      lsubld = True # subtract, unless leap day is found
+      while lsubld and ild < n:
+        yy, mm, dd = tuple( int(i) for i in timestamps[ild][:10].split('-') )
+        if mm == 3: break
+        if dd == 29: lsubld = False
+        ild += 1 # increment leap day search
+    else:
+      lsubld = False # no leap day in interval
+    if lsubld: delta -= 86400. # subtract leap day from period
+  return delta
+
+def getTimeStamps(begin, end, hours=6, lleap=True):
+  ''' timestamps between begin and end (inclusive); leap days are skipped, if lleap is False '''
+  dt = datetime.strptime(begin, '%Y-%m-%d_%H:%M:%S'); dtend = datetime.strptime(end, '%Y-%m-%d_%H:%M:%S')
+  timestamps = []
+  while dt <= dtend:
+    if lleap or not ( dt.month == 2 and dt.day == 29 ): timestamps.append(dt.strftime('%Y-%m-%d_%H:%M:%S'))
+    dt += timedelta(hours=hours)
+  return timestamps
+
+# files around Feb 29 1980 (begin and end of each file), and a non-leap year for comparison
+intervals = [('1980-02-01_00:00:00','1980-03-01_00:00:00'), ('1980-02-01_00:00:00','1980-02-28_18:00:00'),
+             ('1980-02-28_00:00:00','1980-03-01_00:00:00'), ('1980-02-28_18:00:00','1980-03-01_00:00:00'),
+             ('1980-02-29_00:00:00','1980-03-01_00:00:00'), ('1980-02-15_06:00:00','1980-02-29_18:00:00'),
+             ('1980-01-01_00:00:00','1980-02-01_00:00:00'), ('1979-02-01_00:00:00','1979-03-01_00:00:00'),
+             ('1979-12-01_00:00:00','1980-01-01_00:00:00')]
+
+
+@pytest.mark.parametrize('lleap', [True, False])
+@pytest.mark.parametrize('begin,end', intervals)
+def test_matches_calcTimeDelta(begin, end, lleap):
+  timestamps = getTimeStamps(begin, end, lleap=lleap)
+  reference = calcTimeDelta(timestamps)
+  assert calendars.getTimeDelta(timestamps) == reference
+  # character arrays (as read from netCDF) give the same result
+  chars = np.array([list(timestamp) for timestamp in timestamps], dtype='S1')
+  assert calendars.getTimeDelta(chars) == reference
+
+def test_missing_leap_day():
+  with_leap = getTimeStamps('1980-02-01_00:00:00','1980-03-01_00:00:00')
+  without = getTimeStamps('1980-02-01_00:00:00','1980-03-01_00:00:00', lleap=False)
+  assert calendars.getTimeDelta(with_leap) == 29*86400.
+  assert calendars.getTimeDelta(without) == 28*86400.
+  assert calendars.getTimeDelta(without, calendar='noleap') == 28*86400.
+  # a year of GCM-driven output without leap days
+  year = getTimeStamps('1980-01-01_00:00:00','1981-01-01_00:00:00', hours=24, lleap=False)
+  assert calendars.getSkippedLeapDays(calendars.parseTimeStamps(year)) == 1
+  assert calendars.getTimeDelta(year) == 365*86400.
+  assert np.all(calendars.getTimeDeltas(calendars.parseTimeStamps(year), calendar='noleap') == 86400)
+
+@pytest.mark.parametrize('cal', ['standard', 'noleap', '360_day'])
+def test_timestamps_roundtrip(cal):
+  timestamps = getTimeStamps('1979-12-25_00:00:00','1981-03-05_00:00:00', hours=9, lleap=cal == 'standard')
+  if cal == '360_day': timestamps = [ts for ts in timestamps if int(ts[8:10]) <= 30]
+  fields = calendars.parseTimeStamps(timestamps)
+  seconds = calendars.getSeconds(fields, calendar=cal)
+  assert list(calendars.getTimeStamps(seconds, calendar=cal)) == timestamps
+  if cal == 'standard':
+    epoch = datetime(1970,1,1)
+    assert seconds.tolist() == [int((datetime.strptime(ts, '%Y-%m-%d_%H:%M:%S')-epoch).total_seconds()) for ts in timestamps]
+
+def test_getMissingLeapDays():
+  timestamps = getTimeStamps('1980-02-27_00:00:00','1980-03-03_00:00:00', hours=24, lleap=False)
+  fields = calendars.parseTimeStamps(timestamps)
+  assert calendars.getMissingLeapDays(fields).tolist() == [0,0,1,1,1]
+  # the leap day can also be missing between two files
+  assert calendars.getMissingLeapDays(fields[2:], previous=fields[1]).tolist() == [1,1,1]
+  fields = calendars.parseTimeStamps(getTimeStamps('1980-02-27_00:00:00','1980-03-03_00:00:00', hours=6))
+  assert not calendars.getMissingLeapDays(fields).any()
+
+@pytest.mark.parametrize('lleap', [True, False])
+def test_time_of_convection(lleap):
+  dv = importDerivedVariables()
+  # daily output around Feb 29 1980, split into two files at the leap day
+  timestamps = getTimeStamps('1980-02-20_00:00:00','1980-03-10_00:00:00', hours=24, lleap=lleap)
+  minutes = np.arange(len(timestamps)) * 1440 # model time since simulation start
+  tcv = ( minutes - 1440 + 300 ).reshape((-1,1,1)) * np.ones((1,2,3)) # convection at 5 am on the previous day
+  results = []
+  for cal in (None, 'standard' if lleap else 'noleap'):
+    devar = dv.TimeOfConvection(calendar=cal); devar.checked = True
+    const = dict(XLONG=np.zeros((1,2,3)))
+    results.append(np.concatenate([devar.computeValues({'Times':timestamps[i:j], 'TRAINCVMAX':tcv[i:j]}, const=const)
+                                   for i,j in ((0,9),(9,len(timestamps)))]))
+  np.testing.assert_array_equal(results[0], results[1])
+  assert np.all(results[0] == 300*60) # N.B.: a day off would give NaN (no convection on that day)
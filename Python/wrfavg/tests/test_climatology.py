@@ -0,0 +1,57 @@
+'''
+Created on 2026-10-18
+
+Tests for the running climatology statistics: the monthly climatology, seasonal and annual means and standard
+deviations that are written from the running sums (with records that were added while the monthly means were
+computed and records that are read from the monthly file) have to match a direct reduction of the monthly means.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import numpy as np
+import netCDF4 as nc
+from wrfavg.tests.conftest import importDerivedVariables, getData
+importDerivedVariables() # the averaging module depends on GeoPy, like the derived variables
+import wrfavg.wrfout_average as wa
+from wrfavg.climatology import Climatology, seasons, std_suffix
+
+nrec = 26 # Jan 1979 to Feb 1981; the last record is still in progress
+
+
+def writeMonthlyFile(filepath, data):
+  ''' a small monthly file like the output of the averaging script, with a time-independent field '''
+  ds = nc.Dataset(filepath, 'w', format='NETCDF4')
+  ds.createDimension('time', None); ds.createDimension('south_north', data.shape[1]); ds.createDimension('west_east', data.shape[2])
+  ds.createDimension('DateStrLen', 19)
+  ds.createVariable('time', 'i4', ('time',))[:] = np.arange(len(data))
+  ds.variables['time'][len(data)-1] = -1 # month in progress
+  ds.createVariable('Times', 'S1', ('time','DateStrLen'))[:] = np.zeros((len(data),19), dtype='S1')
+  ds.createVariable('HGT', 'f4', ('south_north','west_east'))[:] = np.ones(data.shape[1:])
+  var = ds.createVariable('T2', 'f4', ('time','south_north','west_east')); var.units = 'K'
+  var[:] = data
+  ds.begin_date = '1979-01-01'; ds.end_date = '1981-02-01'
+  return ds
+
+
+def test_matches_numpy(tmp_path, monkeypatch):
+  monkeypatch.setattr(wa, 'outfolder', str(tmp_path)+'/')
+  data = getData((nrec,3,4), offset=280.)
+  data[3,1,2] = np.NaN # a missing value
+  months = np.arange(nrec) % 12 + 1
+  monthly_dataset = writeMonthlyFile(str(tmp_path / 'wrfsrfc_d01_monthly.nc'), data)
+  # the first months were added while they were computed; the others are read from the file
+  climatology = Climatology()
+  for idx in range(10): climatology.add('T2', months[idx], data[idx], record=idx)
+  wa.writeClimatology(climatology, monthly_dataset, 'srfc', 1)
+  monthly_dataset.close()
+  assert climatology.counts['T2'].sum() == nrec-1 # every completed record is added once
+  # reference: direct reduction of all completed months in each group of calendar months
+  groups = dict(clim=[(month,) for month in range(1,13)], seasonal=list(seasons.values()), annual=[tuple(range(1,13))])
+  data = data[:nrec-1].astype(np.float64); months = months[:nrec-1]
+  for period,pattern in wa.climpatterns.items():
+    with nc.Dataset(str(tmp_path / pattern.format('srfc',1))) as ds:
+      assert 'HGT' in ds.variables and len(ds.dimensions['time']) == len(groups[period])
+      for n,group in enumerate(groups[period]):
+        idx = np.isin(months, group)
+        np.testing.assert_allclose(ds.variables['T2'][n].filled(np.NaN), data[idx].mean(axis=0), rtol=1e-6)
+        np.testing.assert_allclose(ds.variables['T2'+std_suffix][n].filled(np.NaN), data[idx].std(axis=0, ddof=1), rtol=1e-4)
@@ -0,0 +1,81 @@
+'''
+Created on 2026-10-18
+
+Equivalence test (and benchmark) for the blocked bitwise run-length kernel of ConsecutiveExtrema: the results
+and the carry-over state have to match the original loop over time steps, also when the data are split into
+several files and months. Run as a script to compare the run time of both implementations on an hourly slab.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables, getData
+dv = importDerivedVariables()
+
+
+def referenceLoop(data, threshold, thresmode, period, xcnt, lead=None, leadmonth=None, month=None):
+  ''' the original implementation (one step at a time); the counters are updated in-place '''
+  maxdata = np.zeros(data.shape[1:], dtype=np.dtype('int16'))
+  llead = lead is not None
+  if llead: leadopen = leadmonth < 0
+  for t in range(data.shape[0]):
+    if thresmode == 1: xmask = ( data[t,:] > threshold ) # above
+    elif thresmode == 0: xmask = ( data[t,:] < threshold ) # below
+    xnew = np.where(xmask,0,xcnt) * period # extract periods before reset
+    maxdata = np.maximum(maxdata,xnew)
+    if llead and leadopen.any():
+      lend = np.logical_and(leadopen, np.invert(xmask))
+      lead[lend] = xcnt[lend]; leadmonth[lend] = month; leadopen[lend] = False
+    xcnt[np.invert(xmask)] = 0
+    xcnt[xmask] += 1
+  return maxdata
+
+def getVariable(mode, threshold):
+  ''' a consecutive-day variable for a dummy base variable (prerequisites are assumed to be checked) '''
+  base = dv.DerivedVariable(name='T2', units='K', prerequisites=[], axes=('time','south_north','west_east'))
+  devar = dv.ConsecutiveExtrema(base, mode, threshold=threshold, name='ConTest')
+  devar.checked = True
+  return devar
+
+
+@pytest.mark.parametrize('mode', ['above','below'])
+@pytest.mark.parametrize('llead', [False, True])
+def test_matches_reference(mode, llead):
+  data = getData((400,6,5), offset=273.15, lwalk=True, nanfrac=0.001, dtype=np.float64)
+  devar = getVariable(mode, threshold=273.15)
+  devar.blocksize = 64 # several blocks per file
+  delta = 86400.
+  tmp = dict()
+  xcnt = np.zeros(data.shape[1:], dtype='int16')
+  if llead: lead = np.zeros_like(xcnt); leadmonth = np.zeros_like(xcnt) - 1
+  else: lead = leadmonth = None
+  # three months with two files each (carry-over between files and months)
+  for month,bounds in enumerate([(0,50,120), (120,200,260), (260,330,400)]):
+    if llead: tmp['COX_MONTH'] = month
+    for i,j in zip(bounds[:-1],bounds[1:]):
+      maxdata = devar.computeValues({'T2':data[i:j]}, aggax=0, delta=delta, tmp=tmp)
+      reference = referenceLoop(data[i:j], 273.15, devar.thresmode, 1., xcnt, lead, leadmonth, month)
+      np.testing.assert_array_equal(maxdata, reference)
+      np.testing.assert_array_equal(tmp[devar.tmpdata], xcnt)
+      if llead:
+        np.testing.assert_array_equal(tmp[devar.tmpdata+'_LEAD'][0], lead)
+        np.testing.assert_array_equal(tmp[devar.tmpdata+'_LEAD'][1], leadmonth)
+
+def test_aggregation_axis():
+  data = getData((100,6,5), offset=273.15, lwalk=True, nanfrac=0.001, dtype=np.float64)
+  devar = getVariable('above', threshold=273.15)
+  maxdata = devar.computeValues({'T2':np.moveaxis(data, 0, 2)}, aggax=2, delta=86400., tmp=dict())
+  reference = referenceLoop(data, 273.15, 1, 1., np.zeros(data.shape[1:], dtype='int16'))
+  np.testing.assert_array_equal(maxdata, reference)
+
+
+if __name__ == '__main__':
+  # benchmark on one month of hourly data (like srfc)
+  import timeit
+  data = getData((744,200,200), offset=273.15, lwalk=True, nanfrac=0.001, dtype=np.float64)
+  devar = getVariable('above', threshold=273.15)
+  told = min(timeit.repeat(lambda: referenceLoop(data, 273.15, 1, 1./24., np.zeros(data.shape[1:], dtype='int16')),
+                           number=1, repeat=3))
+  tnew = min(timeit.repeat(lambda: devar.computeValues({'T2':data}, aggax=0, delta=3600., tmp=dict()), number=1, repeat=3))
+  print('reference loop: {:6.3f} s, blocked kernel: {:6.3f} s, speed-up: {:4.1f}x'.format(told, tnew, told/tnew))
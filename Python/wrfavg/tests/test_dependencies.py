@@ -0,0 +1,66 @@
+'''
+Created on 2026-10-18
+
+Tests for the DependencyGraph of derived variables: the topological order, pruning and the concurrent
+scheduling of tasks have to give the same results as computing all variables serially in order.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from wrfavg.tests.conftest import importDerivedVariables
+dv = importDerivedVariables()
+
+# dependencies of a small graph (inputs are upper case): a diamond, a chain and an independent branch
+prerequisites = dict(d=['b','c'], b=['a'], c=['a','T2'], a=['T2'], e=['d','U10'], f=['U10'], g=['f'], h=['RAIN'])
+
+
+def getGraph(names):
+  ''' a graph of dummy derived variables, defined in the given order '''
+  return dv.DependencyGraph([dv.DerivedVariable(name=name, units='', prerequisites=prerequisites[name], axes=('time',))
+                             for name in names])
+
+def checkOrder(order):
+  ''' all derived prerequisites have to come first '''
+  for n,name in enumerate(order):
+    assert all(pq in order[:n] for pq in prerequisites[name] if pq in prerequisites)
+
+def compute(name, values):
+  ''' a value that depends on the values of all prerequisites (fails, if they are not available yet) '''
+  return 1 + sum(values[pq] for pq in prerequisites[name] if pq in prerequisites)
+
+
+def test_order():
+  names = ['e','d','h','c','g','b','f','a']
+  graph = getGraph(names)
+  checkOrder(graph.order)
+  assert len(graph.order) == len(names)
+  # an order that is already correct does not change
+  assert getGraph(graph.order).order == graph.order
+  assert graph.prune(['d']) == [name for name in graph.order if name in ('a','b','c','d')]
+  assert graph.inputs(graph.prune(['e'])) == {'T2','U10'}
+  depth = graph.depth()
+  assert depth['a'] == 0 and depth['d'] == 2 and depth['e'] == 3 and depth['h'] == 0
+
+def test_cycle():
+  prerequisites['a'] = ['d'] # a -> b -> d -> a
+  try:
+    with pytest.raises(dv.DerivedVariableError): getGraph(['a','b','c','d'])
+  finally: prerequisites['a'] = ['T2']
+
+@pytest.mark.parametrize('workers', [None, 1, 4])
+def test_schedule_matches_serial(workers):
+  graph = getGraph(['e','d','h','c','g','b','f','a'])
+  serial = dict()
+  for name in graph.order: serial[name] = compute(name, serial)
+  # one task per variable (the caller stores results, so tasks must only start after their prerequisites)
+  values = dict(); yielded = []
+  pool = ThreadPoolExecutor(max_workers=workers) if workers else None
+  try:
+    for task,result in graph.schedule([(name,) for name in graph.order], lambda task: compute(task[0], values), pool=pool):
+      values[task[0]] = result; yielded.append(task[0])
+  finally:
+    if pool is not None: pool.shutdown()
+  checkOrder(yielded)
+  assert values == serial
@@ -0,0 +1,49 @@
+'''
+Created on 2026-10-18
+
+Tests for ExpressionVariable: linear expressions are also computed from monthly means (without time axis), so
+the shape of the output has to follow the inputs, and inputs with fewer (inner) dimensions are broadcast.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables
+dv = importDerivedVariables()
+
+
+def getVariable(name):
+  devar = dv.ExpressionVariable(name)
+  devar.checked = True # prerequisites are assumed to be checked
+  return devar
+
+def getInputs(devar, shape, seed=0):
+  rng = np.random.default_rng(seed)
+  return {varname:rng.random(shape).astype(dv.dtype_float) for varname in devar.prerequisites}
+
+
+@pytest.mark.parametrize('name', ['LiquidPrecip', 'RunOff'])
+@pytest.mark.parametrize('shape', [(6,4,5), (4,5)]) # instantaneous values and monthly means
+def test_output_shape(name, shape):
+  devar = getVariable(name)
+  indata = getInputs(devar, shape)
+  outdata = devar.computeValues(indata)
+  assert outdata.shape == shape
+  # the same expression evaluated directly
+  namespace = dict(indata); namespace.update(devar.scalars)
+  np.testing.assert_allclose(outdata, eval(devar.expression, dict(), namespace), rtol=1e-6)
+  # masked inputs give masked outputs of the same shape
+  indata[devar.prerequisites[0]] = np.ma.masked_less(indata[devar.prerequisites[0]], 0.1)
+  outdata = devar.computeValues(indata)
+  assert outdata.shape == shape and np.ma.getmaskarray(outdata).any()
+
+@pytest.mark.parametrize('ltime', [True, False])
+def test_broadcast_levels(ltime):
+  devar = getVariable('HeatFlux_U')
+  shape = (6,3,4,5) if ltime else (3,4,5)
+  u = np.ones(shape, dtype=dv.dtype_float)
+  p = np.tile(np.asarray([85000.,50000.,25000.], dtype=dv.dtype_float), shape[:-3]+(1,)) # no horizontal axes
+  outdata = devar.computeValues({'U_PL':u, 'P_PL':p})
+  assert outdata.shape == shape
+  np.testing.assert_allclose(outdata[...,:,1,2], p * devar.scalars['cpMR'], rtol=1e-6)
@@ -0,0 +1,64 @@
+'''
+Created on 2026-10-18
+
+Equivalence test for the IntervalEngine: interval values that are computed from data split into several files
+(with partial reductions carried over) have to match one contiguous call and a direct reduction over intervals.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables, getData
+dv = importDerivedVariables()
+
+delta = 6*3600. # 6-hourly data, i.e. 4 steps per day
+
+
+def getMembers():
+  ''' daily and 5-day averages and the diurnal range of a dummy base variable, all sharing one engine '''
+  base = dv.DerivedVariable(name='T2', units='K', prerequisites=[], axes=('time','south_north','west_east'))
+  engine = dv.IntervalEngine()
+  members = [dv.MeanExtrema(base, 'max', interval=1, engine=engine),
+             dv.MeanExtrema(base, 'min', interval=5, engine=engine),
+             dv.ClimateIndex('DTR', base, engine=engine)]
+  return engine, members
+
+def getReference(data, member):
+  ''' reduce complete intervals directly '''
+  ilen = int(member.interval/delta); nint = data.shape[0]//ilen
+  data = data[:nint*ilen].reshape((nint,ilen)+data.shape[1:])
+  if member.reduction == 'mean': return data.astype(np.float64).mean(axis=1)
+  elif member.reduction == 'range': return data.max(axis=1) - data.min(axis=1)
+
+def computeSplit(data, bounds, aggax=0):
+  ''' call the engine once per file and collect the interval values of all members '''
+  engine, members = getMembers()
+  tmp = dict(); values = {member.name:[] for member in members}
+  for i,j in zip(bounds[:-1],bounds[1:]):
+    filedata = data[i:j] if aggax == 0 else np.moveaxis(data[i:j], 0, aggax)
+    for member in members:
+      intdata, ends = engine.compute(member, filedata, aggax=aggax, delta=delta, tmp=tmp)
+      if intdata is not None: values[member.name].append(intdata)
+  return members, values, tmp
+
+
+@pytest.mark.parametrize('bounds', [(0,3,50,51,90,130), (0,20,40,60,80,100,120,130), (0,1,2,130)])
+def test_split_matches_contiguous(bounds):
+  data = getData((130,4,3), offset=273.15)
+  members, values, tmp = computeSplit(data, bounds)
+  _, reference, reftmp = computeSplit(data, (0,130))
+  for member in members:
+    split = np.concatenate(values[member.name])
+    np.testing.assert_allclose(split, np.concatenate(reference[member.name]), rtol=1e-6)
+    np.testing.assert_allclose(split, getReference(data, member), rtol=1e-6)
+    # the remaining time steps are carried over in the same state
+    partials, count = tmp[member.tmpdata]; refpartials, refcount = reftmp[member.tmpdata]
+    assert count == refcount == 130 % int(member.interval/delta)
+    for partial,refpartial in zip(partials, refpartials): np.testing.assert_allclose(partial, refpartial, rtol=1e-6)
+
+def test_aggregation_axis():
+  data = getData((130,4,3), offset=273.15)
+  members, values, _ = computeSplit(data, (0,50,130), aggax=2)
+  for member in members:
+    np.testing.assert_allclose(np.concatenate(values[member.name]), getReference(data, member), rtol=1e-6)
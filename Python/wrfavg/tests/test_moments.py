@@ -0,0 +1,70 @@
+'''
+Created on 2026-10-18
+
+Equivalence test for the streaming variance and covariance aggregation: merging the moments of several batches
+of records (e.g. input files) has to give the same result as np.var and np.cov over all records at once.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables, getData
+dv = importDerivedVariables()
+
+batches = (0, 1, 25, 26, 100, 248) # uneven batches, including a single record
+offset = 280. # a large mean (like temperature), where naive sums of squares lose precision
+
+
+def getVariables():
+  axes = ('time','south_north','west_east')
+  var1 = dv.DerivedVariable(name='T2', units='K', prerequisites=[], axes=axes)
+  var2 = dv.DerivedVariable(name='RAIN', units='kg/m^2/s', prerequisites=[], axes=axes)
+  return var1, var2
+
+
+@pytest.mark.parametrize('aggax', [0, 2])
+def test_variance_matches_numpy(aggax):
+  data = getData((248,4,3), offset=offset)
+  aggregator = dv.MomentAggregator((4,3), mode='var')
+  for i,j in zip(batches[:-1],batches[1:]):
+    aggregator.aggregate(np.moveaxis(data[i:j], 0, aggax), aggax=aggax)
+  np.testing.assert_allclose(aggregator.result(), np.var(data.astype(np.float64), axis=0), rtol=1e-5)
+  # the next period starts from scratch
+  aggregator.reset()
+  aggregator.aggregate(np.moveaxis(data[:50], 0, aggax), aggax=aggax)
+  np.testing.assert_allclose(aggregator.result(), np.var(data[:50].astype(np.float64), axis=0), rtol=1e-5)
+
+def test_covariance_matches_numpy():
+  var1, var2 = getVariables()
+  devar = dv.Covariance(var1, var2)
+  devar.checked = True # prerequisites are assumed to be checked
+  data1 = getData((248,4,3), seed=1, offset=offset); data2 = getData((248,4,3), seed=2, offset=1e-4) * 1e-5 + data1 * 1e-6
+  aggregator = devar.getAggregator((4,3))
+  for i,j in zip(batches[:-1],batches[1:]):
+    aggregator.aggregate(devar.computeValues({'T2':data1[i:j], 'RAIN':data2[i:j]}, aggax=0), aggax=0)
+  reference = np.zeros((4,3))
+  for idx in np.ndindex(4,3):
+    reference[idx] = np.cov(data1[(slice(None),)+idx], data2[(slice(None),)+idx], bias=True)[0,1]
+  np.testing.assert_allclose(aggregator.result(), reference, rtol=1e-4)
+
+def test_subregions():
+  # tiles are aggregated into sub-regions and can have different numbers of records
+  data = getData((248,4,3), offset=offset)
+  aggregator = dv.MomentAggregator((4,3), mode='var')
+  for i,j in zip(batches[:-1],batches[1:]):
+    aggregator.aggregate(data[i:j,:2], index=(slice(0,2),))
+    aggregator.aggregate(data[i:j,2:], index=(slice(2,4),))
+  aggregator.aggregate(data[:10,2:], index=(slice(2,4),)) # additional records in one tile
+  np.testing.assert_allclose(aggregator.result()[:2], np.var(data[:,:2].astype(np.float64), axis=0), rtol=1e-5)
+  np.testing.assert_allclose(aggregator.result()[2:], np.var(np.concatenate([data[:,2:],data[:10,2:]]).astype(np.float64), axis=0), rtol=1e-5)
+
+def test_masked_values():
+  data = np.ma.masked_array(getData((100,4,3), offset=offset), mask=False)
+  data.mask[30,1,1] = True
+  aggregator = dv.MomentAggregator((4,3), mode='var')
+  aggregator.aggregate(data[:50]); aggregator.aggregate(data[50:])
+  result = aggregator.result()
+  assert np.isnan(result[1,1]) and np.isfinite(result).sum() == 11
+  empty = dv.MomentAggregator((4,3), mode='var')
+  assert np.all(np.isnan(empty.result())) # no records
@@ -0,0 +1,59 @@
+'''
+Created on 2026-10-18
+
+Equivalence test for mass-weighted pressure integrals with cached Simpson weights: the weighted sum over levels
+has to match the original integration of a zero-padded array with scipy's Simpson rule.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from scipy.integrate import simps
+from wrfavg.tests.conftest import importDerivedVariables
+dv = importDerivedVariables()
+
+RMg = np.asarray( 8.3144621 / ( 0.01802 *  9.80616 ), dtype=dv.dtype_float)
+
+
+def referenceIntegral(var, T, p, RMg):
+  ''' the original implementation (padded array with zero boundaries, integrated on every call) '''
+  tmpshape = list(T.shape)
+  tmpshape[1] += 2 # add two levels (integral boundaries)
+  tmpdata = np.zeros(tmpshape, dtype=dv.dtype_float)
+  pax = np.zeros((tmpshape[1],), dtype=dv.dtype_float)
+  pax[1:-1] = p[0,:]; pax[0] = 1.e5; pax[-1] = 0. # pad with zero-boundaries
+  pax = -1 * pax # invert, since we are integrating in the wrong direction
+  var = np.nan_to_num(var); T = np.nan_to_num(T)
+  tmpdata[:,1:-1,:] = RMg * var * T / p.reshape(p.shape+(1,1))
+  return simps(tmpdata, pax, axis=1, even='first')
+
+def getData(plev, seed=0, lnan=False):
+  rng = np.random.default_rng(seed)
+  shape = (3,len(plev),5,4)
+  T = ( 250. + 30.*rng.random(shape) ).astype(dv.dtype_float)
+  var = rng.random(shape).astype(dv.dtype_float) * 1e-2
+  if lnan: var[rng.random(shape) < 0.05] = np.NaN; T[rng.random(shape) < 0.05] = np.NaN
+  p = np.tile(np.asarray(plev, dtype=dv.dtype_float), (shape[0],1))
+  return var, T, p
+
+
+@pytest.mark.parametrize('plev', [(85000.,70000.,50000.,25000.,10000.), (92500.,85000.,70000.,50000.)])
+@pytest.mark.parametrize('lnan', [False, True])
+def test_matches_simps(plev, lnan):
+  var, T, p = getData(plev, lnan=lnan)
+  reference = referenceIntegral(var, T, p, RMg)
+  np.testing.assert_allclose(dv.pressureIntegral(var, T, p, RMg), reference, rtol=1e-5)
+  # weights can be shared between several integrands
+  weights = dv.pressureWeights(T, p, RMg)
+  np.testing.assert_allclose(dv.pressureIntegral(var, T, p, RMg, weights=weights), reference, rtol=1e-5)
+
+def test_weight_cache():
+  plev = (85000.,70000.,50000.,25000.,10000.)
+  weights = dv.getSimpsonWeights(plev)
+  assert dv.getSimpsonWeights(np.asarray(plev)) is weights # computed only once per set of levels
+  # integrating a unit vector is the same as integrating the padded array
+  pax = -1 * np.asarray((1.e5,)+plev+(0.,))
+  for k in range(len(plev)):
+    unit = np.zeros(len(pax)); unit[k+1] = 1.
+    np.testing.assert_allclose(weights[k], simps(unit, pax, even='first'), rtol=1e-6)
@@ -0,0 +1,36 @@
+'''
+Created on 2026-10-18
+
+Tests for the streaming Resampler: daily values that are resampled from segments of 6-hourly records (e.g. input
+files that do not begin or end with a day) have to match a direct reduction of the records of each day.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables, getData
+dv = importDerivedVariables()
+
+ndays = 10; nday = 4 # 6-hourly records
+delta = 6*3600.
+segments = (0, 3, 4, 17, 24, 25, ndays*nday) # uneven segments, including a single record
+
+
+@pytest.mark.parametrize('reduction', ['mean', 'min', 'max', 'sum'])
+def test_matches_numpy(reduction):
+  data = getData((ndays*nday,4,3))
+  timestamps = np.datetime64('1979-01-01T00:00:00','s') + np.arange(ndays*nday) * np.timedelta64(int(delta),'s')
+  resampler = dv.Resampler(86400, origin='1979-01-01T00:00:00', reductions=dict(T2=reduction))
+  results = []; intervals = []
+  for i,j in zip(segments[:-1],segments[1:]):
+    nextstamp = timestamps[j] if j < len(timestamps) else timestamps[-1] + np.timedelta64(int(delta),'s')
+    intervals.extend(resampler.advance(timestamps[i:j], nextstamp))
+    result = resampler.resample('T2', data[i:j], aggax=0, delta=delta)
+    if result is not None: results.append(result)
+  assert intervals == list(range(ndays))
+  daily = data.reshape((ndays,nday)+data.shape[1:]).astype(np.float64)
+  results = np.concatenate(results)
+  if reduction == 'sum': results /= delta; reference = daily.sum(axis=1) # time integrals in units of the time step
+  else: reference = getattr(daily, reduction)(axis=1)
+  np.testing.assert_allclose(results, reference, rtol=1e-5, atol=1e-6)
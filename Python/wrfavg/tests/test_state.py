@@ -0,0 +1,78 @@
+'''
+Created on 2026-10-18
+
+Round-trip tests for incremental appends: the journal and the carry-over state of derived variables are saved
+after every committed month, and a job that resumes from the saved state has to produce the same values as
+a job that runs without interruption.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import copy, os
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables, getData
+from wrfavg.output_writer import loadJournal, saveJournal, removeJournal, loadState, saveState, journal_suffix, state_suffix
+
+
+def test_journal(tmp_path):
+  filepath = str(tmp_path / 'wrfsrfc_d01_monthly.nc')
+  assert loadJournal(filepath) is None
+  saveJournal(filepath, 3, end_date='1979-03-01')
+  assert loadJournal(filepath) == dict(version=1, committed=3, end_date='1979-03-01')
+  saveJournal(filepath, 4, end_date='1979-04-01') # replaced atomically
+  assert loadJournal(filepath)['committed'] == 4
+  assert not os.path.exists(filepath + journal_suffix + '.tmp')
+  with open(filepath + journal_suffix, 'w') as f: f.write('{"version": 1, "comm') # interrupted write
+  assert loadJournal(filepath) is None
+  removeJournal(filepath)
+  assert not os.path.exists(filepath + journal_suffix)
+
+def test_state(tmp_path):
+  filepath = str(tmp_path / 'wrfsrfc_d01_monthly.nc')
+  tmpdata = {'MEX_MaxT2_5d':([np.arange(6.).reshape((2,3))], 7), 'COX_ConAbT2':np.ones((2,3), dtype='int16'),
+             'COX_DELTA':3600.}
+  saveState(filepath, 2, tmpdata)
+  state = loadState(filepath, 2)
+  assert set(state.keys()) == set(tmpdata.keys())
+  np.testing.assert_array_equal(state['MEX_MaxT2_5d'][0][0], tmpdata['MEX_MaxT2_5d'][0][0])
+  assert state['MEX_MaxT2_5d'][1] == 7 and state['COX_DELTA'] == 3600.
+  assert state['COX_ConAbT2'].dtype == np.dtype('int16')
+  assert loadState(filepath, 3) is None # state belongs to a different record
+  with open(filepath + state_suffix, 'wb') as f: f.write(b'\x80\x05corrupted')
+  assert loadState(filepath, 2) is None
+
+
+def runJob(data, months, tmpdata, devars, delta):
+  ''' compute monthly values of all derived variables and yield them with the carry-over state after every month '''
+  for month,(i,j) in months:
+    values = {devar.name:devar.computeValues({'T2':data[i:j]}, aggax=0, delta=delta, tmp=tmpdata) for devar in devars}
+    yield month, values, copy.deepcopy(tmpdata)
+
+@pytest.mark.parametrize('committed', [1, 2])
+def test_resume_matches_uninterrupted(tmp_path, committed):
+  dv = importDerivedVariables()
+  def getVariables():
+    ''' new instances for every job (only the state in tmpdata is carried over) '''
+    base = dv.DerivedVariable(name='T2', units='K', prerequisites=[], axes=('time','south_north','west_east'))
+    engine = dv.IntervalEngine()
+    devars = [dv.MeanExtrema(base, 'max', interval=5, engine=engine), dv.MeanExtrema(base, 'min', interval=1, engine=engine),
+              dv.ConsecutiveExtrema(base, 'above', threshold=273.15, name='ConTest')]
+    for devar in devars: devar.checked = True
+    return devars
+  filepath = str(tmp_path / 'wrfsrfc_d01_monthly.nc')
+  data = getData((4*90,4,3), offset=273.15, lwalk=True)
+  months = list(enumerate([(0,4*31+2), (4*31+2,4*59+1), (4*59+1,4*90)])) # month ends do not match intervals
+  delta = 6*3600.
+  # uninterrupted job
+  reference = [values for month,values,state in runJob(data, months, dict(), getVariables(), delta)]
+  # the first job is interrupted after the committed months; the second job resumes from the saved state
+  for month,values,state in runJob(data, months[:committed], dict(), getVariables(), delta):
+    saveState(filepath, month+1, state); saveJournal(filepath, month+1)
+  committed = loadJournal(filepath)['committed']
+  tmpdata = copy.deepcopy(loadState(filepath, committed))
+  resumed = [values for month,values,state in runJob(data, months[committed:], tmpdata, getVariables(), delta)]
+  for values,refvalues in zip(resumed, reference[committed:]):
+    for name,refvalue in refvalues.items():
+      if refvalue is None: assert values[name] is None
+      else: np.testing.assert_array_equal(values[name], refvalue)
@@ -0,0 +1,66 @@
+'''
+Created on 2026-10-18
+
+Tests for spatial tiling: monthly aggregates of base variables and derived variables (including central
+differences, which are computed with a halo of neighbouring rows) have to be bit-identical, when a small
+plev3d-like domain is processed in bands of rows along south_north, down to tiles with a single row.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables, getData
+dv = importDerivedVariables()
+
+nt, nlev, ny, nx = 6, 3, 7, 5 # time, num_press_levels_stag, south_north, west_east
+tax = 0; snax = 2 # time and tile axis
+
+
+def getTiles(nrow, halo):
+  ''' bands of rows with a halo on either side (the same as in processFileList) '''
+  return [(j0, min(j0+nrow,ny), min(halo,j0), min(halo,ny-min(j0+nrow,ny))) for j0 in range(0,ny,nrow)]
+
+def tileIndex(tile, mode, ndim=4, axis=snax):
+  ''' index of a tile along the tile axis: 'read' includes the halo, 'core' extracts the core from an array
+      that includes the halo, and 'agg' is the position of the core in the whole domain '''
+  j0,j1,h0,h1 = tile
+  tslc = dict(read=slice(j0-h0,j1+h1), core=slice(h0,h0+j1-j0), agg=slice(j0,j1))[mode]
+  return (slice(None),)*axis + (tslc,) + (slice(None),)*(ndim-axis-1)
+
+def getVariables(cache):
+  devars = [dv.Vorticity(), dv.OrographicIndexPlev()]
+  for devar in devars: devar.checked = True; devar.cache = cache
+  return devars
+
+def aggregate(indata, const, tiles, mode):
+  ''' aggregate base and derived variables in the whole domain (tiles is None) or tile by tile '''
+  cache = dv.IntermediateCache()
+  devars = getVariables(cache)
+  aggregators = {varname:dv.Aggregator((nlev,ny,nx), mode=mode) for varname in list(indata.keys())+[devar.name for devar in devars]}
+  for tile in tiles or [None]:
+    cache.scope = tile # intermediate results (e.g. topographic gradients) depend on the tile
+    if tile is None: tiledata = indata; tileconst = const
+    else:
+      tiledata = {varname:data[tileIndex(tile, 'read')] for varname,data in indata.items()}
+      tileconst = {cname:cval[tileIndex(tile, 'read', ndim=3, axis=1)] if np.ndim(cval) == 3 else cval for cname,cval in const.items()}
+    values = {devar.name:devar.computeValues(tiledata, aggax=tax, const=tileconst) for devar in devars}
+    for varname,data in list(tiledata.items()) + list(values.items()):
+      if mode != 'sum': data = data.max(axis=tax) if mode == 'max' else data.min(axis=tax) # extrema are already reduced
+      if tile is None: aggregators[varname].aggregate(data, aggax=tax)
+      else:
+        core = data[tileIndex(tile, 'core', ndim=data.ndim, axis=data.ndim-2)]
+        aggregators[varname].aggregate(core, aggax=tax, index=tileIndex(tile, 'agg', ndim=3, axis=1))
+  return {varname:aggregator.data for varname,aggregator in aggregators.items()}
+
+
+@pytest.mark.parametrize('mode', ['sum', 'max', 'min'])
+@pytest.mark.parametrize('nrow', [1, 2, 3, 6])
+def test_matches_untiled(nrow, mode):
+  indata = {varname:getData((nt,nlev,ny,nx), seed=seed) for seed,varname in enumerate(('U_PL','V_PL'))}
+  const = dict(HGT=getData((1,ny,nx), seed=2, offset=1.)*500., DX=np.float32(3e4), DY=np.float32(3e4))
+  halo = sum(devar.halo for devar in getVariables(None)) # halos of dependent variables add up
+  reference = aggregate(indata, const, None, mode)
+  tiled = aggregate(indata, const, getTiles(nrow, halo), mode)
+  for varname,refvalue in reference.items():
+    np.testing.assert_array_equal(tiled[varname], refvalue, err_msg=varname)
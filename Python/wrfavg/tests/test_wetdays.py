@@ -0,0 +1,69 @@
+'''
+Created on 2026-10-18
+
+Tests for the fused multi-threshold wet-day kernel (WetDayKernel): the results have to match the per-threshold
+computation of WetDays and WetDayRain, and all instances that share a kernel have to use a single pass.
+
+@author: Andre R. Erler, GPL v3
+'''
+
+import pytest
+import numpy as np
+from wrfavg.tests.conftest import importDerivedVariables
+dv = importDerivedVariables()
+
+thresholds = [0.2, 1., 10., 20.] # in mm/day
+delta = 86400.
+
+
+def getRain(lmasked=False, shape=(31,5,7), seed=0):
+  ''' daily precipitation (in SI units) with many dry days and some NaNs '''
+  rng = np.random.default_rng(seed)
+  rain = rng.gamma(0.5, 10., size=shape) / 86400. # kg/m^2/s
+  rain[rng.random(shape) < 0.3] = 0.
+  rain[0,0,0] = np.NaN
+  if lmasked: rain = np.ma.masked_array(rain, mask=np.zeros(shape, dtype=bool)) # like netCDF reads
+  return rain
+
+def getVariables(kernel):
+  ''' WetDays and WetDayRain instances for all thresholds (prerequisites are assumed to be checked) '''
+  devars = []
+  for threshold in thresholds:
+    for cls in (dv.WetDays, dv.WetDayRain):
+      devar = cls(threshold=threshold, kernel=kernel); devar.checked = True
+      devars.append(devar)
+  return devars
+
+
+@pytest.mark.parametrize('lmasked', [False, True])
+@pytest.mark.parametrize('aggax', [0, 1])
+def test_kernel_matches_per_threshold(lmasked, aggax):
+  rain = getRain(lmasked=lmasked)
+  if aggax != 0: rain = np.moveaxis(rain, 0, aggax)
+  kernel = dv.WetDayKernel(thresholds, blocksize=256) # small blocks to test blocking
+  for devar in getVariables(kernel):
+    indata = {'RAIN':rain}
+    fused = devar.reduceValues(indata, aggax=aggax, delta=delta, tmp=dict())
+    reference = np.asarray(devar.computeValues(indata, aggax=aggax, delta=delta, tmp=dict()), dtype=np.float64).sum(axis=aggax)
+    assert fused is not None
+    np.testing.assert_allclose(fused, reference, rtol=1e-12, atol=0)
+
+@pytest.mark.parametrize('lmasked', [False, True])
+def test_single_pass(lmasked, monkeypatch):
+  rain = getRain(lmasked=lmasked)
+  ncalls = [0]
+  bincount = np.bincount
+  def countingBincount(*args, **kwargs):
+    ncalls[0] += 1
+    return bincount(*args, **kwargs)
+  monkeypatch.setattr(np, 'bincount', countingBincount)
+  kernel = dv.WetDayKernel(thresholds)
+  for devar in getVariables(kernel): devar.reduceValues({'RAIN':rain}, aggax=0, delta=delta, tmp=dict())
+  assert ncalls[0] == 2 # counts and sums of a single block, for all thresholds and variables
+
+def test_masked_values():
+  rain = np.ma.masked_array(getRain(), mask=False)
+  rain[1,1,1] = np.ma.masked
+  kernel = dv.WetDayKernel(thresholds)
+  assert kernel.compute(rain) is None # the per-threshold computation has to be used
+  assert kernel.compute(rain) is None # also from the cache
@@ -11,7 +11,6 @@ exactly one output file.
 
 #TODO: add time-dependent auxiliary files to file processing (use prerequisites from other files)
 #TODO: add option to discard prerequisit variables
-#TODO: add base variables for correlation and standard deviation (and (co-)variance).
 #TODO: more variables: tropopause height, baroclinicity, PV, water flux (require full 3D fields)
 #TODO: add shape-averaged output stream (shapes based on a template file)
 
@@ -20,13 +19,23 @@ exactly one output file.
 import numpy as np
 from collections import OrderedDict
 #import numpy.ma as ma
-import os, re, sys, shutil, gc
+import os, re, sys, shutil, gc, copy
 import netCDF4 as nc
+from concurrent.futures import ThreadPoolExecutor
 # my own netcdf stuff
 from utils.nctools import add_coord, copy_dims, copy_ncatts, copy_vars
 from processing.multiprocess import asyncPoolEC
 # import module providing derived variable classes
 import wrfavg.derived_variables as dv
+# catalog of input files (time ranges etc.), so that files don't have to be opened for planning
+import wrfavg.file_catalog as fc
+# vectorized calendar arithmetic for timestamps (see PYAVG_CALENDAR)
+import wrfavg.calendars as calendars
+# lightweight instrumentation (see PYAVG_PROFILE)
+from wrfavg.profiling import Profiler
+from wrfavg.climatology import Climatology
+# wrapper for output datasets that are kept open while data is appended
+from wrfavg.output_writer import OutputWriter, prepareOutputFile, loadJournal, saveJournal, removeJournal, loadState, saveState
 # aliases
 days_per_month_365 = dv.days_per_month_365
 dtype_float = dv.dtype_float
@@ -99,6 +108,10 @@ if 'PYAVG_RECALC' in os.environ:
     else: lrecalc = False
   # lrecalc uses the same pathway, but they can operate independently
 else: lrecalc = False # i.e. recompute all
+# selective mode: only compute the listed output variables and read only the variables they depend on
+if 'PYAVG_OUTPUTS' in os.environ and os.environ['PYAVG_OUTPUTS'].strip():
+  outputvars = os.environ['PYAVG_OUTPUTS'].split() # space separated list (other characters cause problems...)
+else: outputvars = None # default: all variables
 # overwrite existing data
 if 'PYAVG_OVERWRITE' in os.environ:
   loverwrite =  os.environ['PYAVG_OVERWRITE'] == 'OVERWRITE'
@@ -134,6 +147,79 @@ else: lsmplDiff = False # default mode: centered differences
 if 'PYAVG_DAILY' in os.environ:
   lglobaldaily =  os.environ['PYAVG_DAILY'] == 'DAILY'
 else: lglobaldaily = False # operational mode
+# output interval of (sub-)daily files: native output interval or resampled to daily, 6-hourly or 3-hourly values
+daily_intervals = {'native':None, 'daily':86400, '1D':86400, '6hourly':21600, '6H':21600, '3hourly':10800, '3H':10800,
+                   'hourly':3600, '1H':3600} # in seconds
+if 'PYAVG_DAILYFREQ' in os.environ and os.environ['PYAVG_DAILYFREQ']:
+  dailyinterval = daily_intervals[os.environ['PYAVG_DAILYFREQ']]
+else: dailyinterval = None # native output interval
+# calendar of the model, e.g. 'noleap' for GCM-driven simulations (see calendars.calendar_aliases)
+if 'PYAVG_CALENDAR' in os.environ and os.environ['PYAVG_CALENDAR'].strip():
+  calendar = calendars.getCalendar(os.environ['PYAVG_CALENDAR'].strip())
+  if calendar == '360_day':
+    raise NotImplementedError("The time index of input files requires valid dates; 360-day calendars are not supported.")
+else: calendar = None # standard calendar; leap days that are missing from the timestamps are not counted
+# compute a monthly climatology and seasonal and annual means (with standard deviations) alongside monthly means
+if 'PYAVG_CLIMATOLOGY' in os.environ:
+  lclimatology =  os.environ['PYAVG_CLIMATOLOGY'] == 'CLIMATOLOGY'
+else: lclimatology = False # only monthly means
+# number of threads used to compute derived variables within one filetype/domain (0 or 1 means serial)
+if 'PYAVG_VARTHREADS' in os.environ and os.environ['PYAVG_VARTHREADS']:
+  NVT = int(os.environ['PYAVG_VARTHREADS'])
+else: NVT = 0 # serial mode
+# number of threads used by numexpr to evaluate expressions (within each variable thread)
+if 'PYAVG_EXPRTHREADS' in os.environ and os.environ['PYAVG_EXPRTHREADS']:
+  NET = int(os.environ['PYAVG_EXPRTHREADS'])
+else: NET = 1 # serial evaluation; parallelization is over files/variables
+# split long file lists into chunks of several years, which are averaged in parallel and merged afterwards
+if 'PYAVG_CHUNKS' in os.environ and os.environ['PYAVG_CHUNKS']:
+  nchunkyears = int(os.environ['PYAVG_CHUNKS']) # number of years per chunk
+else: nchunkyears = 0 # no chunking
+# N.B.: chunking only applies to new monthly output files (not daily output, or adding to existing files)
+# chunk cache size per output variable in MB (bounds memory use, while output files are kept open)
+if 'PYAVG_CHUNKCACHE' in os.environ and os.environ['PYAVG_CHUNKCACHE']:
+  chunkcache = int(float(os.environ['PYAVG_CHUNKCACHE'])*1024**2)
+else: chunkcache = 4*1024**2 # 4 MB per variable
+# close and re-open output files after every write (fallback, if memory is not released otherwise)
+if 'PYAVG_REOPEN' in os.environ:
+  lreopen =  os.environ['PYAVG_REOPEN'] == 'REOPEN'
+else: lreopen = False # keep output files open
+# incremental mode: append to existing monthly files in place and resume after the last committed month
+if 'PYAVG_INCREMENTAL' in os.environ:
+  lincremental =  os.environ['PYAVG_INCREMENTAL'] == 'INCREMENTAL'
+else: lincremental = False # replay skipped months
+# strategies to protect existing output files while they are modified, in order of preference (see prepareOutputFile)
+if 'PYAVG_OUTPUTSTRATEGY' in os.environ and os.environ['PYAVG_OUTPUTSTRATEGY'].strip():
+  outputstrategies = os.environ['PYAVG_OUTPUTSTRATEGY'].split() # space separated list (other characters cause problems...)
+else: outputstrategies = ['reflink','journal','copy'] # copy-on-write clone, in-place with journal, full copy
+# time processing phases (open, read, derived, aggregate, write) and save a JSON report next to the output
+if 'PYAVG_PROFILE' in os.environ:
+  lprofile =  os.environ['PYAVG_PROFILE'] == 'PROFILE'
+else: lprofile = False # no instrumentation
+# maintain a catalog of input files in the output folder (speeds up planning and restarts)
+if 'PYAVG_CATALOG' in os.environ:
+  lcatalog =  os.environ['PYAVG_CATALOG'] == 'CATALOG'
+else: lcatalog = True # default: use catalog
+# memory budget for the instantaneous fields of an input file (in MB); if exceeded, the domain is processed in tiles
+if 'PYAVG_MEMORY' in os.environ and os.environ['PYAVG_MEMORY']:
+  memorybudget = float(os.environ['PYAVG_MEMORY'])*1024**2
+else: memorybudget = None # default: no limit
+# memory cap for intermediate results that are shared between derived variables (in MB)
+if 'PYAVG_INTERCACHE' in os.environ and os.environ['PYAVG_INTERCACHE']:
+  intercachesize = int(float(os.environ['PYAVG_INTERCACHE'])*1024**2)
+else: intercachesize = 1024**3 # default: 1 GB
+# file with baseline thresholds for percentile-based climate indices (expanded with format(domain))
+if 'PYAVG_BASELINE' in os.environ and os.environ['PYAVG_BASELINE']:
+  baselinepattern = os.environ['PYAVG_BASELINE']
+else: baselinepattern = None # default: look for baseline file in wrfout folder (see below)
+# compute ETCCDI climate indices from daily values (in the same pass)
+if 'PYAVG_INDICES' in os.environ:
+  lindices =  os.environ['PYAVG_INDICES'] == 'INDICES'
+else: lindices = False # default: no climate indices
+# compute variances and covariances of instantaneous values (streaming updates)
+if 'PYAVG_MOMENTS' in os.environ:
+  lmoments =  os.environ['PYAVG_MOMENTS'] == 'MOMENTS'
+else: lmoments = False # default: only means
 
 
 # working directories
@@ -181,13 +267,20 @@ inputpattern = '^wrf{0:s}_d{1:s}_{2:s}_\d\d[_:]\d\d[_:]\d\d(?:\.nc$|$)' # expand
 #       ?: just means that the group defined by () can not be retrieved (it is just to hold "|")
 constpattern = 'wrfconst_d{0:02d}' # expanded with format(domain), also WRF output
 # N.B.: file extension is added automatically for constpattern and handled by regex for inputpattern
+baselinepattern = baselinepattern or infolder+'wrfbaseline_d{0:02d}' # percentile thresholds for climate indices
 monthlypattern = 'wrf{0:s}_d{1:02d}_monthly.nc' # expanded with format(type,domain)
+chunkpattern = 'wrf{0:s}_d{1:02d}_monthly_chunk{2:02d}.nc' # expanded with format(type,domain,chunk)
+statepattern = 'wrf{0:s}_d{1:02d}_monthly_chunk{2:02d}.npz' # carry-over state at the end of a chunk
+filedatergx = re.compile(r'(\d\d\d\d-\d\d-\d\d)_(\d\d)[_:](\d\d)[_:](\d\d)') # date in WRF output file names
 dailypattern = 'wrf{0:s}_d{1:02d}_daily.nc' # expanded with format(type,domain)
+climpatterns = {period:'wrf{0:s}_d{1:02d}_'+period+'.nc' for period in ('clim','seasonal','annual')} # see PYAVG_CLIMATOLOGY
 # variable attributes
 wrftime = 'Time' # time dim in wrfout files
 wrfxtime = 'XTIME' # time in minutes since WRF simulation start
 wrfaxes = dict(Time='tax', west_east='xax', south_north='yax', num_press_levels_stag='pax')
 wrftimestamp = 'Times' # time-stamp variable in WRF
+tileaxis = 'south_north' # dimension along which the domain is split into tiles (see PYAVG_MEMORY)
+tilefactor = 3 # peak memory relative to instantaneous fields (temporary arrays, e.g. pressure integrals)
 time = 'time' # time dim in monthly mean files
 dimlist = ['x','y'] # dimensions we just copy
 dimmap = {time:wrftime} #{time:wrftime, 'x':'west_east','y':'south_north'}
@@ -203,30 +296,34 @@ bktpfx = 'I_' # prefix for bucket variables; these are processed together with t
 # derived variables
 derived_variables = {filetype:[] for filetype in filetypes} # derived variable lists by file type
 derived_variables['srfc']   = [dv.Rain(), dv.LiquidPrecipSR(), dv.SolidPrecipSR(), dv.NetPrecip(sfcevp='QFX'),
-                               dv.WaterVapor(), dv.OrographicIndex(), dv.CovOIP(), dv.WindSpeed(),
+                               dv.ExpressionVariable('WaterVapor'), dv.OrographicIndex(), dv.ExpressionVariable('CovOIP'),
+                               dv.ExpressionVariable('WindSpeed'),
                                dv.SummerDays(temp='T2'), dv.FrostDays(temp='T2'), dv.IceFrac_H(), dv.IceFrac_Tsk()]
                               # N.B.: measures the fraction of 6-hourly samples above/below the threshold (day and night)
-derived_variables['xtrm']   = [dv.RainMean(), dv.TimeOfConvection(),
+derived_variables['xtrm']   = [dv.RainMean(), dv.TimeOfConvection(calendar=calendar),
                                dv.SummerDays(temp='T2MAX'), dv.FrostDays(temp='T2MIN')]
-derived_variables['hydro']  = [dv.Rain(), dv.LiquidPrecip(), dv.SolidPrecip(),
-                               dv.NetPrecip(sfcevp='SFCEVP'), dv.NetWaterFlux(), dv.WaterForcing()]
-derived_variables['rad']    = [dv.NetRadiation(), dv.NetLWRadiation()]
-derived_variables['lsm']    = [dv.RunOff(), dv.IceFrac_A()]
-derived_variables['plev3d'] = [dv.OrographicIndexPlev(), dv.Vorticity(), dv.WindSpeed(),
-                               dv.WaterDensity(), dv.WaterFlux_U(), dv.WaterFlux_V(), dv.ColumnWater(),
+derived_variables['hydro']  = [dv.Rain(), dv.ExpressionVariable('LiquidPrecip'), dv.SolidPrecip(),
+                               dv.NetPrecip(sfcevp='SFCEVP'), dv.ExpressionVariable('NetWaterFlux'),
+                               dv.ExpressionVariable('WaterForcing')]
+derived_variables['rad']    = [dv.ExpressionVariable('NetRadiation'), dv.ExpressionVariable('NetLWRadiation')]
+derived_variables['lsm']    = [dv.ExpressionVariable('RunOff'), dv.IceFrac_A()]
+derived_variables['plev3d'] = [dv.OrographicIndexPlev(), dv.Vorticity(), dv.ExpressionVariable('WindSpeed'),
+                               dv.ExpressionVariable('WaterDensity'), dv.ExpressionVariable('WaterFlux_U'),
+                               dv.ExpressionVariable('WaterFlux_V'), dv.ColumnWater(),
                                dv.WaterTransport_U(), dv.WaterTransport_V(),
-                               dv.HeatFlux_U(), dv.HeatFlux_V(), dv.ColumnHeat(),
+                               dv.ExpressionVariable('HeatFlux_U'), dv.ExpressionVariable('HeatFlux_V'), dv.ColumnHeat(),
                                dv.HeatTransport_U(),dv.HeatTransport_V(),
-                               dv.GHT_Var(), dv.Vorticity_Var()]
+                               dv.ExpressionVariable('GHT_Var'), dv.ExpressionVariable('Vorticity_Var')]
+# N.B.: simple variables are defined in the expression_variables registry in derived_variables (see ExpressionVariable)
 # add wet-day variables for different thresholds
 wetday_variables = [dv.WetDays, dv.WetDayRain, dv.WetDayPrecip]
-for threshold in precip_thresholds:
-  for wetday_var in wetday_variables:
-    derived_variables['srfc'].append(wetday_var(threshold=threshold, rain='RAIN'))
-    derived_variables['hydro'].append(wetday_var(threshold=threshold, rain='RAIN'))
-    derived_variables['xtrm'].append(wetday_var(threshold=threshold, rain='RAINMEAN'))
+for filetype,rain_var in zip(['srfc','hydro','xtrm'],['RAIN','RAIN','RAINMEAN']):
+  wetday_kernel = dv.WetDayKernel(precip_thresholds) # computes all thresholds in one pass
+  for threshold in precip_thresholds:
+    for wetday_var in wetday_variables:
+      derived_variables[filetype].append(wetday_var(threshold=threshold, rain=rain_var, kernel=wetday_kernel))
 
-# N.B.: derived variables need to be listed in order of computation
+# N.B.: derived variables can be listed in any order; the order of computation follows from the dependencies
 # Consecutive exceedance variables
 consecutive_variables = {filetype:None for filetype in filetypes} # consecutive variable lists by file type
 # skip in debug mode (only specific ones for debug)
@@ -287,7 +384,31 @@ else:
     weekmin_variables['xtrm']   = ['T2MEAN', 'T2MIN', 'SPDUV10MEAN']
     weekmin_variables['hydro']  = ['RAIN', 'NetPrecip', 'NetWaterFlux', 'WaterForcing']
     weekmin_variables['lsm']    = ['SFROFF','UDROFF','Runoff']
-# N.B.: it is important that the derived variables are listed in order of dependency!
+## variances and covariances of instantaneous values (streaming updates; output as <var>_var and <var1>_<var2>_cov)
+variance_variables = {filetype:[] for filetype in filetypes} # variance variable lists by file type
+covariance_variables = {filetype:[] for filetype in filetypes} # lists of variable pairs by file type
+if lmoments:
+  variance_variables['srfc'] = ['T2']
+  covariance_variables['srfc'] = [('OrographicIndex','RAIN')] # the correlation follows directly (cf. CovOIP)
+  variance_variables['plev3d'] = ['GHT_PL', 'Vorticity'] # cf. GHT_Var and Vorticity_Var
+# N.B.: prerequisites are read anyway to compute means, so the additional cost is only the update of the moments
+## ETCCDI climate indices (computed from daily values in the same pass)
+index_variables = {filetype:[] for filetype in filetypes} # (index, base variable) lists by file type
+# skip in debug mode (only specific ones for debug)
+if ldebug:
+    if lindices: print("Skipping Climate Indices")
+elif lindices:
+    index_variables['srfc']  = [('Rx1day','RAIN'), ('Rx5day','RAIN'), ('R95p','RAIN'), ('R99p','RAIN'),
+                                ('TX90p','T2'), ('TX10p','T2'), ('TN90p','T2'), ('TN10p','T2'),
+                                ('DTR','T2'), ('GSL','T2')]
+                                # N.B.: daily extrema from (sub-)daily samples underestimate the diurnal range
+    index_variables['xtrm']  = [('Rx1day','RAINMEAN'), ('Rx5day','RAINMEAN'), ('R95p','RAINMEAN'), ('R99p','RAINMEAN'),
+                                ('TX90p','T2MAX'), ('TX10p','T2MAX'), ('TN90p','T2MIN'), ('TN10p','T2MIN'),
+                                ('GSL','T2MEAN')]
+    derived_variables['xtrm'].append(dv.ExpressionVariable('DiurnalRange')) # N.B.: DTR is a linear expression variable for xtrm
+    index_variables['hydro'] = [('Rx1day','RAIN'), ('Rx5day','RAIN'), ('R95p','RAIN'), ('R99p','RAIN')]
+    # N.B.: percentile-based indices are only computed, if a baseline file with thresholds is available
+# N.B.: the order of computation is determined from the prerequisites (see dv.DependencyGraph)
 
 # set of pre-requisites
 prereq_vars = {key:set() for key in derived_variables.keys()} # pre-requisite variable set by file type
@@ -303,18 +424,127 @@ if lglobaldaily:
     daily_variables['rad'] = ['NetRadiation','ACSWDNB','ACLWDNB','NetLWRadiation',] # surface radiation budget
     daily_variables['lsm'] = ['IceFrac_A60',] # lake ice fraction for default
     # daily_variables['lsm'] = ['IceFrac_A60', 'LAKE_ICEFRAC3D'] # lake ice fraction for GL25
+    # reduction used for resampling (see PYAVG_DAILYFREQ): 'mean' (default), 'min', 'max' or 'sum' (time integral)
+    daily_reductions = {filetype:dict() for filetype in filetypes} # reductions by file type and variable
+    daily_reductions['xtrm']  = dict(T2MIN='min', T2MAX='max')
+    daily_reductions['hydro'] = {varname:'sum' for varname in daily_variables['hydro']} # water amounts (fluxes * time)
+
+## output layout (chunking and compression of output variables)
+# chunksizes: chunk length along dimensions (dimensions that are not listed are not split; unlimited: 1)
+# least_significant_digit: variables (and number of digits) to quantize for better compression (lossy!)
+monthly_layout = dict(chunksizes=dict(time=12), zlib=True, complevel=4, shuffle=True, least_significant_digit=dict())
+# N.B.: one year of full maps per chunk is a good compromise for time-series and map reads of monthly data
+daily_layout = dict(chunksizes=dict(time=32, south_north=128, west_east=128), zlib=True, complevel=4, shuffle=True,
+                    least_significant_digit=dict())
+monthly_layouts = {filetype:monthly_layout for filetype in filetypes} # layouts by file type
+monthly_layouts['plev3d'] = dict(monthly_layout, chunksizes=dict(time=12, num_press_levels_stag=1)) # one level per chunk
+daily_layouts = {filetype:daily_layout for filetype in filetypes} # layouts by file type
+# daily_layouts['srfc'] = dict(daily_layout, least_significant_digit=dict(T2=2, PSFC=0, WaterVapor=3, WindSpeed=2))
+
+def getVarLayout(layout, dataset, varname, dims):
+  ''' construct keyword arguments for variable creation (chunking and compression) from an output layout '''
+  kwargs = dict(zlib=layout['zlib'], complevel=layout['complevel'], shuffle=layout['shuffle'])
+  if layout['chunksizes'] is not None:
+    chunksizes = []
+    for dim in dims:
+      ncdim = dataset.dimensions[dim]; chunksize = layout['chunksizes'].get(dim,None)
+      if ncdim.isunlimited(): chunksizes.append(chunksize or 1)
+      else: chunksizes.append(min(chunksize or len(ncdim), len(ncdim))) # clamp to dimension length
+    kwargs['chunksizes'] = chunksizes
+  if varname in layout['least_significant_digit']:
+    kwargs['least_significant_digit'] = layout['least_significant_digit'][varname]
+  return kwargs
+
 
 ## main work function
 # N.B.: the loop iterations should be entirely independent, so that they can be run in parallel
-def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger=None, ldebug=False):
-  ''' This function is doing the main work, and is supposed to be run in a multiprocessing environment. '''
+def processFileList(filelist, filetype, ndom, chunk=None, chunkend=None, catalog=None, lparallel=False, pidstr='',
+                    logger=None, ldebug=False):
+  ''' This function is doing the main work, and is supposed to be run in a multiprocessing environment;
+      if a file catalog is passed, time ranges of input files are looked up instead of opening the files;
+      if a chunk index is passed, a (new) chunk file is created, which ends at chunkend (YYYY-MM) and is
+      merged with other chunks later; the carry-over state at the end of the chunk is also saved. '''
+  lchunk = chunk is not None and chunk > 0 # a chunk that does not start with the simulation
+  dv.setNumThreads(NET) # numexpr threads (per process)
+  profiler = Profiler(lenabled=lprofile) # timers are no-ops, if profiling is disabled
+
+  # helper functions to create output variables with the configured layout (chunking and compression)
+  def copyLayoutVars(dataset, layout, varlist):
+    ''' create time-dependent variables in an output dataset, based on the first input file '''
+    for varname in varlist:
+      dims = [midmap.get(dim,dim) for dim in wrfout.variables[varname].dimensions]
+      copy_vars(dataset, wrfout, varlist=[varname], dimmap=dimmap, copy_data=False, # do not copy data
+                **getVarLayout(layout, dataset, varname, dims))
+  def createLayoutVar(dataset, layout, devar):
+    ''' create a derived variable in an output dataset '''
+    devar.createVariable(dataset, **getVarLayout(layout, dataset, devar.name, devar.axes))
+
+  # helper function to read the time axis of a file once, instead of record by record
+  def readTimeAxis(wrfout):
+    ''' read timestamps (and model time) of an input file and return them with a datetime64 and month index '''
+    with profiler.timer('read', wrftimestamp):
+      chars, timestamps, index = dv.getTimeIndex(wrfout, wrftimestamp)
+      if wrfxtime in wrfout.variables: xtimes = wrfout.variables[wrfxtime][:]
+      else: xtimes = None
+    return chars, timestamps, index, index.astype('datetime64[M]'), xtimes
+
+  # helper functions for input and output (timed, if profiling is enabled)
+  def openInputFile(filename):
+    ''' open an input file for reading '''
+    with profiler.timer('open'): return nc.Dataset(infolder+filename, 'r', format='NETCDF4')
+  def readVar(var, slices):
+    ''' read a hyperslab of a netCDF variable and count the bytes '''
+    with profiler.timer('read', var.name) as timer:
+      data = var.__getitem__(slices)
+      timer.nbytes = data.nbytes
+    return data
+  def writeVar(ncvar, idx, vardata):
+    ''' write one or several records of an output variable (time is always the outermost index) '''
+    with profiler.timer('write', ncvar.name):
+      if ncvar.ndim > 1: ncvar[idx,:] = vardata
+      else: ncvar[idx] = vardata
+
+  # helper functions for spatial tiling (tiles are bands of rows along south_north, with a halo)
+  def tileSlice(tile, mode):
+    ''' slice of a tile along the tile axis: 'read' includes the halo, 'core' extracts the core from an array
+        that includes the halo, and 'agg' is the position of the core in the whole domain (e.g. accumulators) '''
+    j0,j1,h0,h1 = tile # core and halo on either side
+    if mode == 'read': return slice(j0-h0,j1+h1)
+    elif mode == 'core': return slice(h0,h0+j1-j0)
+    elif mode == 'agg': return slice(j0,j1)
+    else: raise ValueError(mode)
+  def tileIndex(dims, tile, mode):
+    ''' index of a tile in an array with the given dimensions (accumulators have no time axis) '''
+    if mode == 'agg': dims = [dim for dim in dims if dim not in (wrftime,time)]
+    return tuple(tileSlice(tile, mode) if dim == tileaxis else slice(None) for dim in dims)
+  def tileCore(data, axes, tile):
+    ''' return the core of derived values and its index in the accumulator; None, if this is a repetition '''
+    if tile is None or data is None: return data, None
+    if tileaxis not in axes: return (data if tile[0] == 0 else None), None # only aggregate once
+    if data.ndim < len(axes): axes = [ax for ax in axes if ax != time] # already reduced along time axis
+    return data[tileIndex(axes, tile, 'core')], tileIndex(axes, tile, 'agg')
+
+  # helper function to seek to the input file with the beginning of a month (incremental mode)
+  def findInputFile(monthstart):
+    ''' index of the input file that contains the first time step of a month (monthstart is a WRF timestamp),
+        based on the catalog or on the dates in the file names; None, if it can not be determined '''
+    if catalog is not None and all(filename in catalog for filename in filelist):
+      for k,filename in enumerate(filelist):
+        # N.B.: if the month only starts in the last record, the next file has to be used
+        if catalog[filename]['end'] > monthstart: return k if catalog[filename]['begin'] <= monthstart else None
+      return None
+    filedates = [filedatergx.search(filename) for filename in filelist]
+    if not all(filedates): return None
+    filedates = ['{0:s}_{1:s}:{2:s}:{3:s}'.format(*filedate.groups()) for filedate in filedates]
+    candidates = [k for k,filedate in enumerate(filedates) if filedate <= monthstart]
+    return candidates[-1] if candidates else None # the last file that begins before the month
 
   ## setup files and folders
 
   # load first file to copy some meta data
-  wrfoutfile = infolder+filelist[0]
-  logger.debug("\n{0:s} Opening first input file '{1:s}'.".format(pidstr,wrfoutfile))
-  wrfout = nc.Dataset(wrfoutfile, 'r', format='NETCDF4')
+  logger.debug("\n{0:s} Opening first input file '{1:s}'.".format(pidstr,infolder+filelist[0]))
+  wrfout = openInputFile(filelist[0])
+  wrfchars, wrftimes, wrfindex, wrfmonths, wrfxtimes = readTimeAxis(wrfout)
   # timeless variables (should be empty, since all timeless variables should be in constant files!)
   timeless = [varname for varname,var in wrfout.variables.items() if 'Time' not in var.dimensions]
   assert len(timeless) == 0 # actually useless, since all WRF variables have a time dimension...
@@ -327,9 +557,8 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
 
   ## derived variables, extrema, and dependencies
   # derived variable list
-  derived_vars = OrderedDict() # it is important that the derived variables are computed in order:
-  # the reason is that derived variables can depend on other derived variables, and the order in
-  # which they are listed, should take this into account
+  derived_vars = OrderedDict() # derived variables can depend on other derived variables; the order of
+  # computation is determined from the dependency graph (see below), so the order of definition does not matter
   for devar in derived_variables[filetype]:
     derived_vars[devar.name] = devar
 
@@ -344,15 +573,18 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
                                                   name=key, long_name=value[3], dimmap=midmap)
 
   # method to create derived variables for extrema
+  intervalengines = dict() # interval averages of the same variable are computed together
   def addExtrema(new_variables, mode, interval=0):
     for exvar in new_variables[filetype]:
       # create derived variable instance
+      if interval > 0 and exvar not in intervalengines: intervalengines[exvar] = dv.IntervalEngine()
       if exvar in derived_vars:
         if interval == 0: devar = dv.Extrema(derived_vars[exvar],mode)
-        else: devar = dv.MeanExtrema(derived_vars[exvar],mode,interval=interval)
+        else: devar = dv.MeanExtrema(derived_vars[exvar],mode,interval=interval, engine=intervalengines[exvar])
       else:
         if interval == 0: devar = dv.Extrema(wrfout.variables[exvar],mode, dimmap=midmap)
-        else: devar = dv.MeanExtrema(wrfout.variables[exvar],mode, interval=interval, dimmap=midmap)
+        else: devar = dv.MeanExtrema(wrfout.variables[exvar],mode, interval=interval, dimmap=midmap,
+                                     engine=intervalengines[exvar])
       # append to derived variables
       derived_vars[devar.name] = devar # derived_vars is from the parent scope, not local!
   # and now add them
@@ -363,10 +595,44 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   addExtrema(weekmax_variables, 'max', interval=5) # 5 days is the preferred interval, according to
   addExtrema(weekmin_variables, 'min', interval=5) # ETCCDI Climate Change Indices
 
+  # create variance and covariance variables (base or derived variables)
+  def getVariable(varname):
+    if varname in derived_vars: return derived_vars[varname], dict()
+    else: return wrfout.variables[varname], dict(dimmap=midmap)
+  for varname in variance_variables[filetype]:
+    if varname not in derived_vars and varname not in wrfout.variables: continue # e.g. not in this output stream
+    var, kwargs = getVariable(varname)
+    devar = dv.Variance(var, **kwargs)
+    derived_vars[devar.name] = devar
+  for varname1,varname2 in covariance_variables[filetype]:
+    if not all(varname in derived_vars or varname in wrfout.variables for varname in (varname1,varname2)): continue
+    (var1, kwargs), (var2, _) = getVariable(varname1), getVariable(varname2)
+    devar = dv.Covariance(var1, var2, **kwargs)
+    derived_vars[devar.name] = devar
+
+  # create climate indices (daily values are computed together with interval-averaged extrema)
+  baselinefile = baselinepattern.format(ndom)
+  if not os.path.exists(baselinefile): baselinefile += '.nc' # try with extension
+  lbaseline = os.path.exists(baselinefile)
+  for idxname,idxvar in index_variables[filetype]:
+    if dv.climate_indices[idxname].get('baseline',None) is not None and not lbaseline:
+      continue # percentile-based indices need baseline thresholds
+    if idxvar not in intervalengines: intervalengines[idxvar] = dv.IntervalEngine()
+    if idxvar in derived_vars: var = derived_vars[idxvar]; kwargs = dict()
+    else: var = wrfout.variables[idxvar]; kwargs = dict(dimmap=midmap)
+    if idxname == 'GSL': devar = dv.GrowingSeasonLength(var, timestamp=wrftimestamp, engine=intervalengines[idxvar], **kwargs)
+    else: devar = dv.ClimateIndex(idxname, var, engine=intervalengines[idxvar], **kwargs)
+    derived_vars[devar.name] = devar
+
+  # sort derived variables topologically, so that prerequisites are always computed first
+  degraph = dv.DependencyGraph(derived_vars.values()) # raises DerivedVariableError, if there are circular dependencies
+  derived_vars = OrderedDict((dename,derived_vars[dename]) for dename in degraph.order)
+
   ldaily = False
   if lglobaldaily:
       # get varlist (does not include dependencies)
       daily_varlist_full = daily_variables[filetype]
+      if outputvars is not None: daily_varlist_full = [varname for varname in daily_varlist_full if varname in outputvars]
       if len(daily_varlist_full)>0:
           ldaily = True
           daily_varlist = []; daily_derived_vars = []
@@ -378,6 +644,15 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       else:
           logger.info("\n{0:s} Skipping (sub-)daily output for filetype '{1:s}', since variable list is empty.\n".format(pidstr,filetype))
 
+  # selective mode: prune dependency graph to the requested outputs and only read the required input variables
+  if outputvars is not None:
+    targets = [varname for varname in outputvars if varname in derived_vars]
+    if ldaily: targets += daily_derived_vars
+    derived_vars = OrderedDict((dename,derived_vars[dename]) for dename in degraph.prune(targets))
+    inputset = set(outputvars) | degraph.inputs(derived_vars.keys()) # transitive closure of prerequisites
+    if ldaily: inputset |= set(daily_varlist)
+    varlist = [varname for varname in varlist if varname in inputset]
+    # N.B.: required input variables are also averaged and written (linear variables are computed from means)
   # if we are only computing derived variables, remove all non-prerequisites
   prepq = set().union(*[devar.prerequisites for devar in derived_vars.values()])
   if ldaily: prepq |= set(daily_varlist)
@@ -385,7 +660,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
 
 
   # get some meta info and construct title string (printed after file creation)
-  begindate = str(nc.chartostring(wrfout.variables[wrftimestamp][0,:10])) # first timestamp in first file
+  begindate = wrftimes[0][:10] # first timestamp in first file
   beginyear, beginmonth, beginday = [int(tmp) for tmp in begindate.split('-')]
   # always need to begin on the first of a month (discard incomplete data of first month)
   if beginday != 1:
@@ -393,11 +668,15 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
     beginday = 1 # and start at the first (always...)
     begindate = '{0:04d}-{1:02d}-{2:02d}'.format(beginyear, beginmonth, beginday) # rewrite begin date
   # open last file and get last date
-  lastoutfile = infolder+filelist[-1]
-  logger.debug("{0:s} Opening last input file '{1:s}'.".format(pidstr,lastoutfile))
-  lastout = nc.Dataset(lastoutfile, 'r', format='NETCDF4')
-  lstidx = lastout.variables[wrftimestamp].shape[0]-1 # netcdf library has problems with negative indexing
-  enddate = str(nc.chartostring(lastout.variables[wrftimestamp][lstidx,:10])) # last timestamp in last file
+  if catalog is not None and filelist[-1] in catalog:
+    enddate = catalog[filelist[-1]]['end'][:10] # last timestamp in last file, from catalog
+  else:
+    lastoutfile = infolder+filelist[-1]
+    logger.debug("{0:s} Opening last input file '{1:s}'.".format(pidstr,lastoutfile))
+    lastout = nc.Dataset(lastoutfile, 'r', format='NETCDF4')
+    lstidx = lastout.variables[wrftimestamp].shape[0]-1 # netcdf library has problems with negative indexing
+    enddate = str(nc.chartostring(lastout.variables[wrftimestamp][lstidx,:10])) # last timestamp in last file
+    lastout.close()
   endyear, endmonth, endday = [int(tmp) for tmp in enddate.split('-')]; del endday # make warning go away...
   # the last timestamp should be the next month (i.e. that month is not included)
   if endmonth == 1:
@@ -406,23 +685,46 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   endday = 1 # first day of last month (always 1st..)
   assert 1 <= endday <= 31 and 1 <= endmonth <= 12 # this is kinda trivial...
   enddate = '{0:04d}-{1:02d}-{2:02d}'.format(endyear, endmonth, endday) # rewrite begin date
+  # the last file of a chunk also contains the beginning of the next chunk, so the end has to be clamped
+  if chunkend is not None:
+    chunkyear, chunkmonth = [int(tmp) for tmp in chunkend.split('-')]
+    if (chunkyear, chunkmonth) < (endyear, endmonth):
+      endyear, endmonth = chunkyear, chunkmonth
+      enddate = '{0:04d}-{1:02d}-{2:02d}'.format(endyear, endmonth, endday) # rewrite end date
 
   ## open/create monthly mean output file
-  monthly_file = monthlypattern.format(filetype,ndom)
+  if chunk is None: monthly_file = monthlypattern.format(filetype,ndom)
+  else: monthly_file = chunkpattern.format(filetype,ndom,chunk) # chunk files are always new
   if lparallel: tmppfx = 'tmp_wrfavg_{:s}_'.format(pidstr[1:-1])
   else: tmppfx = 'tmp_wrfavg_'
   monthly_filepath = outfolder + monthly_file
   tmp_monthly_filepath = outfolder + tmppfx + monthly_file
   if os.path.exists(monthly_filepath):
-      if loverwrite or os.path.getsize(monthly_filepath) < 1e6: os.remove(monthly_filepath)
+      if loverwrite or chunk is not None or os.path.getsize(monthly_filepath) < 1e6: os.remove(monthly_filepath)
       # N.B.: NetCDF files smaller than 1MB are usually incomplete header fragments from a previous crashed job
   if os.path.exists(tmp_monthly_filepath) and not lrecover: os.remove(tmp_monthly_filepath) # remove old temp files
+  # save carry-over state after every month, so that incremental runs can resume (not if only some variables are computed)
+  lsavestate = lincremental and chunk is None and not ( laddnew or lrecalc )
+  lresume = False # resume after the last committed month (incremental mode)
+  ljournal = False # the existing file is modified in place and committed months are journaled
+  committed = None # number of committed months in an existing file
   if os.path.exists(monthly_filepath):
-      # make a temporary copy of the file to work on (except, if we are recovering a broken temp file)
-      if not ( lrecover and os.path.exists(tmp_monthly_filepath) ): shutil.copy(monthly_filepath,tmp_monthly_filepath)
+      lresume = lincremental and chunk is None and not ( laddnew or lrecalc )
+      journal = loadJournal(monthly_filepath) # only exists, if a job that modified the file in place did not finish
+      if lrecover and os.path.exists(tmp_monthly_filepath):
+        strategy = 'recover'; nbytes = 0 # continue working on the broken temp file
+      else:
+        # protect the existing file: copy-on-write clone, in-place with journal, or full copy (temporary file);
+        # journaling is only possible, if records are appended or overwritten (not for new or recomputed variables)
+        strategy, nbytes = prepareOutputFile(monthly_filepath, tmp_monthly_filepath, strategies=outputstrategies,
+                                             ljournal=not ( laddnew or lrecalc ))
+      ljournal = strategy == 'journal'
+      out_monthly_filepath = monthly_filepath if ljournal else tmp_monthly_filepath
+      logger.info("{0:s} Output strategy for '{1:s}': {2:s} ({3:3.1f} MB copied)".format(pidstr,monthly_file,strategy,nbytes/1024.**2))
       # open (temporary) file
       logger.debug("{0:s} Opening existing output file '{1:s}'.\n".format(pidstr,monthly_filepath))
-      monthly_dataset = nc.Dataset(tmp_monthly_filepath, mode='a', format='NETCDF4') # open to append data (mode='a')
+      monthly_writer = OutputWriter(out_monthly_filepath, mode='a', cachesize=chunkcache, lreopen=lreopen)
+      monthly_dataset = monthly_writer.dataset # open to append data (mode='a')
       # infer start index
       meanbeginyear, meanbeginmonth, meanbeginday = [int(tmp) for tmp in monthly_dataset.begin_date.split('-')]
       assert meanbeginday == 1, 'always have to begin on the first of a month'
@@ -430,9 +732,13 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       # check time-stamps in old datasets
       if monthly_dataset.end_date < begindate: assert t0 == len(monthly_dataset.dimensions[time]) + 1 # another check
       else: assert t0 <= len(monthly_dataset.dimensions[time]) + 1 # get time index where we start; in month beginning 1979
-##
-##  ***  special functions like adding new and recalculating old variables could be added later for daily output  ***
-##
+      # number of committed months: from the journal (after a crash) or from the time axis
+      nrec = len(monthly_dataset.dimensions[time])
+      if journal is not None:
+        committed = min(journal['committed'],nrec); monthly_dataset.end_date = journal['end_date'] # undo partial updates
+      elif nrec > 0 and ( lrecover or monthly_dataset.variables[time][nrec-1] == -1 ): committed = nrec - 1 # incomplete
+      else: committed = nrec
+      if ljournal: saveJournal(monthly_filepath, committed, end_date=monthly_dataset.end_date) # before anything is modified
       # checks for new variables
       if laddnew or lrecalc:
         if t0 != 1: raise DateError("Have to start at the beginning to add new or recompute old variables!") # t0 starts with 1, not 0
@@ -456,7 +762,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
         dimlist = [dim for dim in dimlist if dim not in monthly_dataset.dimensions] # only the new ones!
         copy_dims(monthly_dataset, wrfout, dimlist=dimlist, namemap=dimmap, copy_coords=False) # don't have coordinate variables
         # create time-dependent variable in new datasets
-        copy_vars(monthly_dataset, wrfout, varlist=newvars, dimmap=dimmap, copy_data=False) # do not copy data - need to average
+        copyLayoutVars(monthly_dataset, monthly_layouts[filetype], newvars) # do not copy data - need to average
         # change units of accumulated variables (per second)
         for varname in newvars: # only new vars
           assert varname in monthly_dataset.variables
@@ -471,7 +777,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           #else: raise ArgumentError, "Variable '{:s}' scheduled for recalculation is not present in output file '{:s}'.".format(var,monthly_filepath)
       # check derived variables
       if laddnew or lrecalc: newdevars = []
-      for varname,var in derived_vars.items():
+      for varname,var in list(derived_vars.items()): # N.B.: entries may be deleted
         if varname in monthly_dataset.variables:
           var.checkPrerequisites(monthly_dataset)
           if not var.checked: raise ValueError("Prerequisits for derived variable '{:s}' not found.".format(varname))
@@ -484,7 +790,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
         else:
           if laddnew:
             var.checkPrerequisites(monthly_dataset) # as long as they are sorted correctly...
-            var.createVariable(monthly_dataset)
+            createLayoutVar(monthly_dataset, monthly_layouts[filetype], var)
             newdevars.append(varname)
           else: del derived_vars[varname] # don't bother
           # N.B.: it is not possible that a previously computed variable depends on a missing variable,
@@ -492,27 +798,16 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           #raise (dv.DerivedVariableError, "{0:s} Derived variable '{1:s}' not found in file '{2:s}'".format(pidstr,var.name,monthly_file))
       # now figure out effective variable list
       if laddnew or lrecalc:
-        varset = set(newvars)
-        devarset = set(newdevars)
-        ndv = -1
-        # check prerequisites
-        while ndv != len(devarset):
-          ndv = len(devarset)
-          for devar in list(devarset): # normal variables don't have prerequisites
-            for pq in derived_vars[devar].prerequisites:
-              if pq in derived_vars: devarset.add(pq)
-              else: varset.add(pq)
-        # N.B.: this algorithm for dependencies relies on the fact that derived_vars is already ordered correctly,
-        #       and unused variables can simply be removed (below), without changing the order;
-        #       a stand-alone dependency resolution would require soring the derived_vars in order of execution
-        # consolidate lists
-        for devar in derived_vars.keys():
-          if devar not in devarset: del derived_vars[devar] # don't bother with this one...
+        # prune dependency graph: only the targets and the derived variables they depend on are computed
+        derived_vars = OrderedDict((dename,derived_vars[dename]) for dename in degraph.prune(newdevars)
+                                   if dename in derived_vars) # in order of computation
+        varset = set(newvars) | degraph.inputs(derived_vars.keys()) # only read what is actually needed
         varlist = list(varset) # order doesnt really matter... but whatever...
         varlist.sort() # ... alphabetical order...
   else:
       logger.debug("{0:s} Creating new output file '{1:s}'.\n".format(pidstr,monthly_filepath))
-      monthly_dataset = nc.Dataset(tmp_monthly_filepath, 'w', format='NETCDF4') # open to start a new file (mode='w')
+      monthly_writer = OutputWriter(tmp_monthly_filepath, mode='w', cachesize=chunkcache, lreopen=lreopen)
+      monthly_dataset = monthly_writer.dataset # open to start a new file (mode='w')
       t0 = 1 # time index where we start (first month)
       monthly_dataset.createDimension(time, size=None) # make time dimension unlimited
       add_coord(monthly_dataset, time, data=None, dtype='i4', atts=dict(units='month since '+begindate)) # unlimited time dimension
@@ -524,7 +819,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       # copy time-less variable to new datasets
       copy_vars(monthly_dataset, wrfout, varlist=timeless, dimmap=dimmap, copy_data=True) # copy data
       # create time-dependent variable in new datasets
-      copy_vars(monthly_dataset, wrfout, varlist=varlist, dimmap=dimmap, copy_data=False) # do not copy data - need to average
+      copyLayoutVars(monthly_dataset, monthly_layouts[filetype], varlist) # do not copy data - need to average
       # change units of accumulated variables (per second)
       for varname in acclist:
         if varname in monthly_dataset.variables:
@@ -536,7 +831,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       # create derived variables
       for var in derived_vars.values():
         var.checkPrerequisites(monthly_dataset) # as long as they are sorted correctly...
-        var.createVariable(monthly_dataset) # derived variables need to be added in order of computation
+        createLayoutVar(monthly_dataset, monthly_layouts[filetype], var) # derived variables need to be added in order of computation
       # copy global attributes
       copy_ncatts(monthly_dataset, wrfout, prefix='') # copy all attributes (no need for prefix; all upper case are original)
       # some new attributes
@@ -563,12 +858,79 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
         if loverwrite or os.path.getsize(daily_filepath) < 1e6: os.remove(daily_filepath)
         # N.B.: NetCDF files smaller than 1MB are usually incomplete header fragments from a previous crashed job
       if os.path.exists(tmp_daily_filepath) and not lrecover: os.remove(tmp_daily_filepath) # remove old temp files
-      if os.path.exists(daily_filepath):
-          raise NotImplementedError("Currently, updating of and appending to (sub-)daily output files is not supported.")
+      # only variables that are actually computed can be written (e.g. when adding or recomputing variables)
+      daily_varlist = [varname for varname in daily_varlist if varname in varlist]
+      daily_derived_vars = [dename for dename in daily_derived_vars if dename in derived_vars]
+      ldailyinplace = False # the existing file is modified in place (incomplete records are marked in the time axis)
+      if os.path.exists(daily_filepath) or ( lrecover and os.path.exists(tmp_daily_filepath) ):
+          if lrecover and os.path.exists(tmp_daily_filepath):
+            strategy = 'recover'; nbytes = 0 # continue working on the broken temp file
+          else:
+            # protect the existing file, like the monthly file (see above)
+            strategy, nbytes = prepareOutputFile(daily_filepath, tmp_daily_filepath, strategies=outputstrategies,
+                                                 ljournal=not ( laddnew or lrecalc ))
+          ldailyinplace = strategy == 'journal'
+          logger.info("{0:s} Output strategy for '{1:s}': {2:s} ({3:3.1f} MB copied)".format(pidstr,daily_file,strategy,nbytes/1024.**2))
+          logger.debug("{0:s} Opening existing (sub-)daily output file '{1:s}'.\n".format(pidstr,daily_filepath))
+          daily_writer = OutputWriter(daily_filepath if ldailyinplace else tmp_daily_filepath, mode='a',
+                                      cachesize=chunkcache, lreopen=lreopen)
+          daily_dataset = daily_writer.dataset # open to append data (mode='a')
+          if getattr(daily_dataset,'output_interval',None) != dailyinterval:
+            raise ValueError("{0:s} The output interval of '{1:s}' does not match PYAVG_DAILYFREQ.".format(pidstr,daily_file))
+          # number of completed time steps: incomplete records at the end are marked with -1 in the time axis
+          nrec = len(daily_dataset.dimensions[time])
+          dailytimes = np.ma.filled(daily_dataset.variables[time][:], -1)
+          ndone = nrec
+          while ndone > 0 and dailytimes[ndone-1] == -1: ndone -= 1
+          dailychars, dailystamps, dailyindex = dv.getTimeIndex(daily_dataset, wrftimestamp)
+          # the first month that is not complete in the daily file (based on the time step after the last record)
+          dailybegin = np.datetime64(daily_dataset.begin_date[:7], 'M')
+          if ndone > 1:
+            nextstep = dailyindex[ndone-1] + np.timedelta64(int(dailytimes[1]-dailytimes[0]),'s')
+            dailymonth = nextstep.astype('datetime64[M]')
+          else: dailymonth = dailybegin # start over
+          # restart at the beginning of a month: the first month that is incomplete in either file
+          beginmonth64 = np.datetime64(begindate[:7], 'M') # corresponds to index t0-1 in the monthly file
+          if committed is None or laddnew or lrecalc: nfirst = t0-1
+          else: nfirst = max(committed, t0-1)
+          nfirst = min(nfirst, t0-1 + int((dailymonth - beginmonth64).astype('int')))
+          firstmonth64 = beginmonth64 + (nfirst - t0 + 1)
+          if nfirst < t0-1 or firstmonth64 < dailybegin:
+            raise DateError("{0:s} The (sub-)daily output file '{1:s}' can not be continued at {2:s}.".format(pidstr,daily_file,str(firstmonth64)))
+          daily_start_idx = int(np.searchsorted(dailyindex[:ndone], firstmonth64.astype('datetime64[s]'), side='left'))
+          timestep_start = daily_start_idx # time step where we start (first time step of the month)
+          logger.debug("{0:s} Continuing (sub-)daily output at {1:s} (time step {2:d}).".format(pidstr,str(firstmonth64),timestep_start))
+          # monthly output has to be recomputed as well, if the daily output is behind (the monthly journal is updated)
+          if committed is not None and nfirst < committed:
+            committed = nfirst
+            if ljournal: saveJournal(monthly_filepath, committed, end_date=monthly_dataset.end_date)
+          # check variables: add new ones or skip missing ones (like monthly output)
+          daily_newvars = [varname for varname in daily_varlist if varname not in daily_dataset.variables]
+          daily_newdevars = [dename for dename in daily_derived_vars if dename not in daily_dataset.variables]
+          if laddnew and ( len(daily_newvars) > 0 or len(daily_newdevars) > 0 ):
+            # copy remaining dimensions to new datasets
+            if midmap is not None:
+              dimlist = [midmap.get(dim,dim) for dim in wrfout.dimensions.keys() if dim != wrftime]
+            else: dimlist = [dim for dim in wrfout.dimensions.keys() if dim != wrftime]
+            dimlist = [dim for dim in dimlist if dim not in daily_dataset.dimensions] # only the new ones!
+            copy_dims(daily_dataset, wrfout, dimlist=dimlist, namemap=dimmap, copy_coords=False) # don't have coordinate variables
+            copyLayoutVars(daily_dataset, daily_layouts[filetype], daily_newvars) # do not copy data
+            for varname in daily_newvars:
+              if varname in acclist:
+                dayvar = daily_dataset.variables[varname]
+                dayvar.units = dayvar.units + '/s' # units per second!
+            for devarname in daily_newdevars:
+              createLayoutVar(daily_dataset, daily_layouts[filetype], derived_vars[devarname])
+          elif not laddnew:
+            daily_varlist = [varname for varname in daily_varlist if varname not in daily_newvars]
+            daily_derived_vars = [dename for dename in daily_derived_vars if dename not in daily_newdevars]
       else:
           logger.debug("{0:s} Creating new (sub-)daily output file '{1:s}'.\n".format(pidstr,daily_filepath))
-          daily_dataset = nc.Dataset(tmp_daily_filepath, 'w', format='NETCDF4') # open to start a new file (mode='w')
+          daily_writer = OutputWriter(tmp_daily_filepath, mode='w', cachesize=chunkcache, lreopen=lreopen)
+          daily_dataset = daily_writer.dataset # open to start a new file (mode='w')
           timestep_start = 0 # time step where we start (first tiem step)
+          # resampled intervals start at midnight (the first interval can be incomplete)
+          if dailyinterval is not None: begindatetime = begindatetime[:10] + ' 00:00:00'
           daily_dataset.createDimension(time, size=None) # make time dimension unlimited
           add_coord(daily_dataset, time, data=None, dtype='i8', atts=dict(units='seconds since '+begindatetime)) # unlimited time dimension
           # copy remaining dimensions to new datasets
@@ -579,7 +941,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           # copy time-less variable to new datasets
           copy_vars(daily_dataset, wrfout, varlist=timeless, dimmap=dimmap, copy_data=True) # copy data
           # create time-dependent variable in new datasets
-          copy_vars(daily_dataset, wrfout, varlist=daily_varlist, dimmap=dimmap, copy_data=False) # do not copy data - need to resolve buckets and straighten time
+          copyLayoutVars(daily_dataset, daily_layouts[filetype], daily_varlist) # do not copy data - need to resolve buckets and straighten time
           # change units of accumulated variables (per second)
           for varname in acclist:
             if varname in daily_dataset.variables:
@@ -593,45 +955,77 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           # create derived variables
           for devarname in daily_derived_vars:
             # don't need to check for prerequisites, since they are already being checked and computed for monthly output
-            derived_vars[devarname].createVariable(daily_dataset) # derived variables need to be added in order of computation
+            createLayoutVar(daily_dataset, daily_layouts[filetype], derived_vars[devarname]) # derived variables need to be added in order of computation
           # copy global attributes
           copy_ncatts(daily_dataset, wrfout, prefix='') # copy all attributes (no need for prefix; all upper case are original)
           # some new attributes
           daily_dataset.acc_diff_mode = 'simple' if lsmplDiff else 'centered'
           daily_dataset.description = 'wrf{0:s}_d{1:02d} post-processed timestep output'.format(filetype,ndom)
           daily_dataset.begin_date = begindatetime
+          if dailyinterval is not None: daily_dataset.output_interval = dailyinterval # in seconds (native, if missing)
           daily_dataset.experiment = exp
           daily_dataset.creator = 'Andre R. Erler'
+      # resampling: record reductions and fix units of time integrals
+      if dailyinterval is not None:
+        resampler = dv.Resampler(dailyinterval, origin=daily_dataset.begin_date.replace(' ','T'),
+                                 reductions=daily_reductions[filetype])
+        for varname in daily_varlist + daily_derived_vars:
+          dayvar = daily_dataset.variables[varname]; reduction = resampler.reductions.get(varname,'mean')
+          if getattr(dayvar,'cell_methods',None) is None:
+            dayvar.cell_methods = 'time: {:s}'.format(dict(min='minimum', max='maximum').get(reduction,reduction))
+            if reduction == 'sum' and getattr(dayvar,'units',None) is not None:
+              dayvar.units = dayvar.units[:-2] if dayvar.units.endswith('/s') else dayvar.units + ' s'
+      else: resampler = None # write native time steps
       # sync with file
       daily_dataset.sync()
 
   ## construct dependencies
+  degraph = dv.DependencyGraph(derived_vars.values()) # only variables that are actually computed
+  # interval engines only need to compute members that were not pruned
+  for engine in intervalengines.values():
+    engine.members = [devar for devar in engine.members if devar.name in derived_vars]
+  # variables for daily output can be treated as non-linear, so that they are computed at the native timestep
+  if ldaily:
+    for dename in daily_derived_vars:
+      if dename in derived_vars: derived_vars[dename].linear = False
   # update linearity: dependencies of non-linear variables have to be treated as non-linear themselves
-  lagain = True
-  # parse through dependencies until nothing changes anymore
-  while lagain:
-    lagain = False
-    for dename,devar in derived_vars.items():
-      # variables for daily output can be treated as non-linear, so that they are computed at the native timestep
-      if ldaily and dename in daily_derived_vars: devar.linear = False
-      if not devar.linear:
-        # make sure all dependencies are also treated as non-linear
-        for pq in devar.prerequisites:
-          if pq in derived_vars and derived_vars[pq].linear:
-            lagain = True # indicate modification
-            derived_vars[pq].linear = False
+  degraph.propagateNonLinear()
   # construct dependency set (should include extrema now)
   pqset = set().union(*[devar.prerequisites for devar in derived_vars.values() if not devar.linear])
   if ldaily:
       # daily output variables need to be treated as prerequisites, so that full timestep fields are loaded for bucket variables
       pqset |= set(daily_varlist)
   cset = set().union(*[devar.constants for devar in derived_vars.values() if devar.constants is not None])
+  # derived variables without instantaneous output can be reduced directly (if supported, e.g. fused kernels)
+  dereduce = set(dename for dename in derived_vars.keys() if dename not in pqset)
+  if ldaily: dereduce -= set(daily_derived_vars)
+  # group non-linear derived variables into tasks; expression variables with the same axes and the same depth in
+  # the dependency graph are evaluated together in one pass over memory (they can not depend on each other)
+  nonlinear = [dename for dename in degraph.order if not derived_vars[dename].linear]
+  dedepth = degraph.depth(nonlinear) # length of the longest chain of prerequisites
+  detasks = []; exgroups = dict()
+  for dename in sorted(nonlinear, key=dedepth.get): # stable sort, so the order is still topological
+    devar = derived_vars[dename]
+    if isinstance(devar, dv.ExpressionVariable):
+      exkey = (dedepth[dename], devar.axes)
+      if exkey not in exgroups:
+        exgroups[exkey] = []; detasks.append(exgroups[exkey])
+      exgroups[exkey].append(dename)
+    else: detasks.append([dename])
+  detasks = [tuple(detask) for detask in detasks] # tasks are executed as soon as their prerequisites are available
+  # cache for intermediate results that are shared between derived variables (e.g. gradients, integration weights)
+  intercache = dv.IntermediateCache(maxsize=intercachesize)
+  for devar in derived_vars.values(): devar.cache = intercache
+  # thread pool for derived variables (numpy and numexpr release the GIL for large arrays)
+  if NVT > 1 and len(detasks) > 0: varpool = ThreadPoolExecutor(max_workers=NVT)
+  else: varpool = None # serial mode
+  # N.B.: only the computation is parallelized; netCDF I/O is not thread-safe and remains serial
 
   # initialize dictionary for temporary storage
   tmpdata = dict() # not allocated - use sparingly
 
   # load constants, if necessary
-  const = dict()
+  const = dict(); constdims = dict() # dimensions of constant fields (needed for tiling)
   lconst = len(cset) > 0
   if lconst:
     constfile = infolder+constpattern.format(ndom)
@@ -641,10 +1035,20 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
     wrfconst = nc.Dataset(constfile, 'r', format='NETCDF4')
     # constant variables
     for cvar in cset:
-      if cvar in wrfconst.variables: const[cvar] = wrfconst.variables[cvar][:]
+      if cvar in wrfconst.variables:
+        const[cvar] = wrfconst.variables[cvar][:]; constdims[cvar] = wrfconst.variables[cvar].dimensions
       elif cvar in wrfconst.ncattrs(): const[cvar] = wrfconst.getncattr(cvar)
       else: raise ValueError("Constant variable/attribute '{:s}' not found in constants file '{:s}'.".format(cvar,constfile))
   else: const = None
+  # load baseline thresholds for climate indices (same as constants)
+  bset = set(devar.baseline for devar in derived_vars.values() if isinstance(devar,dv.ClimateIndex) and devar.baseline)
+  if len(bset) > 0:
+    logger.debug("\n{0:s} Opening baseline file '{1:s}'.\n".format(pidstr,baselinefile))
+    if const is None: const = dict()
+    with nc.Dataset(baselinefile, 'r', format='NETCDF4') as wrfbase:
+      for bvar in bset:
+        if bvar in wrfbase.variables: const[bvar] = wrfbase.variables[bvar][:]
+        else: raise ValueError("Baseline threshold '{:s}' not found in baseline file '{:s}'.".format(bvar,baselinefile))
 
   # check axes order of prerequisits and constants
   for devar in derived_vars.values():
@@ -654,6 +1058,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       elif lconst and pq in wrfconst.variables: pqax = wrfconst.variables[pq].dimensions
       elif lconst and pq in const: pqax = () # a scalar value, i.e. no axes
       elif pq in derived_vars: pqax = derived_vars[pq].axes
+      elif pq == wrftimestamp: pqax = wrfout.variables[pq].dimensions # timestamps (string variable)
       else: raise ValueError("Prerequisite '{:s} for variable '{:s}' not found!".format(pq,devar.name))
       # check axes for consistent order
       index = -1
@@ -663,6 +1068,32 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           if idx > index: index = idx
           else: raise IndexError("The axis order of '{:s}' and '{:s}' is inconsistent - this can lead to unexpected results!".format(devar.name,pq))
 
+  # spatial tiling: bands of rows are processed one at a time, so that the instantaneous fields of an input file
+  # (prerequisites and derived variables) fit into the memory budget; derived variables with a halo (e.g. central
+  # differences) are computed with neighbouring rows, but only the core is aggregated, so results are identical
+  tiles = [None] # default: the whole domain at once
+  if memorybudget and tileaxis in wrfout.dimensions:
+    if ldaily or any(devar.tmpdata is not None for devar in derived_vars.values()):
+      logger.info("\n{0:s} Spatial tiling is not supported for wrf{1:s} files (daily output or variables with carry-over state).".format(pidstr,filetype))
+    else:
+      ny = len(wrfout.dimensions[tileaxis]); nt = len(wrfout.dimensions[wrftime]) + 1 # one more for differences
+      def rowBytes(dims, dtype):
+        return np.dtype(dtype).itemsize * int(np.prod([nt if dim in (wrftime,time) else 1 if dim == tileaxis
+                                                       else len(wrfout.dimensions[midmap.get(dim,dim)]) for dim in dims]))
+      # prerequisites are kept in memory, other variables are read one at a time (derived variables are float)
+      varbytes = {varname:rowBytes(wrfout.variables[varname].dimensions, wrfout.variables[varname].dtype)
+                  for varname in varlist if tileaxis in wrfout.variables[varname].dimensions}
+      rowbytes = ( sum(nbytes for varname,nbytes in varbytes.items() if varname in pqset) +
+                   max([nbytes for varname,nbytes in varbytes.items() if varname not in pqset] or [0]) +
+                   sum(rowBytes(devar.axes, dv.dtype_float) for devar in derived_vars.values()
+                       if not devar.linear and tileaxis in devar.axes) )
+      halo = sum(devar.halo for devar in derived_vars.values()) # halos of dependent variables add up
+      nrow = max(1, int(memorybudget // (tilefactor * rowbytes)) - 2*halo) # rows in the core of a tile
+      if nrow < ny:
+        tiles = [(j0, min(j0+nrow,ny), min(halo,j0), min(halo,ny-min(j0+nrow,ny))) for j0 in range(0,ny,nrow)]
+        logger.info("\n{0:s} Processing wrf{1:s} files in {2:d} tiles of {3:d} rows (south_north).".format(pidstr,filetype,len(tiles),nrow))
+  # N.B.: variables without the tile axis are read and aggregated only once, with the first tile
+
   # announcement: format title string and print
   varstr = ''; devarstr = '' # make variable list, also for derived variables
   for var in varlist: varstr += '{}, '.format(var)
@@ -686,12 +1117,16 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
     assert time_desc.startswith("minutes since "), time_desc # just check units; date strings are garbled
     #assert "simulation start" in time_desc or begindate in time_desc or '**' in time_desc, time_desc
     # N.B.: garbled date strings seem to be too common for this assertion to be useful...
-    if t0 == 1 and not wrfout.variables[wrfxtime][0] == 0:
+    if t0 == 1 and not lchunk and not wrfxtimes[0] == 0:
       raise ValueError( 'XTIME in first input file does not start with 0!\n'+
                         '(this can happen, when the first input file is missing)' )
   elif wrftimestamp in wrfout.variables:
     lxtime = False # interpret timestamp in Times using datetime module
   else: raise TypeError
+  # chunks don't start with the simulation, so the simulation start has to be inferred from model time
+  if lchunk and lxtime and const is not None:
+    simstart = calendars.getSeconds(calendars.parseTimeStamps(wrftimes[:1]), calendar)[0] - int(round(wrfxtimes[0]))*60
+    const['SimulationStart'] = str(calendars.getTimeStamps(simstart, calendar)) # same format as WRF timestamps
 
   # check if there is a missing_value flag
   if 'P_LEV_MISSING' in wrfout.ncattrs():
@@ -700,29 +1135,51 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   else: missing_value = None
 
   # allocate fields
-  data = dict() # temporary data arrays
+  data = dict() # monthly averages (used to compute linear derived variables)
+  accdata = dict() # preallocated accumulators for base variables (double precision)
   for var in varlist:
       tmpshape = list(wrfout.variables[var].shape)
       del tmpshape[wrfout.variables[var].dimensions.index(wrftime)] # allocated arrays have no time dimension
       assert len(tmpshape) ==  len(wrfout.variables[var].shape) -1
-      data[var] = np.zeros(tmpshape, dtype=dtype_float) # allocate
-      #if missing_value is not None:
-      #  data[var] += missing_value # initialize with missing value
+      accdata[var] = dv.Aggregator(tmpshape, mode='sum') # allocate
+      # N.B.: for accumulated variables only the data array of the accumulator is used (difference of end points)
   # allocate derived data arrays (for non-linear variables)
   pqdata = {pqvar:None for pqvar in pqset} # temporary data array holding instantaneous values to compute derived variables
   # N.B.: since data is only referenced from existing arrays, allocation is not necessary
-  dedata = dict() # non-linear derived variables
+  dedata = dict() # accumulators for non-linear derived variables
   # N.B.: linear derived variables are computed directly from the monthly averages
   for dename,devar in derived_vars.items():
       if not devar.linear:
           tmpshape = [len(wrfout.dimensions[ax]) for ax in devar.axes if ax != time] # infer shape
           assert len(tmpshape) ==  len(devar.axes) -1 # no time dimension
-          dedata[dename] = np.zeros(tmpshape, dtype=dtype_float) # allocate
+          dedata[dename] = devar.getAggregator(tmpshape) # allocate (sum or extrema)
 
 
+  # running statistics by calendar month (chunks are merged first, see mergeChunks)
+  climatology = Climatology() if lclimatology and chunk is None else None
+
   # prepare computation of monthly means
   filecounter = 0 # number of wrfout file currently processed
   i0 = t0-1 # index position we write to: i = i0 + n (zero-based, of course)
+  carrystate = None # carry-over state at the end of the last completed month (only if lsavestate)
+  n0 = 0 # first month to process
+  if lresume:
+    # restore carry-over state from the end of the last committed month (e.g. consecutive and interval extrema)
+    if lcarryover:
+      carrystate = loadState(monthly_filepath, committed)
+      if carrystate is not None: tmpdata.update(copy.deepcopy(carrystate))
+      elif committed > 0 and any(devar.carryover for devar in derived_vars.values()):
+        logger.info("{0:s} No carry-over state for month {1:d} found; periods that span months may be truncated.".format(pidstr,committed))
+    # skip completed months and seek straight to the input file that contains the first month to compute
+    if committed > i0 and committed - i0 < len(times):
+      nextyear, nextmonth = divmod(committed-i0+beginmonth-1,12)
+      monthstart = '{0:04d}-{1:02d}-01_00:00:00'.format(nextyear+beginyear,nextmonth+1)
+      nextcounter = findInputFile(monthstart)
+      if nextcounter is not None:
+        n0 = committed - i0; filecounter = nextcounter
+        wrfout.close(); wrfout = None # N.B.: the new file is only opened, when it is actually needed
+        logger.debug("\n{0:s} Resuming at {1:s} with input file '{2:s}'.".format(pidstr,monthstart[:7],filelist[filecounter]))
+      # N.B.: if the input file can not be determined, completed months are skipped as usual
   if ldaily: daily_start_idx = daily_end_idx = timestep_start # for each file cycle, the time index where to write the data
   ## start loop over month
   if lparallel: progressstr = '' # a string printing the processed dates
@@ -732,7 +1189,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
   try:
 
     # loop over month and progressively stepping through input files
-    for n,meantime in enumerate(times):
+    for n,meantime in enumerate(times[n0:], start=n0):
         # meantime: (complete) month since simulation start
 
         lasttimestamp = None # carry over start time, when moving to the next file (defined below)
@@ -741,14 +1198,13 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
 
         # extend time array / month counter
         meanidx = i0 + n
+        if chunk is not None and lcarryover: tmpdata['COX_MONTH'] = meanidx # track leading periods (for stitching)
         if meanidx == len(monthly_dataset.variables[time]):
           lskip = False # append next data point / time step
         elif loverwrite or laddnew or lrecalc:
           lskip = False # overwrite this step or add data point for new variables
-        elif meanidx == len(monthly_dataset.variables[time])-1:
-          if lrecover or monthly_dataset.variables[time][meanidx] == -1:
-            lskip = False # recompute last step, because it may be incomplete
-          else: lskip = True
+        elif committed is not None and meanidx >= committed:
+          lskip = False # recompute months that were not committed (e.g. the last month may be incomplete)
         else:
           lskip = True # skip this step, but we still have to verify the timing
         # check if we are overwriting existing data
@@ -762,17 +1218,45 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
         # sanity checks
         assert meanidx + 1 == meantime
         currentdate = '{0:04d}-{1:02d}'.format(currentyear,currentmonth)
-        # determine appropriate start index
-        wrfstartidx = 0
-        while currentdate > str(nc.chartostring(wrfout.variables[wrftimestamp][wrfstartidx,0:7])):
-          wrfstartidx += 1 # count forward
+        currentmonth64 = np.datetime64(currentdate, 'M') # for searching in the month index
+
+        # skipped months: use the catalog to move directly to the file with the beginning of the next month
+        if lskip and catalog is not None:
+          nextmonth = '{0:s}-01_00:00:00'.format(str(currentmonth64+1)) # first timestamp of next month
+          nextcounter = filecounter
+          while nextcounter < len(filelist) and catalog[filelist[nextcounter]]['end'] < nextmonth: nextcounter += 1
+          # N.B.: if the next month starts with the last time step of a file, the averaging loop continues in the next
+          #       file, so the time step has to be duplicated there (the next file has to begin with it, like a restart)
+          if nextcounter < len(filelist) and catalog[filelist[nextcounter]]['end'] == nextmonth:
+            if nextcounter+1 < len(filelist) and catalog[filelist[nextcounter+1]]['begin'] > nextmonth:
+              raise DateError("{0:s} First time step of the next month ('{1:s}') is the last time step in file '{2:s}', but missing in the next file.".format(pidstr,nextmonth,filelist[nextcounter]))
+            nextcounter += 1
+          if nextcounter < len(filelist):
+            if nextcounter > filecounter:
+              if wrfout is not None: wrfout.close() # close file
+              wrfout = None # N.B.: the new file is only opened, when it is actually needed
+              filecounter = nextcounter # move to file with beginning of next month
+            # print feedback (the current month) to indicate completion
+            if lparallel: progressstr += '{0:s}, '.format(currentdate) # bundle output in parallel mode
+            else: logger.info('{0:s},'.format(currentdate)) # serial mode
+            continue # skip to next month
+          # N.B.: if the end of the month is not in the catalog, proceed normally (this will terminate the loop)
+        if wrfout is None:
+          # open input file, after skipping months using the catalog
+          logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
+          wrfout = openInputFile(filelist[filecounter]) # ... and open new one
+          wrfchars, wrftimes, wrfindex, wrfmonths, wrfxtimes = readTimeAxis(wrfout) # time axis of new file
+          # check consistency of missing value flag
+          assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
+        # determine appropriate start index (first time step in the current month)
+        wrfstartidx = int(np.searchsorted(wrfmonths, currentmonth64, side='left'))
         if wrfstartidx != 0: logger.debug('\n{0:s} {1:s}: Starting month at index {2:d}.'.format(pidstr, currentdate, wrfstartidx))
         # save WRF time-stamp for beginning of month for the new file, for record
-        firsttimestamp_chars = wrfout.variables[wrftimestamp][wrfstartidx,:]
-        #logger.debug('\n{0:s}{1:s}-01_00:00:00, {2:s}'.format(pidstr, currentdate, str(nc.chartostring(wrfout.variables[wrftimestamp][wrfstartidx,:])))
-        if '{0:s}-01_00:00:00'.format(currentdate,) == str(nc.chartostring(wrfout.variables[wrftimestamp][wrfstartidx,:])):
+        firsttimestamp_chars = wrfchars[wrfstartidx,:]
+        #logger.debug('\n{0:s}{1:s}-01_00:00:00, {2:s}'.format(pidstr, currentdate, wrftimes[wrfstartidx]))
+        if '{0:s}-01_00:00:00'.format(currentdate,) == wrftimes[wrfstartidx]:
             pass # proper start of the month
-        elif meanidx == 0 and '{0:s}-01_06:00:00'.format(currentdate,) == str(nc.chartostring(wrfout.variables[wrftimestamp][wrfstartidx,:])):
+        elif meanidx == 0 and '{0:s}-01_06:00:00'.format(currentdate,) == wrftimes[wrfstartidx]:
             pass # for some reanalysis... but only at start of simulation
         else: raise DateError("{0:s} Did not find first day of month to compute monthly average.".format(pidstr) +
                                 "file: {0:s} date: {1:s}-01_00:00:00".format(monthly_file,currentdate))
@@ -782,13 +1266,12 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
         ntime = 0 # accumulated output time steps
         # time when accumulation starts (in minutes)
         # N.B.: the first value is saved as negative, so that adding the last value yields a positive interval
-        if lxtime: xtime = -1 * wrfout.variables[wrfxtime][wrfstartidx] # minutes
+        if lxtime: xtime = -1 * wrfxtimes[wrfstartidx] # minutes
         monthlytimestamps = [] # list of timestamps, also used for time period calculation
         # clear temporary arrays
-        for varname,var in data.items(): # base variables
-            data[varname] = np.zeros(var.shape, dtype=dtype_float) # reset to zero
-        for dename,devar in dedata.items(): # derived variables
-            dedata[dename] = np.zeros(devar.shape, dtype=dtype_float) # reset to zero
+        for agg in accdata.values(): agg.reset() # base variables (reset in-place)
+        for agg in dedata.values(): agg.reset() # derived variables
+        intercache.expire('month') # intermediate results of the previous month
 
         ## loop over files and average
         while not lcomplete:
@@ -796,12 +1279,8 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
             # determine valid end index by checking dates from the end counting backwards
             # N.B.: start index is determined above (if a new file was opened in the same month,
             #       the start index is automatically set to 0 or 1 when the file is opened, below)
-            wrfendidx = len(wrfout.dimensions[wrftime])-1
-            while wrfendidx >= 0 and currentdate < str(nc.chartostring(wrfout.variables[wrftimestamp][wrfendidx,0:7])):
-                if not lcomplete: lcomplete = True # break loop over file if next month is in this file (critical!)
-                wrfendidx -= 1 # count backwards
-            #if wrfendidx < len(wrfout.dimensions[wrftime])-1: # check if count-down actually happened
-            wrfendidx += 1 # reverse last step so that counter sits at first step of next month
+            wrfendidx = int(np.searchsorted(wrfmonths, currentmonth64, side='right')) # first step of next month
+            if wrfendidx < len(wrfmonths): lcomplete = True # break loop over file if next month is in this file (critical!)
             # N.B.: if this is not the last file, there was no iteration and wrfendidx should be the length of the the file;
             #       in this case, wrfendidx is only used to define Python ranges, which are exclusive to the upper boundary;
             #       if the first date in the file is already the next month, wrfendidx will be 0 and this is the final step;
@@ -813,168 +1292,242 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
                 lskip = True # don't write results for this month!
 
             if not lskip:
-              ## compute monthly averages
-              # loop over variables
-              for varname in varlist:
-                  logger.debug('{0:s} {1:s}'.format(pidstr,varname))
-                  if varname not in wrfout.variables:
-                      logger.info("{:s} Variable {:s} missing in file '{:s}' - filling with NaN!".format(pidstr,varname,filelist[filecounter]))
-                      data[varname] *= np.NaN # turn everything into NaN, if variable is missing
-                      # N.B.: this can happen, when an output stream was reconfigured between cycle steps
-                  else:
-                      var = wrfout.variables[varname]
-                      tax = var.dimensions.index(wrftime) # index of time axis
-                      slices = [slice(None)]*len(var.shape)
-                      # construct informative IOError message
-                      ioerror = "An Error occcured in file '{:s}'; variable: '{:s}'\n('{:s}')".format(filelist[filecounter], varname, infolder)
-                      # decide how to average
-                      ## Accumulated Variables
-                      if varname in acclist:
-                          if missing_value is not None:
-                              raise NotImplementedError("Can't handle accumulated variables with missing values yet.")
-                          # compute mean as difference between end points; normalize by time difference
-                          if ntime == 0: # first time step of the month
-                              slices[tax] = wrfstartidx # relevant time interval
-                              try: tmp = var.__getitem__(slices) # get array
-                              except: raise IOError(ioerror) # informative IO Error
-                              if acclist[varname] is not None: # add bucket level, if applicable
-                                bkt = wrfout.variables[bktpfx+varname]
-                                tmp += bkt.__getitem__(slices) * acclist[varname]
-                              # check that accumulated fields at the beginning of the simulation are zero
-                              if meanidx == 0 and wrfstartidx == 0:
-                                # note  that if we are skipping the first step, there is no check
-                                if np.max(tmp) != 0 or np.min(tmp) != 0:
-                                  raise ValueError( 'Accumulated fields were not initialized with zero!\n' +
-                                                      '(this can happen, when the first input file is missing)' )
-                              data[varname] = -1 * tmp # so we can do an in-place operation later
-                          # N.B.: both, begin and end, can be in the same file, hence elif is not appropriate!
-                          if lcomplete: # last step
-                              slices[tax] = wrfendidx # relevant time interval
-                              try: tmp = var.__getitem__(slices) # get array
-                              except: raise IOError(ioerror) # informative IO Error
-                              if acclist[varname] is not None: # add bucket level, if applicable
-                                bkt = wrfout.variables[bktpfx+varname]
-                                tmp += bkt.__getitem__(slices) * acclist[varname]
-                              data[varname] +=  tmp # the starting data is already negative
-                          # if variable is a prerequisit to others, compute instantaneous values
-                          if varname in pqset:
-                              # compute mean via sum over all elements; normalize by number of time steps
-                              if lsmplDiff: slices[tax] = slice(wrfstartidx,wrfendidx+1) # load longer time interval for diff
-                              else: slices[tax] = slice(wrfstartidx,wrfendidx) # relevant time interval
-                              try: tmp = var.__getitem__(slices) # get array
-                              except: raise IOError(ioerror) # informative IO Error
-                              if acclist[varname] is not None: # add bucket level, if applicable
-                                bkt = wrfout.variables[bktpfx+varname]
-                                tmp = tmp + bkt.__getitem__(slices) * acclist[varname]
-                              if lsmplDiff: pqdata[varname] = np.diff(tmp, axis=tax) # simple differences
-                              else: pqdata[varname] = dv.ctrDiff(tmp, axis=tax, delta=1) # normalization comes later
-      ##
-      ##  ***  daily values for bucket variables are generated here,  ***
-      ##  ***  but should we really use *centered* differences???     ***
-      ##
-                      elif varname[0:len(bktpfx)] == bktpfx:
-                          pass # do not process buckets
-                      ## Normal Variables
-                      else:
-                          # skip "empty" steps (only needed to difference accumulated variables)
-                          if wrfendidx > wrfstartidx:
-                              # compute mean via sum over all elements; normalize by number of time steps
-                              slices[tax] = slice(wrfstartidx,wrfendidx) # relevant time interval
-                              try: tmp = var.__getitem__(slices) # get array
-                              except: raise IOError(ioerror) # informative IO Error
-                              if missing_value is not None:
-                                  # N.B.: missing value handling is really only necessary when missing values are time-dependent
-                                  tmp = np.where(tmp == missing_value, np.NaN, tmp) # set missing values to NaN
-                                  #tmp = ma.masked_equal(tmp, missing_value, copy=False) # mask missing values
-                              data[varname] = data[varname] + tmp.sum(axis=tax) # add to sum
-                              # N.B.: in-place operations with non-masked array destroy the mask, hence need to use this
-                              # keep data in memory if used in computation of derived variables
-                              if varname in pqset: pqdata[varname] = tmp
-
-              ## compute derived variables
-              # but first generate a list of timestamps
+              ## time stamps and output interval (the same for all tiles)
+              # generate a list of timestamps
               if lcomplete: tmpendidx = wrfendidx
               else: tmpendidx = wrfendidx -1 # end of file
               # assemble list of time stamps
-              currenttimestamps = [] # relevant timestamps in this file
-              for i in range(wrfstartidx,tmpendidx+1):
-                  timestamp = str(nc.chartostring(wrfout.variables[wrftimestamp][i,:]))
-                  currenttimestamps.append(timestamp)
+              currenttimestamps = wrftimes[wrfstartidx:tmpendidx+1].tolist() # relevant timestamps in this file
               monthlytimestamps.extend(currenttimestamps) # add to monthly collection
               # write daily timestamps
               if ldaily:
-                  nsteps = wrfendidx - wrfstartidx
+                  if resampler is None: nsteps = wrfendidx - wrfstartidx
+                  elif wrfendidx > wrfstartidx:
+                      # intervals that are complete after this segment (based on the first record after the segment)
+                      if wrfendidx < len(wrfindex): nextstamp = wrfindex[wrfendidx]
+                      else: nextstamp = wrfindex[wrfendidx-1] + ( wrfindex[wrfendidx-1] - wrfindex[wrfendidx-2] ) # end of file
+                      dailyintervals = resampler.advance(wrfindex[wrfstartidx:wrfendidx], nextstamp)
+                      nsteps = len(dailyintervals)
+                  else: nsteps = 0
                   daily_start_idx = daily_end_idx # from previous step
                   daily_end_idx = daily_start_idx + nsteps
                   # set time values to -1, to inticate they are being worked on
                   daily_dataset.variables[time][daily_start_idx:daily_end_idx] = -1
                   ncvar = None; vardata = None # dummies, to prevent crash later on, if varlist is empty
                   # copy timestamp and xtime data
-                  daily_dataset.variables[wrftimestamp][daily_start_idx:daily_end_idx,:] = wrfout.variables[wrftimestamp][wrfstartidx:wrfendidx,:]
-                  if lxtime:
-                      daily_dataset.variables[wrfxtime][daily_start_idx:daily_end_idx] = wrfout.variables[wrfxtime][wrfstartidx:wrfendidx]
+                  if resampler is None:
+                      daily_dataset.variables[wrftimestamp][daily_start_idx:daily_end_idx,:] = wrfchars[wrfstartidx:wrfendidx,:]
+                      if lxtime:
+                          daily_dataset.variables[wrfxtime][daily_start_idx:daily_end_idx] = wrfxtimes[wrfstartidx:wrfendidx]
+                  elif nsteps > 0: # beginning of resampled intervals
+                      dailystarts = resampler.getStart(dailyintervals)
+                      dailystamps = np.char.replace(np.datetime_as_string(dailystarts, unit='s'), 'T', '_')
+                      daily_dataset.variables[wrftimestamp][daily_start_idx:daily_end_idx,:] = dailystamps.astype('S19').view('S1').reshape((nsteps,19))
+                      if lxtime: # minutes since simulation start
+                          daily_dataset.variables[wrfxtime][daily_start_idx:daily_end_idx] = ( wrfxtimes[wrfstartidx] +
+                                                  ( dailystarts - wrfindex[wrfstartidx] ) / np.timedelta64(1,'m') )
                   daily_dataset.sync()
-              # normalize accumulated pqdata with output interval time
               if wrfendidx > wrfstartidx:
                   assert tmpendidx > wrfstartidx, 'There should never be a single value in a file: wrfstartidx={:d}, wrfendidx={:d}, lcomplete={:s}'.format(wrfstartidx,wrfendidx,str(lcomplete))
                   # compute time delta
-                  delta = dv.calcTimeDelta(currenttimestamps)
+                  delta = dv.calcTimeDelta(currenttimestamps, calendar=calendar)
                   if lxtime:
-                    xdelta = wrfout.variables[wrfxtime][tmpendidx] - wrfout.variables[wrfxtime][wrfstartidx]
+                    xdelta = wrfxtimes[tmpendidx] - wrfxtimes[wrfstartidx]
                     xdelta *=  60. # convert minutes to seconds
                     if delta != xdelta: raise ValueError("Time calculation from time stamps and model time are inconsistent: {:f} != {:f}".format(delta,xdelta))
                   delta /=  float(tmpendidx - wrfstartidx) # the average interval between output time steps
-                  # loop over time-step data
-                  for pqname,pqvar in pqdata.items():
-                    if pqname in acclist: pqvar /= delta # normalize
-                  # write to daily file
-                  if ldaily:
-                      # loop over variables and save data arrays
-                      for varname in daily_varlist:
-                          ncvar = daily_dataset.variables[varname] # destination variable in daily output
-                          vardata = pqdata[varname] # timestep data
-                          if missing_value is not None: # make sure the missing value flag is preserved
-                            vardata = np.where(np.isnan(vardata), missing_value, vardata)
-                            ncvar.missing_value = missing_value # just to make sure
-                          if ncvar.ndim > 1: ncvar[daily_start_idx:daily_end_idx,:] = vardata # here time is always the outermost index
-                          else: ncvar[daily_start_idx:daily_end_idx] = vardata
-                      daily_dataset.sync()
-                  # loop over derived variables
-                  # special treatment for certain string variables
-                  if 'Times' in pqset: pqdata['Times'] = currenttimestamps[:wrfendidx-wrfstartidx] # need same length as actual time dimension
-                  logger.debug('\n{0:s} Available prerequisites: {1:s}'.format(pidstr, str(list(pqdata.keys()))))
-                  for dename,devar in derived_vars.items():
-                    if not devar.linear: # only non-linear ones here, linear one at the end
-                      logger.debug('{0:s} {1:s} {2:s}'.format(pidstr, dename, str(devar.prerequisites)))
-                      tmp = devar.computeValues(pqdata, aggax=tax, delta=delta, const=const, tmp=tmpdata) # possibly needed as pre-requisite
-                      dedata[dename] = devar.aggregateValues(tmp, aggdata=dedata[dename], aggax=tax)
-                      # N.B.: in-place operations with non-masked array destroy the mask, hence need to use this
-                      if dename in pqset: pqdata[dename] = tmp
-                      # save to daily output
-                      if ldaily:
-                          if dename in daily_derived_vars:
-                              ncvar = daily_dataset.variables[dename] # destination variable in daily output
-                              vardata = tmp
-                              if missing_value is not None: # make sure the missing value flag is preserved
-                                vardata = np.where(np.isnan(vardata), missing_value, vardata)
-                                ncvar.missing_value = missing_value # just to make sure
-                              if ncvar.ndim > 1: ncvar[daily_start_idx:daily_end_idx,:] = vardata # here time is always the outermost index
-                              else: ncvar[daily_start_idx:daily_end_idx] = vardata
-                      # N.B.: missing values should be handled implicitly, following missing values in pre-requisites
-                      del tmp # memory hygiene
-                  if ldaily:
-                      # add time in seconds, based on index and time delta
-                      daily_dataset.variables[time][daily_start_idx:daily_end_idx] = np.arange(daily_start_idx,daily_end_idx, dtype='i8')*int(delta)
-                      daily_dataset.end_date = dv.getTimeStamp(wrfout, wrfendidx-1, wrftimestamp) # update current end date
-                      # N.B.: adding the time coordinate and attributes finalized this step
-                      # sync data and clear memory
-                      daily_dataset.sync(); daily_dataset.close() # sync and close dataset
-                      del daily_dataset, ncvar, vardata # remove all other references to data
-                      gc.collect() # clean up memory
-                      # N.B.: the netCDF4 module keeps all data written to a netcdf file in memory; there is no flush command
-                      daily_dataset = nc.Dataset(tmp_daily_filepath, mode='a', format='NETCDF4') # re-open to append more data (mode='a')
-                      # N.B.: flushing the mean file here prevents repeated close/re-open when no data was written (i.e.
-                      #       the month was skiped); only flush memory when data was actually written.
+              ## loop over tiles (a single tile is the whole domain; see PYAVG_MEMORY)
+              for tile in tiles:
+                ## compute monthly averages
+                # loop over variables
+                for varname in varlist:
+                    logger.debug('{0:s} {1:s}'.format(pidstr,varname))
+                    if varname not in wrfout.variables:
+                        logger.info("{:s} Variable {:s} missing in file '{:s}' - filling with NaN!".format(pidstr,varname,filelist[filecounter]))
+                        accdata[varname].data.fill(np.NaN) # turn everything into NaN, if variable is missing
+                        # N.B.: this can happen, when an output stream was reconfigured between cycle steps
+                    else:
+                        var = wrfout.variables[varname]
+                        tax = var.dimensions.index(wrftime) # index of time axis
+                        slices = [slice(None)]*len(var.shape)
+                        # hyperslab of the current tile (prerequisites include the halo) and position in the accumulator
+                        if tile is not None and tileaxis in var.dimensions:
+                          snax = var.dimensions.index(tileaxis); aggidx = tileIndex(var.dimensions, tile, 'agg')
+                          coreidx = tileIndex(var.dimensions, tile, 'core') if varname in pqset else None
+                        elif tile is not None and tile[0] > 0: continue # variables without tile axis are only processed once
+                        else: snax = None; aggidx = None; coreidx = None
+                        # construct informative IOError message
+                        ioerror = "An Error occcured in file '{:s}'; variable: '{:s}'\n('{:s}')".format(filelist[filecounter], varname, infolder)
+                        # decide how to average
+                        ## Accumulated Variables
+                        if varname in acclist:
+                            if missing_value is not None:
+                                raise NotImplementedError("Can't handle accumulated variables with missing values yet.")
+                            # compute mean as difference between end points; normalize by time difference
+                            accview = accdata[varname].data if aggidx is None else accdata[varname].data[aggidx] # a view
+                            if varname in pqset:
+                                # read the slab of this file once: the end points for the mean and all records in
+                                # between for instantaneous rates (the end point is only included, if it is needed)
+                                nrec = wrfendidx - wrfstartidx + (1 if lsmplDiff else 0) # records for differences
+                                slices[tax] = slice(wrfstartidx, wrfendidx+1 if lcomplete or lsmplDiff else wrfendidx)
+                                if snax is not None: slices[snax] = tileSlice(tile, 'read') # include halo
+                                try: tmp = readVar(var, slices) # get array
+                                except: raise IOError(ioerror) # informative IO Error
+                                if acclist[varname] is not None: # add bucket level, if applicable
+                                  bkt = wrfout.variables[bktpfx+varname]
+                                  total = np.multiply(readVar(bkt, slices), acclist[varname], dtype=np.float64)
+                                  tmp = np.add(total, np.ma.getdata(tmp), out=total) # in-place (double precision)
+                                # end points (core of the tile) for the mean
+                                pointidx = list(coreidx) if coreidx is not None else [slice(None)]*tmp.ndim
+                                if ntime == 0: # first time step of the month
+                                    pointidx[tax] = 0
+                                    # check that accumulated fields at the beginning of the simulation are zero
+                                    if meanidx == 0 and wrfstartidx == 0 and not lchunk:
+                                      # note  that if we are skipping the first step, there is no check
+                                      if np.max(tmp[tuple(pointidx)]) != 0 or np.min(tmp[tuple(pointidx)]) != 0:
+                                        raise ValueError( 'Accumulated fields were not initialized with zero!\n' +
+                                                            '(this can happen, when the first input file is missing)' )
+                                    np.negative(np.ma.getdata(tmp[tuple(pointidx)]), out=accview) # so we can do an in-place operation later
+                                if lcomplete: # last step
+                                    pointidx[tax] = wrfendidx - wrfstartidx
+                                    np.add(accview, np.ma.getdata(tmp[tuple(pointidx)]), out=accview) # the starting data is already negative
+                                # instantaneous rates (normalization comes later)
+                                tmp = tmp[(slice(None),)*tax + (slice(0,nrec),)] # a view
+                                # N.B.: bucket levels are added in double precision, but rates are stored in single precision
+                                if lsmplDiff: pqdata[varname] = np.diff(tmp, axis=tax).astype(dtype_float) # simple differences
+                                else: pqdata[varname] = dv.ctrDiff(tmp, axis=tax, delta=1) # normalization comes later
+                            else:
+                                # only the end points are needed
+                                if snax is not None: slices[snax] = tileSlice(tile, 'agg') # no halo necessary
+                                if ntime == 0: # first time step of the month
+                                    slices[tax] = wrfstartidx # relevant time interval
+                                    try: tmp = readVar(var, slices) # get array
+                                    except: raise IOError(ioerror) # informative IO Error
+                                    if acclist[varname] is not None: # add bucket level, if applicable
+                                      bkt = wrfout.variables[bktpfx+varname]
+                                      tmp = np.add(np.multiply(readVar(bkt, slices), acclist[varname], dtype=np.float64), tmp)
+                                    # check that accumulated fields at the beginning of the simulation are zero
+                                    if meanidx == 0 and wrfstartidx == 0 and not lchunk:
+                                      # note  that if we are skipping the first step, there is no check
+                                      if np.max(tmp) != 0 or np.min(tmp) != 0:
+                                        raise ValueError( 'Accumulated fields were not initialized with zero!\n' +
+                                                            '(this can happen, when the first input file is missing)' )
+                                    np.negative(np.ma.getdata(tmp), out=accview) # so we can do an in-place operation later
+                                # N.B.: both, begin and end, can be in the same file, hence elif is not appropriate!
+                                if lcomplete: # last step
+                                    slices[tax] = wrfendidx # relevant time interval
+                                    try: tmp = readVar(var, slices) # get array
+                                    except: raise IOError(ioerror) # informative IO Error
+                                    if acclist[varname] is not None: # add bucket level, if applicable
+                                      bkt = wrfout.variables[bktpfx+varname]
+                                      tmp = np.add(np.multiply(readVar(bkt, slices), acclist[varname], dtype=np.float64), tmp)
+                                    np.add(accview, np.ma.getdata(tmp), out=accview) # the starting data is already negative
+        ##
+        ##  ***  daily values for bucket variables are generated here,  ***
+        ##  ***  but should we really use *centered* differences???     ***
+        ##
+                        elif varname[0:len(bktpfx)] == bktpfx:
+                            pass # do not process buckets
+                        ## Normal Variables
+                        else:
+                            # skip "empty" steps (only needed to difference accumulated variables)
+                            if wrfendidx > wrfstartidx:
+                                # compute mean via sum over all elements; normalize by number of time steps
+                                slices[tax] = slice(wrfstartidx,wrfendidx) # relevant time interval
+                                if snax is not None: slices[snax] = tileSlice(tile, 'agg' if coreidx is None else 'read')
+                                try: tmp = readVar(var, slices) # get array
+                                except: raise IOError(ioerror) # informative IO Error
+                                if missing_value is not None:
+                                    # N.B.: missing value handling is really only necessary when missing values are time-dependent
+                                    tmp = np.where(tmp == missing_value, np.NaN, tmp) # set missing values to NaN
+                                    #tmp = ma.masked_equal(tmp, missing_value, copy=False) # mask missing values
+                                with profiler.timer('aggregate', varname):
+                                  accdata[varname].aggregate(tmp if coreidx is None else tmp[coreidx], aggax=tax,
+                                                             index=aggidx) # add to sum (in-place; masks are tracked separately)
+                                # keep data in memory if used in computation of derived variables
+                                if varname in pqset: pqdata[varname] = tmp
+
+                ## compute derived variables
+                if wrfendidx > wrfstartidx:
+                    # normalize accumulated pqdata with output interval time
+                    # loop over time-step data
+                    for pqname,pqvar in pqdata.items():
+                      if pqname in acclist: pqvar /= delta # normalize
+                    # write to daily file
+                    if ldaily:
+                        # loop over variables and save data arrays
+                        for varname in daily_varlist:
+                            ncvar = daily_dataset.variables[varname] # destination variable in daily output
+                            vardata = pqdata[varname] # timestep data
+                            if resampler is not None: # complete intervals (the rest is carried over)
+                              vardata = resampler.resample(varname, vardata, aggax=tax, delta=delta)
+                              if vardata is None: continue
+                            if missing_value is not None: # make sure the missing value flag is preserved
+                              vardata = np.where(np.isnan(vardata), missing_value, vardata)
+                              ncvar.missing_value = missing_value # just to make sure
+                            writeVar(ncvar, slice(daily_start_idx,daily_end_idx), vardata)
+                        daily_dataset.sync()
+                    # loop over derived variables
+                    # special treatment for certain string variables
+                    if 'Times' in pqset: pqdata['Times'] = currenttimestamps[:wrfendidx-wrfstartidx] # need same length as actual time dimension
+                    intercache.scope = tile # intermediate results depend on the tile
+                    # constant fields of the current tile (including halo)
+                    if tile is None or const is None: tileconst = const
+                    else: tileconst = {cname:cval[tileIndex(constdims[cname], tile, 'read')] if tileaxis in constdims.get(cname,()) else cval
+                                       for cname,cval in const.items()}
+                    logger.debug('\n{0:s} Available prerequisites: {1:s}'.format(pidstr, str(list(pqdata.keys()))))
+                    def computeDerived(detask):
+                        ''' compute instantaneous values of a (group of) derived variable(s) and aggregate (can run in a thread) '''
+                        devars = [derived_vars[dename] for dename in detask]
+                        for devar in devars: logger.debug('{0:s} {1:s} {2:s}'.format(pidstr, devar.name, str(devar.prerequisites)))
+                        partial = None # values that are already reduced
+                        with profiler.timer('derived', devars[0].__class__.__name__ if len(devars) == 1 else 'ExpressionGroup'):
+                          if len(devars) > 1: # a group of expression variables (evaluated in one pass)
+                            tmps = dv.evaluateGroup(devars, pqdata, aggax=tax, delta=delta, const=tileconst, tmp=tmpdata)
+                          else:
+                            if detask[0] in dereduce: # only the aggregate is needed
+                              partial = devars[0].reduceValues(pqdata, aggax=tax, delta=delta, const=tileconst, tmp=tmpdata)
+                            if partial is None: tmps = [devars[0].computeValues(pqdata, aggax=tax, delta=delta, const=tileconst, tmp=tmpdata)]
+                        with profiler.timer('aggregate', detask[0] if len(detask) == 1 else 'ExpressionGroup'):
+                          if partial is not None:
+                            partial, aggidx = tileCore(partial, devars[0].axes, tile)
+                            if partial is not None: dedata[detask[0]].add(partial, index=aggidx)
+                            return [None] # no instantaneous values
+                          for dename,tmp in zip(detask,tmps):
+                            coredata, aggidx = tileCore(tmp, derived_vars[dename].axes, tile)
+                            dedata[dename].aggregate(coredata, aggax=tax, index=aggidx) # in-place; masks are tracked separately
+                        return tmps # possibly needed as pre-requisite
+                    # only non-linear ones here, linear one at the end; independent branches of the graph can run concurrently
+                    for detask,tmps in degraph.schedule(detasks, computeDerived, pool=varpool): # in dependency order
+                      for dename,tmp in zip(detask,tmps):
+                        if dename in pqset: pqdata[dename] = tmp
+                        # save to daily output
+                        if ldaily:
+                            if dename in daily_derived_vars:
+                                ncvar = daily_dataset.variables[dename] # destination variable in daily output
+                                vardata = tmp
+                                if resampler is not None: # complete intervals (the rest is carried over)
+                                  vardata = resampler.resample(dename, vardata, aggax=tax, delta=delta)
+                                if vardata is not None and missing_value is not None: # make sure the missing value flag is preserved
+                                  vardata = np.where(np.isnan(vardata), missing_value, vardata)
+                                  ncvar.missing_value = missing_value # just to make sure
+                                if vardata is not None: writeVar(ncvar, slice(daily_start_idx,daily_end_idx), vardata)
+                        # N.B.: missing values should be handled implicitly, following missing values in pre-requisites
+                        del tmp # memory hygiene
+                    intercache.expire('step') # intermediate results of this record/tile are no longer needed
+              if ldaily and daily_end_idx > daily_start_idx:
+                  if resampler is None:
+                    # add time in seconds, based on index and time delta
+                    daily_dataset.variables[time][daily_start_idx:daily_end_idx] = np.arange(daily_start_idx,daily_end_idx, dtype='i8')*int(delta)
+                    daily_dataset.end_date = wrftimes[wrfendidx-1].replace('_',' ') # update current end date
+                  else:
+                    # add time in seconds, based on the interval index (relative to the beginning of the file)
+                    daily_dataset.variables[time][daily_start_idx:daily_end_idx] = np.asarray(dailyintervals, dtype='i8')*dailyinterval
+                    daily_dataset.end_date = dailystamps[-1].replace('_',' ') # beginning of the last interval
+                  # N.B.: adding the time coordinate and attributes finalized this step
+                  # sync data (memory is bounded by the chunk cache; re-opening is optional)
+                  ncvar = None; vardata = None # remove all other references to data
+                  with profiler.timer('write', 'flush'): daily_dataset = daily_writer.flush() # handle changes, if the dataset is re-opened
 
 
               # increment counters
@@ -988,9 +1541,9 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
                       raise DateError('Timestamps not in order, or repetition: {:s}'.format(timestamp))
                     laststamp = timestamp
                   # calculate time period and check against model time (if available)
-                  timeperiod = dv.calcTimeDelta(monthlytimestamps)
+                  timeperiod = dv.calcTimeDelta(monthlytimestamps, calendar=calendar)
                   if lxtime:
-                    xtime += wrfout.variables[wrfxtime][wrfendidx] # get final time interval (in minutes)
+                    xtime += wrfxtimes[wrfendidx] # get final time interval (in minutes)
                     xtime *=  60. # convert minutes to seconds
                     if timeperiod != xtime:
                       logger.info("Time calculation from time stamps and model time are inconsistent: {:f} != {:f}".format(timeperiod,xtime))
@@ -998,17 +1551,14 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
             # if we reached the end of the file, open a new one and go again
             if not lcomplete:
                 # N.B.: here wrfendidx is not a valid time step, but the length of the file, i.e. wrfendidx-1 is the last valid time step
-                lasttimestamp = str(nc.chartostring(wrfout.variables[wrftimestamp][wrfendidx-1,:])) # needed to determine, if first timestep is the same as last
+                lasttimestamp = wrftimes[wrfendidx-1] # needed to determine, if first timestep is the same as last
                 assert lskip or lasttimestamp == monthlytimestamps[-1]
                 # lasttimestep is also used for leap-year detection later on
                 assert len(wrfout.dimensions[wrftime]) == wrfendidx, (len(wrfout.dimensions[wrftime]),wrfendidx) # wrfendidx should be the length of the file, not the last index!
                 ## find first timestep (compare to last of previous file) and (re-)set time step counter
-                # initialize search
-                tmptimestamp = lasttimestamp; filelen1 = len(wrfout.dimensions[wrftime]) - 1; wrfstartidx = filelen1;
-                while tmptimestamp <= lasttimestamp:
-                  if wrfstartidx < filelen1:
-                    wrfstartidx += 1 # step forward in current file
-                  else:
+                lastdatetime = wrfindex[wrfendidx-1] # search for the first timestep after this one
+                wrfstartidx = len(wrfindex) # end of current file
+                while wrfstartidx == len(wrfindex):
                     # open next file, if we reach the end
                     wrfout.close() # close file
                     #del wrfout; gc.collect() # doesn't seem to work here - strange error
@@ -1016,15 +1566,14 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
                     filecounter += 1 # move to next file
                     if filecounter < len(filelist):
                       logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
-                      wrfout = nc.Dataset(infolder+filelist[filecounter], 'r', format='NETCDF4') # ... and open new one
-                      filelen1 = len(wrfout.dimensions[wrftime]) - 1 # length of new file
-                      wrfstartidx = 0 # reset index
+                      wrfout = openInputFile(filelist[filecounter]) # ... and open new one
+                      wrfchars, wrftimes, wrfindex, wrfmonths, wrfxtimes = readTimeAxis(wrfout) # time axis of new file
+                      wrfstartidx = int(np.searchsorted(wrfindex, lastdatetime, side='right')) # first new timestep
                       # check consistency of missing value flag
                       assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
                     else: break # this is not really tested...
-                  tmptimestamp = str(nc.chartostring(wrfout.variables[wrftimestamp][wrfstartidx,:]))
                 # some checks
-                firsttimestamp = str(nc.chartostring(wrfout.variables[wrftimestamp][0,:]))
+                firsttimestamp = wrftimes[0]
                 error_string = "Inconsistent time-stamps between files:\n lasttimestamp='{:s}', firsttimestamp='{:s}', wrfstartidx={:d}"
                 if firsttimestamp == lasttimestamp: # skip the initialization step (was already processed in last step)
                     if wrfstartidx != 1: raise DateError(error_string.format(lasttimestamp, firsttimestamp, wrfstartidx))
@@ -1043,32 +1592,32 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
                       if not (devar.tmpdata is None or devar.carryover):
                         if devar.tmpdata in tmpdata: del tmpdata[devar.tmpdata]
                 else: tmpdata = dict() # reset entire temporary storage
+                if lsavestate and not lskip: carrystate = copy.deepcopy(tmpdata) # saved, when the month is committed
                 # N.B.: now wrfendidx is a valid timestep, but indicates the first of the next month
-                lasttimestamp = str(nc.chartostring(wrfout.variables[wrftimestamp][wrfendidx,:])) # this should be the first timestep of the next month
+                lasttimestamp = wrftimes[wrfendidx] # this should be the first timestep of the next month
                 assert lskip or lasttimestamp == monthlytimestamps[-1]
                 # open next file (if end of month and file coincide)
                 if wrfendidx == len(wrfout.dimensions[wrftime])-1: # reach end of file
                   ## find first timestep (compare to last of previous file) and (re-)set time step counter
-                  # initialize search
-                  tmptimestamp = lasttimestamp; filelen1 = len(wrfout.dimensions[wrftime]) - 1; wrfstartidx = filelen1;
-                  while tmptimestamp <= lasttimestamp:
-                      if wrfstartidx < filelen1:
-                          wrfstartidx += 1 # step forward in current file
-                      else:
-                          # open next file, if we reach the end
-                          wrfout.close() # close file
-                          #del wrfout; gc.collect() # doesn't seem to work here - strange error
-                          # N.B.: filecounter +1 < len(filelist) is already checked above
-                          filecounter += 1 # move to next file
-                          if filecounter < len(filelist):
-                              logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
-                              wrfout = nc.Dataset(infolder+filelist[filecounter], 'r', format='NETCDF4') # ... and open new one
-                              filelen1 = len(wrfout.dimensions[wrftime]) - 1 # length of new file
-                              wrfstartidx = 0 # reset index
-                              # check consistency of missing value flag
-                              assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
-                          else: break # this is not really tested...
-                      tmptimestamp = str(nc.chartostring(wrfout.variables[wrftimestamp][wrfstartidx,:]))
+                  lastdatetime = wrfindex[wrfendidx] # search for the first timestep after this one
+                  wrfstartidx = len(wrfindex) # end of current file
+                  while wrfstartidx == len(wrfindex):
+                      # open next file, if we reach the end
+                      wrfout.close() # close file
+                      #del wrfout; gc.collect() # doesn't seem to work here - strange error
+                      # N.B.: filecounter +1 < len(filelist) is already checked above
+                      filecounter += 1 # move to next file
+                      if filecounter < len(filelist):
+                          logger.debug("\n{0:s} Opening input file '{1:s}'.\n".format(pidstr,filelist[filecounter]))
+                          wrfout = openInputFile(filelist[filecounter]) # ... and open new one
+                          wrfchars, wrftimes, wrfindex, wrfmonths, wrfxtimes = readTimeAxis(wrfout) # time axis of new file
+                          wrfstartidx = int(np.searchsorted(wrfindex, lastdatetime, side='right')) # first new timestep
+                          # check consistency of missing value flag
+                          assert missing_value is None or missing_value == wrfout.P_LEV_MISSING
+                      else: break # this is not really tested...
+                  # N.B.: the first time step of the next month is only available, if it was duplicated in the next file
+                  if wrfstartidx == 0 and wrftimes[0] > lasttimestamp:
+                      raise DateError("{0:s} First time step of the next month ('{1:s}') is the last time step in file '{2:s}', but missing in the next file.".format(pidstr,lasttimestamp,filelist[filecounter-1]))
                   # N.B.: same code as in "not complete" section
       #             wrfout.close() # close file
       #             #del wrfout; gc.collect() # doesn't seem to work here - strange error
@@ -1090,25 +1639,27 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
           ncvar = None; vardata = None # dummies, to prevent crash later on, if varlist is empty
           # loop over variable names
           for varname in varlist:
-              vardata = data[varname]
               # decide how to normalize
-              if varname in acclist: vardata /= timeperiod
-              else: vardata /= ntime
+              if varname in acclist: vardata = accdata[varname].result(norm=timeperiod)
+              else: vardata = accdata[varname].result(norm=ntime)
+              data[varname] = vardata # monthly average, used to compute linear variables
               # save variable
               ncvar = monthly_dataset.variables[varname] # this time the destination variable
+              if climatology is not None: # the same values as in the file (e.g. integers are truncated)
+                climatology.add(varname, currentmonth, np.ma.asarray(vardata).astype(ncvar.dtype), record=meanidx)
               if missing_value is not None: # make sure the missing value flag is preserved
                 vardata = np.where(np.isnan(vardata), missing_value, vardata)
                 ncvar.missing_value = missing_value # just to make sure
-              if ncvar.ndim > 1: ncvar[meanidx,:] = vardata # here time is always the outermost index
-              else: ncvar[meanidx] = vardata
+              writeVar(ncvar, meanidx, vardata)
           # compute derived variables
           #logger.debug('\n{0:s}   Derived Variable Stats: (mean/min/max)'.format(pidstr))
           for dename,devar in derived_vars.items():
               if devar.linear:
-                vardata = devar.computeValues(data) # compute derived variable now from averages
+                with profiler.timer('derived', devar.__class__.__name__):
+                  vardata = devar.computeValues(data) # compute derived variable now from averages
               elif devar.normalize:
-                vardata = dedata[dename] / ntime # no accumulated variables here!
-              else: vardata = dedata[dename] # just the data...
+                vardata = dedata[dename].result(norm=ntime) # no accumulated variables here!
+              else: vardata = dedata[dename].result() # just the data...
               # not all variables are normalized (e.g. extrema)
               #if ldebug:
               #  mmm = (float(np.nanmean(vardata)),float(np.nanmin(vardata)),float(np.nanmax(vardata)),)
@@ -1116,24 +1667,25 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
               data[dename] = vardata # add to data array, so that it can be used to compute linear variables
               # save variable
               ncvar = monthly_dataset.variables[dename] # this time the destination variable
+              if climatology is not None: # the same values as in the file (e.g. integers are truncated)
+                climatology.add(dename, currentmonth, np.ma.asarray(vardata).astype(ncvar.dtype), record=meanidx)
               if missing_value is not None: # make sure the missing value flag is preserved
                 vardata = np.where(np.isnan(vardata), missing_value, vardata)
                 ncvar.missing_value = missing_value # just to make sure
-              if ncvar.ndim > 1: ncvar[meanidx,:] = vardata # here time is always the outermost index
-              else: ncvar[meanidx] = vardata
+              writeVar(ncvar, meanidx, vardata)
               #raise dv.DerivedVariableError, "%s Derived variable '%s' is not linear."%(pidstr,devar.name)
           # update current end date
           monthly_dataset.end_date = str(nc.chartostring(firsttimestamp_chars[:10])) # the date of the first day of the last included month
           monthly_dataset.variables[wrftimestamp][meanidx,:] = firsttimestamp_chars
           monthly_dataset.variables[time][meanidx] = meantime # update time axis (last action)
-          # sync data and clear memory
-          monthly_dataset.sync(); monthly_dataset.close() # sync and close dataset
-          del monthly_dataset, ncvar, vardata # remove all other references to data
-          gc.collect() # clean up memory
-          # N.B.: the netCDF4 module keeps all data written to a netcdf file in memory; there is no flush command
-          monthly_dataset = nc.Dataset(tmp_monthly_filepath, mode='a', format='NETCDF4') # re-open to append more data (mode='a')
-          # N.B.: flushing the mean file here prevents repeated close/re-open when no data was written (i.e.
-          #       the month was skiped); only flush memory when data was actually written.
+          # sync data (memory is bounded by the chunk cache; re-opening is optional)
+          ncvar = None; vardata = None # remove all other references to data
+          with profiler.timer('write', 'flush'): monthly_dataset = monthly_writer.flush() # handle changes, if the dataset is re-opened
+          # N.B.: flushing the mean file here prevents repeated syncs when no data was written (i.e.
+          #       the month was skiped); only flush when data was actually written.
+          # commit month: save carry-over state first, then update the journal
+          if lsavestate: saveState(monthly_filepath, meanidx+1, carrystate)
+          if ljournal: saveJournal(monthly_filepath, meanidx+1, end_date=monthly_dataset.end_date)
 
     ec = 0 # set zero exit code for this operation
 
@@ -1143,7 +1695,7 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       logger.exception('\n # {0:s} WARNING: an Error occured while stepping through files! '.format(pidstr)+
                        '\n # Last State: month={0:d}, variable={1:s}, file={2:s}'.format(meanidx,varname,filelist[filecounter])+
                        '\n # Saving current data and exiting\n')
-      wrfout.close()
+      if wrfout is not None: wrfout.close()
       #logger.exception(pidstr) # print stack trace of last exception and current process ID
       ec = 1 # set non-zero exit code
       # N.B.: this enables us to still close the file!
@@ -1161,18 +1713,143 @@ def processFileList(filelist, filetype, ndom, lparallel=False, pidstr='', logger
       logger.info("\n{0:s} Writing (sub-)daily output to: {1:s}\n('{2:s}')\n".format(pidstr, daily_file, daily_filepath))
 
   # Finalize: close files and rename to proper names, clean up
-  monthly_dataset.close() # close NetCDF file
-  os.rename(tmp_monthly_filepath,monthly_filepath) # rename file to proper name
-  del monthly_dataset, data # clean up memory
+  if varpool is not None: varpool.shutdown()
+  if climatology is not None and ec == 0:
+    try: writeClimatology(climatology, monthly_dataset, filetype, ndom)
+    except Exception:
+      logger.exception('\n # {0:s} WARNING: an Error occured while writing climatologies for {1:s}!\n'.format(pidstr,monthly_file))
+      ec = 1 # the monthly file is still completed
+    else: logger.info("\n{0:s} Writing climatologies to: {1:s}\n".format(pidstr, ', '.join(pattern.format(filetype,ndom)
+                                                                                        for pattern in climpatterns.values())))
+  monthly_writer.close() # close NetCDF file
+  if not ljournal: os.rename(tmp_monthly_filepath,monthly_filepath) # rename file to proper name
+  if ec == 0: removeJournal(monthly_filepath) # the file is consistent; otherwise the next job resumes
+  logger.debug("\n{0:s} Intermediate cache: {1:d} hits, {2:d} misses.".format(pidstr,intercache.hits,intercache.misses))
+  # save carry-over state of consecutive extrema, so that chunks can be stitched together
+  if chunk is not None and ec == 0:
+    state = dict()
+    for dename,devar in derived_vars.items():
+      if isinstance(devar,dv.ConsecutiveExtrema) and devar.tmpdata in tmpdata:
+        lead, leadmonth = tmpdata[devar.tmpdata+'_LEAD']
+        state[dename+'_XCNT'] = tmpdata[devar.tmpdata]; state[dename+'_PERIOD'] = devar.period
+        state[dename+'_LEAD'] = lead; state[dename+'_LEADMONTH'] = leadmonth
+      elif isinstance(devar,(dv.MeanExtrema,dv.ClimateIndex)) and devar.tmpdata in tmpdata:
+        state[dename+'_REST'] = tmpdata[devar.tmpdata][1] # number of unused time steps (in partial sum)
+        if isinstance(devar,dv.ClimateIndex) and devar.window > 1: state[dename+'_REST'] += devar.window - 1 # running sums
+    np.savez(outfolder+statepattern.format(filetype,ndom,chunk), **state)
+  del monthly_dataset, monthly_writer, data, accdata, dedata # clean up memory
   if ldaily:
-      daily_dataset.close() # close NetCDF file
-      os.rename(tmp_daily_filepath,daily_filepath) # rename file to proper name
-      del daily_dataset # clean up memory
+      daily_writer.close() # close NetCDF file
+      if not ldailyinplace: os.rename(tmp_daily_filepath,daily_filepath) # rename file to proper name
+      del daily_dataset, daily_writer # clean up memory
+  if lprofile: # save timers next to the monthly output file
+    profile_filepath = outfolder + monthly_file.replace('.nc','_profile.json')
+    report = profiler.save(profile_filepath, filetype=filetype, domain=ndom, chunk=chunk, exit_code=ec,
+                           files=len(filelist), threads=NVT, exprthreads=NET)
+    if not report['peak_rss_mb']: rssstr = 'n/a'
+    else: # N.B.: the peak RSS is cumulative over all tasks of a worker process
+      rssstr = '{:.1f} MB{:s}'.format(report['peak_rss_mb'], '' if report['peak_in_task'] in (True,None) else ' (earlier task)')
+      if report['start_rss_mb']: rssstr += ', {:.1f} MB at start'.format(report['start_rss_mb'])
+    logger.info("\n{0:s} Profile ({1:.1f} s, {2:.1f} MB read, peak RSS {3:s}) saved to: {4:s}\n".format(pidstr,
+                report['wall_seconds'], report['bytes_read']/1024.**2, rssstr, profile_filepath))
   gc.collect()
   # return exit code
   return ec
 
 
+## climatology of monthly means
+def writeClimatology(climatology, monthly_dataset, filetype, ndom):
+  ''' complete the running statistics with months that were not computed (e.g. skipped or committed months or
+      variables that were not recomputed) from the monthly file and write climatology, seasonal and annual files '''
+  timeaxis = monthly_dataset.variables[time][:]
+  records = [idx for idx in range(len(timeaxis)) if timeaxis[idx] != -1] # only completed months
+  beginmonth64 = np.datetime64(monthly_dataset.begin_date[:7], 'M')
+  months = {idx:int((beginmonth64 + idx).astype(int)) % 12 + 1 for idx in records} # calendar month of a record
+  climvars = [varname for varname,var in monthly_dataset.variables.items()
+              if var.dimensions[:1] == (time,) and varname not in (time, wrftimestamp, wrfxtime) and var.dtype.kind in 'fiu']
+  for varname in climvars:
+    missing = [idx for idx in records if idx not in climatology.records.get(varname,())]
+    if len(missing) > 0:
+      data = monthly_dataset.variables[varname][missing] # one read per variable
+      for idx,vardata in zip(missing,data): climatology.add(varname, months[idx], vardata, record=idx)
+  for period,pattern in climpatterns.items():
+    description = 'wrf{0:s}_d{1:02d} {2:s} (from monthly means {3:s} to {4:s})'.format(filetype, ndom,
+                      dict(clim='monthly climatology', seasonal='seasonal means', annual='annual means')[period],
+                      monthly_dataset.begin_date, monthly_dataset.end_date)
+    climatology.writeFile(outfolder+pattern.format(filetype,ndom), period, monthly_dataset, varlist=climvars,
+                          description=description)
+
+
+## merge function for time chunks
+def getChunkState(filetype):
+  ''' return the variables of a filetype with state that can not be stitched at chunk boundaries: averages over
+      several days in weekly extrema and running sums of climate indices can span a chunk boundary, and the
+      growing season is advanced day by day (filetypes with such variables are not chunked) '''
+  return ['Max{:s}_5d'.format(name) for name in weekmax_variables[filetype]] + \
+         ['Min{:s}_5d'.format(name) for name in weekmin_variables[filetype]] + \
+         [idxname for idxname,idxvar in index_variables[filetype]
+          if idxname == 'GSL' or dv.climate_indices[idxname].get('window',1) > 1]
+
+def mergeChunks(filetype, ndom, nchunks):
+  ''' Concatenate monthly chunk files along the time axis and stitch consecutive extrema at the chunk
+      boundaries, so that the result is identical to a serial run; returns an exit code like processFileList.
+      N.B.: if any other variable has unused time steps at the end of a chunk, merging fails (cf. getChunkState). '''
+  monthly_file = monthlypattern.format(filetype,ndom)
+  monthly_filepath = outfolder + monthly_file
+  tmp_monthly_filepath = outfolder + 'tmp_wrfavg_' + monthly_file
+  chunkfiles = [outfolder+chunkpattern.format(filetype,ndom,k) for k in range(nchunks)]
+  statefiles = [outfolder+statepattern.format(filetype,ndom,k) for k in range(nchunks)]
+  try:
+    # the first chunk is the basis of the merged file
+    shutil.copy(chunkfiles[0],tmp_monthly_filepath)
+    monthly_dataset = nc.Dataset(tmp_monthly_filepath, mode='a', format='NETCDF4')
+    monthly_dataset.set_auto_mask(False) # copy raw values, including missing values
+    state = np.load(statefiles[0])
+    # counters of consecutive extrema at the end of the previous chunk
+    carry = {key[:-5]:state[key] for key in state.files if key.endswith('_XCNT')}
+    for k in range(1,nchunks):
+      rest = [key[:-5] for key in state.files if key.endswith('_REST') and state[key] > 0]
+      if len(rest) > 0: # partial intervals would be lost (cf. getChunkState)
+        raise ValueError("Interval state of {:s} at the end of chunk {:d} can not be stitched.".format(', '.join(rest),k-1))
+      chunk_dataset = nc.Dataset(chunkfiles[k], mode='r', format='NETCDF4')
+      chunk_dataset.set_auto_mask(False)
+      state = np.load(statefiles[k])
+      # check that chunks are contiguous
+      if np.datetime64(chunk_dataset.begin_date[:7]) != np.datetime64(monthly_dataset.end_date[:7]) + 1:
+        raise DateError("Chunk {:d} does not continue after previous chunk: {:s} -> {:s}".format(k,monthly_dataset.end_date,chunk_dataset.begin_date))
+      n0 = len(monthly_dataset.dimensions[time]); nt = len(chunk_dataset.dimensions[time])
+      for varname,var in chunk_dataset.variables.items():
+        if len(var.dimensions) == 0 or var.dimensions[0] != time: continue # only time-dependent variables
+        data = var[:]
+        if varname == time: data += n0 # continue counting months
+        if varname in carry:
+          # the leading period of exceedance continues the period carried over from the previous chunk
+          xcnt = carry[varname]; period = float(state[varname+'_PERIOD'])
+          lead = state[varname+'_LEAD']; leadmonth = state[varname+'_LEADMONTH']
+          for month in np.unique(leadmonth[leadmonth >= 0]):
+            mask = leadmonth == month # points where the leading period ended in this month
+            data[month][mask] = np.maximum(data[month][mask], (xcnt[mask] + lead[mask]) * period)
+            # N.B.: assignment to the integer array truncates, like in the serial computation
+          carry[varname] = np.where(leadmonth < 0, xcnt + state[varname+'_XCNT'], state[varname+'_XCNT'])
+        monthly_dataset.variables[varname][n0:n0+nt] = data
+      monthly_dataset.end_date = chunk_dataset.end_date
+      chunk_dataset.close(); monthly_dataset.sync()
+    if lclimatology: # computed from the merged file
+      monthly_dataset.set_auto_mask(True)
+      writeClimatology(Climatology(), monthly_dataset, filetype, ndom)
+    monthly_dataset.close()
+    os.rename(tmp_monthly_filepath,monthly_filepath) # rename file to proper name
+    # clean up chunk files
+    for chunkfile,statefile in zip(chunkfiles,statefiles):
+      os.remove(chunkfile); os.remove(statefile)
+    print(("Merged {:d} chunks into monthly output file '{:s}'.".format(nchunks,monthly_file)))
+    ec = 0
+  except Exception as err:
+    print(("Merging chunks for '{:s}' failed ({:s}); chunk files were not removed.".format(monthly_file,str(err))))
+    ec = 1
+  return ec
+
+
 ## now begin execution
 if __name__ == '__main__':
 
@@ -1181,10 +1858,16 @@ if __name__ == '__main__':
   print('')
   print(('OVERWRITE: {:s}, RECOVER: {:s}, CARRYOVER: {:s}, SMPLDIFF: {:s}'.format(
         str(loverwrite), str(lrecover), str(lcarryover), str(lsmplDiff))))
-  print(('DERIVEDONLY: {:s}, ADDNEW: {:s}, RECALC: {:s}'.format(
-        str(lderivedonly), str(laddnew), str(recalcvars) if lrecalc else str(lrecalc))))
-  print(('DAILY: {:s}, FILETYPES: {:s}, DOMAINS: {:s}'.format(str(lglobaldaily),str(filetypes),str(domains))))
-  print(('THREADS: {:s}, DEBUG: {:s}'.format(str(NP),str(ldebug))))
+  print(('DERIVEDONLY: {:s}, ADDNEW: {:s}, RECALC: {:s}, CLIMATOLOGY: {:s}'.format(
+        str(lderivedonly), str(laddnew), str(recalcvars) if lrecalc else str(lrecalc), str(lclimatology))))
+  print(('DAILY: {:s}, DAILYFREQ: {:s}, FILETYPES: {:s}, DOMAINS: {:s}'.format(str(lglobaldaily),
+        '{:d} s'.format(dailyinterval) if dailyinterval else 'native',str(filetypes),str(domains))))
+  print(('THREADS: {:s}, VARTHREADS: {:s}, EXPRTHREADS: {:d}, CHUNKS: {:s}, DEBUG: {:s}'.format(str(NP),str(NVT),NET,str(nchunkyears),str(ldebug))))
+  print(('CHUNKCACHE: {:3.1f} MB, REOPEN: {:s}, INCREMENTAL: {:s}, OUTPUTSTRATEGY: {:s}, BASELINE: {:s}'.format(
+        chunkcache/1024.**2,str(lreopen),str(lincremental),' '.join(outputstrategies),baselinepattern)))
+  print(('MEMORY: {:s}, OUTPUTS: {:s}, PROFILE: {:s}, CALENDAR: {:s}'.format('{:3.1f} MB'.format(memorybudget/1024.**2) if memorybudget else 'unlimited',
+                                                            str(outputvars) if outputvars else 'all', str(lprofile), calendar or 'standard')))
+  print(('INDICES: {:s}, MOMENTS: {:s}'.format(str(lindices), str(lmoments))))
   print('')
   # compile regular expression, used to infer start and end dates and month (later, during computation)
   datestr = '{0:s}-{1:s}-{2:s}'.format(yearstr,monthstr,daystr)
@@ -1218,8 +1901,59 @@ if __name__ == '__main__':
         print(("Can not process filetype '{:s}' (domain {:d}): no source files.".format(filetype,domain)))
   print('\n')
 
+  # load file catalog and add new or modified files (only these files have to be opened)
+  if lcatalog:
+    # N.B.: the catalog is stored in the output folder, since the input folder may be read-only or shared
+    catalog = fc.loadCatalog(outfolder); catalogfiles = set(catalog.keys())
+    nnew = fc.updateCatalog(catalog, infolder, [filename for arg in args for filename in arg[0]],
+                            timestamp_var=wrftimestamp, xtime_var=wrfxtime, time_dim=wrftime)
+    # N.B.: the catalog also changes, if entries for deleted files were removed
+    if ( nnew > 0 or set(catalog.keys()) != catalogfiles ) and not fc.saveCatalog(catalog, outfolder):
+      print(("Could not save file catalog in folder '{:s}' (continuing without cache).".format(outfolder)))
+    print(("File catalog: {:d} files, {:d} new or modified.\n".format(len(catalog),nnew)))
+  else: catalog = None
+
+  # split long jobs into chunks of years, which are merged after processing (only for new monthly output)
+  chunkjobs = [] # jobs that have to be merged: (filetype, domain, number of chunks)
+  if nchunkyears > 0 and not lglobaldaily:
+    chunkargs = []
+    for filelist, filetype, domain in args:
+      monthly_filepath = outfolder + monthlypattern.format(filetype,domain)
+      if os.path.exists(monthly_filepath) and not loverwrite and os.path.getsize(monthly_filepath) >= 1e6:
+        chunkargs.append( (filelist, filetype, domain) ); continue # existing files are updated as usual
+      if len(getChunkState(filetype)) > 0:
+        print(("Not splitting filetype '{:s}' (domain {:d}) into chunks: state of {:s} can not be stitched.".format(
+               filetype,domain,', '.join(getChunkState(filetype)))))
+        chunkargs.append( (filelist, filetype, domain) ); continue # serial processing
+      # first timestamp of each file (from the catalog or from the file name)
+      if catalog is not None: filedates = [catalog[filename]['begin'] for filename in filelist]
+      else: filedates = ['{0:s}_{1:s}:{2:s}:{3:s}'.format(*filedatergx.search(filename).groups()) for filename in filelist]
+      # chunks begin with a file that starts at the beginning of a year
+      firstyear = int(filedates[0][:4])
+      bounds = [i for i,filedate in enumerate(filedates) if i > 0 and filedate[4:] == '-01-01_00:00:00'
+                                                             and (int(filedate[:4])-firstyear)%nchunkyears == 0]
+      if len(bounds) == 0:
+        chunkargs.append( (filelist, filetype, domain) ); continue # not long enough
+      starts = [0] + bounds
+      for k,i0 in enumerate(starts):
+        if k < len(bounds):
+          # N.B.: the first file of the next chunk is needed to complete the last month
+          chunklist = filelist[i0:bounds[k]+1]; chunkend = '{:04d}-12'.format(int(filedates[bounds[k]][:4])-1)
+        else: chunklist = filelist[i0:]; chunkend = None
+        chunkargs.append( (chunklist, filetype, domain, k, chunkend) )
+        statefile = outfolder + statepattern.format(filetype,domain,k)
+        if os.path.exists(statefile): os.remove(statefile) # remove state from previous runs
+      chunkjobs.append( (filetype, domain, len(starts)) )
+      print(("Splitting filetype '{:s}' (domain {:d}) into {:d} chunks.".format(filetype,domain,len(starts))))
+    args = chunkargs
+
   # call parallel execution function
-  kwargs = dict() # no keyword arguments
+  kwargs = dict(catalog=catalog) # file catalog (or None)
   ec = asyncPoolEC(processFileList, args, kwargs, NP=NP, ldebug=ldebug, ltrialnerror=True)
+  # merge chunks, if all chunks were processed successfully
+  for filetype, domain, nchunks in chunkjobs:
+    if all([os.path.exists(outfolder + statepattern.format(filetype,domain,k)) for k in range(nchunks)]):
+      ec += mergeChunks(filetype, domain, nchunks)
+    else: print(("Can not merge chunks for filetype '{:s}' (domain {:d}): not all chunks completed.".format(filetype,domain)))
   # exit with number of failures plus 10 as exit code
   exit(int(10+ec) if ec > 0 else 0)